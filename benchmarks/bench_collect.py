@@ -0,0 +1,224 @@
+"""
+Benchmark collection and rendering against a local GitHub stand-in.
+
+For each size, a synthetic repository is served by the fake GitHub server in
+``tests/fake_github.py`` (in a separate process, so that it does not count
+towards the measured memory), collected with ``collect_repositories`` and
+rendered with ``generate_latex``. Reported are the number of requests per
+endpoint, the wall time and the peak memory allocated by Python.
+
+    python benchmarks/bench_collect.py --sizes 10 100 1000 --latency 0.02
+
+The collection runs once with an empty cache (``cold``) and once more with
+expired responses that are revalidated with conditional requests (``warm``).
+"""
+import argparse
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import multiprocessing
+from pathlib import Path
+import sys
+from tempfile import TemporaryDirectory
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from rich import print
+from rich.table import Table
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "tests"))
+
+from fake_github import FakeGitHub, FakeRepo  # noqa: E402
+
+import mtng.cache  # noqa: E402
+from mtng.cache import ConditionalCache  # noqa: E402
+from mtng.collect import collect_repositories  # noqa: E402
+from mtng.generate import generate_latex  # noqa: E402
+from mtng.github import DEFAULT_CONCURRENCY, GitHubClient  # noqa: E402
+from mtng.spec import Repository, Spec  # noqa: E402
+
+SINCE = datetime(2022, 8, 1, tzinfo=timezone.utc)
+NOW = datetime(2022, 8, 15, tzinfo=timezone.utc)
+
+
+@dataclass
+class Result:
+    size: int
+    phase: str
+    wall_time: float
+    peak_memory: Optional[int]
+    requests: Dict[str, int]
+
+
+def serve(repos: List[FakeRepo], latency: float, conn) -> None:
+    async def main():
+        server = FakeGitHub(repos, latency=latency)
+        await server.start()
+        conn.send(server.url)
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+class Server:
+    """Runs the fake GitHub server in a child process."""
+
+    def __init__(self, repos: List[FakeRepo], latency: float) -> None:
+        parent, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=serve, args=(repos, latency, child), daemon=True
+        )
+        self.process.start()
+        self.url = parent.recv()
+
+    async def stats(self, session: aiohttp.ClientSession) -> Dict[str, int]:
+        async with session.get(f"{self.url}/_stats") as response:
+            return await response.json()
+
+    def stop(self) -> None:
+        self.process.terminate()
+        self.process.join()
+
+
+def spec_for(repo: FakeRepo) -> Spec:
+    return Spec(
+        repos=[
+            Repository(
+                name=repo.name,
+                stale_label=repo.stale_label,
+                wip_label=repo.wip_label,
+                do_recent_issues=True,
+                do_reviewers=True,
+            )
+        ]
+    )
+
+
+async def collect(spec: Spec, server: Server, concurrency: int) -> Any:
+    async with aiohttp.ClientSession() as session:
+        gh = GitHubClient(
+            session,
+            "mtng-benchmark",
+            base_url=server.url,
+            concurrency=concurrency,
+            cache=ConditionalCache(),
+        )
+        return await collect_repositories(spec.repos, since=SINCE, now=NOW, gh=gh)
+
+
+async def request_counts(server: Server) -> Dict[str, int]:
+    async with aiohttp.ClientSession() as session:
+        return await server.stats(session)
+
+
+def measure(fn, memory: bool = True):
+    """
+    Call ``fn``, returns its result, the wall time and the peak memory.
+    Tracing allocations slows down execution considerably, so the memory is
+    only measured if ``memory`` is set.
+    """
+    if not memory:
+        start = time.perf_counter()
+        result = fn()
+        return result, time.perf_counter() - start, None
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = fn()
+        wall_time = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, wall_time, peak
+
+
+def run(
+    size: int, latency: float, concurrency: int, memory: bool = True
+) -> List[Result]:
+    repo = FakeRepo(name="bench/repo", size=size)
+    spec = spec_for(repo)
+    server = Server([repo], latency)
+    results = []
+    try:
+        with TemporaryDirectory() as d:
+            mtng.cache.configure(directory=Path(d))
+
+            before: Dict[str, int] = {}
+            for phase in "cold", "warm":
+                if phase == "warm":
+                    # only the validators of conditional requests survive
+                    for key in list(mtng.cache.get_cache().iterkeys()):
+                        if not key.startswith(ConditionalCache.prefix):
+                            del mtng.cache.get_cache()[key]
+
+                data, wall_time, peak = measure(
+                    lambda: asyncio.run(collect(spec, server, concurrency)), memory
+                )
+                after = asyncio.run(request_counts(server))
+                requests = {k: v - before.get(k, 0) for k, v in after.items()}
+                before = after
+                results.append(
+                    Result(size, f"collect ({phase})", wall_time, peak, requests)
+                )
+
+            _, wall_time, peak = measure(
+                lambda: generate_latex(
+                    spec, data, since=SINCE, now=NOW, contributions=[], full_tex=True
+                ),
+                memory,
+            )
+            results.append(Result(size, "render", wall_time, peak, {}))
+
+            mtng.cache.get_cache().close()
+    finally:
+        server.stop()
+    return results
+
+
+def report(results: List[Result]) -> Table:
+    endpoints = sorted({k for r in results for k in r.requests})
+    table = Table(title="mtng benchmark")
+    table.add_column("Items", justify="right")
+    table.add_column("Phase")
+    table.add_column("Wall time", justify="right")
+    table.add_column("Peak memory", justify="right")
+    for endpoint in endpoints:
+        table.add_column(endpoint, justify="right")
+    for r in results:
+        table.add_row(
+            str(r.size),
+            r.phase,
+            f"{r.wall_time:.3f}s",
+            f"{r.peak_memory / 2**20:.1f} MiB" if r.peak_memory is not None else "",
+            *(str(r.requests.get(e, "")) for e in endpoints),
+        )
+    return table
+
+
+def main(argv=None) -> List[Result]:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument(
+        "--latency", type=float, default=0.01, help="Latency per request in seconds"
+    )
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument(
+        "--no-memory",
+        dest="memory",
+        action="store_false",
+        help="Do not trace memory allocations, which slows down the run",
+    )
+    args = parser.parse_args(argv)
+
+    results = []
+    for size in args.sizes:
+        results += run(size, args.latency, args.concurrency, args.memory)
+    print(report(results))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Microbenchmark of the LaTeX sanitizer against the previous regex based
+implementation, on short strings (titles, logins) and large bodies.
+
+    python benchmarks/bench_sanitize.py --body-size 4
+"""
+import argparse
+import random
+import re
+import timeit
+
+from rich import print
+from rich.table import Table
+
+from mtng.generate import sanitize
+
+_REPLACEMENTS = {
+    "_": "\\_",
+    "%": "\\%",
+    "#": "\\#",
+    "$": "\\$",
+    "&": "\\&",
+    "<": "\\textless{}",
+    ">": "\\textgreater{}",
+    "\\": "\\textbackslash{}",
+    "{": "\\{",
+    "}": "\\}",
+    "^": "\\textasciicircum{}",
+}
+
+
+def regex_sanitize(s: str) -> str:
+    def repl(m):
+        return dict(_REPLACEMENTS)[m.group(0)]
+
+    return re.sub(r"[\\^_{}&$%#<>%]", repl, s)
+
+
+def make_text(size: int, rng: random.Random) -> str:
+    words = ["fix", "the", "track_state", "50%", "C++", "{x}", "a&b", "#123", "\n"]
+    out = []
+    length = 0
+    while length < size:
+        word = rng.choice(words)
+        out.append(word)
+        length += len(word) + 1
+    return " ".join(out)[:size]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--body-size", type=float, default=4, help="Size of the body in MiB"
+    )
+    args = parser.parse_args(argv)
+
+    rng = random.Random(1)
+    logins = [f"user_{i % 50}" for i in range(5000)]
+    body = make_text(int(args.body_size * 2**20), rng)
+
+    assert sanitize(body) == regex_sanitize(body)
+
+    table = Table(title="sanitize")
+    table.add_column("Input")
+    table.add_column("regex", justify="right")
+    table.add_column("sanitize", justify="right")
+    table.add_column("Speedup", justify="right")
+
+    for name, fn in [
+        ("5000 logins", lambda f: [f(login) for login in logins]),
+        (f"{args.body_size:g} MiB body", lambda f: f(body)),
+    ]:
+        before = min(timeit.repeat(lambda: fn(regex_sanitize), number=1, repeat=3))
+        after = min(timeit.repeat(lambda: fn(sanitize), number=1, repeat=3))
+        table.add_row(
+            name,
+            f"{before * 1e3:.2f}ms",
+            f"{after * 1e3:.2f}ms",
+            f"{before / after:.1f}x",
+        )
+    print(table)
+
+
+if __name__ == "__main__":
+    main()
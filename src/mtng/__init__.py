@@ -1,6 +1,10 @@
-from importlib.metadata import version, PackageNotFoundError
+def __getattr__(name):
+    # importlib.metadata is slow to import, only load it when asked for the version
+    if name == "__version__":
+        from importlib.metadata import version, PackageNotFoundError
 
-try:
-    __version__ = version(__name__)
-except PackageNotFoundError:
-    __version__ = "0.0.0"  # Fallback for development
+        try:
+            return version(__name__)
+        except PackageNotFoundError:
+            return "0.0.0"  # Fallback for development
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,231 @@
+"""
+Generate the reports of several configurations and windows, collecting every
+repository once per set of settings that changes what is collected.
+"""
+import asyncio
+from collections.abc import MutableMapping
+from concurrent.futures import ProcessPoolExecutor
+import dataclasses
+from datetime import datetime
+import re
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import aiohttp
+from gidgethub.abc import GitHubAPI
+from rich.progress import Progress
+
+from mtng.collect import collect_repository, print_summary
+from mtng.generate import generate_latex
+from mtng.indico import get_agenda
+from mtng.spec import Backend, Repository, Spec
+
+# Section of the collected data, and whether a repository asks for it
+SECTIONS = {
+    "merged_prs": lambda repo: repo.do_merged_prs,
+    "open_prs": lambda repo: repo.do_open_prs,
+    "stale": lambda repo: repo.do_stale,
+    "recent_issues": lambda repo: repo.do_recent_issues,
+    "needs_discussion": lambda repo: repo.needs_discussion_label is not None,
+}
+
+_WINDOW = re.compile(r"^(\d{4}-\d{2}-\d{2})(?:\.\.(\d{4}-\d{2}-\d{2}))?$")
+
+
+@dataclasses.dataclass(frozen=True)
+class Window:
+    since: datetime
+    now: datetime
+
+
+def parse_window(text: str, now: datetime) -> Window:
+    """
+    Parse a window ``START`` (up to ``now``) or ``START..END``, given as
+    ``YYYY-MM-DD`` dates. The dates get the time zone of ``now``.
+    """
+    m = _WINDOW.match(text)
+    if m is None:
+        raise ValueError(f"Not a window (YYYY-MM-DD or YYYY-MM-DD..YYYY-MM-DD): {text}")
+    start, end = m.groups()
+    since = datetime.fromisoformat(start).replace(tzinfo=now.tzinfo)
+    if end is not None:
+        now = datetime.fromisoformat(end).replace(tzinfo=now.tzinfo)
+    return Window(since, now)
+
+
+def collection_key(repo: Repository, backend: Backend) -> Hashable:
+    """
+    The settings of ``repo`` that change the collected items. Settings that
+    only affect how items are shown, e.g. ``do_reviewers``, and the choice of
+    sections are not part of it.
+    """
+    return (
+        repo.name,
+        backend,
+        tuple(sorted(repo.filter_labels)),
+        repo.wip_label,
+        repo.show_wip,
+        repo.stale_label,
+        repo.needs_discussion_label,
+    )
+
+
+def merge_repositories(repos: Sequence[Repository]) -> Repository:
+    """A repository that asks for every section any of ``repos`` asks for."""
+    return repos[0].copy(
+        update={
+            "do_merged_prs": any(r.do_merged_prs for r in repos),
+            "do_open_prs": any(r.do_open_prs for r in repos),
+            "do_recent_issues": any(r.do_recent_issues for r in repos),
+        }
+    )
+
+
+@dataclasses.dataclass
+class Plan:
+    """The deduplicated collection work of a batch."""
+
+    # repository to collect, per collection key
+    repos: Dict[Hashable, Repository]
+    # collection key per configuration and repository
+    keys: List[List[Hashable]]
+
+    @classmethod
+    def build(cls, specs: Sequence[Spec]) -> "Plan":
+        groups: Dict[Hashable, List[Repository]] = {}
+        keys = []
+        for spec in specs:
+            spec_keys = []
+            for repo in spec.repos:
+                key = collection_key(repo, spec.backend)
+                groups.setdefault(key, []).append(repo)
+                spec_keys.append(key)
+            keys.append(spec_keys)
+        repos = {key: merge_repositories(group) for key, group in groups.items()}
+        return cls(repos, keys)
+
+
+def report_data(
+    spec: Spec, keys: Sequence[Hashable], collected: Dict[Hashable, Dict[str, Any]]
+) -> Dict[str, Any]:
+    """
+    The data of one report, taken from the shared ``collected`` data. Items
+    are not copied, so reports share them.
+    """
+    data = {}
+    for repo, key in zip(spec.repos, keys):
+        shared = collected[key]
+        data[repo.name] = {
+            section: shared[section] if wanted(repo) else []
+            for section, wanted in SECTIONS.items()
+        }
+        data[repo.name]["spec"] = repo
+    return data
+
+
+async def collect_batch(
+    specs: Sequence[Spec],
+    windows: Sequence[Window],
+    gh: GitHubAPI,
+    session: Optional[aiohttp.ClientSession] = None,
+    events: Sequence[str] = (),
+    cache: Optional[MutableMapping] = None,
+    incremental: bool = False,
+) -> Tuple[Dict[Window, List[Dict[str, Any]]], List[Dict[str, Any]]]:
+    """
+    Collect every configuration for every window, sharing the work of the same
+    repository, and the agenda of ``events``. Returns both.
+    """
+    plan = Plan.build(specs)
+
+    async def collect_windows():
+        snapshots = {}
+        if incremental:
+            from mtng.snapshot import RepoSnapshot
+
+            for name, backend, *_ in plan.repos:
+                if backend == Backend.rest and name not in snapshots:
+                    snapshots[name] = RepoSnapshot.load(name)
+
+        searches: Dict[Hashable, Dict] = {key: {} for key in plan.repos}
+        merged_days: Dict[Hashable, Dict] = {key: {} for key in plan.repos}
+        jobs = [(window, key) for window in windows for key in plan.repos]
+        with Progress(transient=True) as progress:
+            results = await asyncio.gather(
+                *(
+                    collect_repository(
+                        plan.repos[key],
+                        since=window.since,
+                        now=window.now,
+                        gh=gh,
+                        progress=progress,
+                        backend=key[1],
+                        incremental=incremental,
+                        searches=searches[key],
+                        merged_days=merged_days[key],
+                        snapshot=snapshots.get(key[0]),
+                    )
+                    for window, key in jobs
+                )
+            )
+
+        for snapshot in snapshots.values():
+            snapshot.save()
+
+        collected: Dict[Window, Dict[Hashable, Dict[str, Any]]] = {}
+        for (window, key), data in zip(jobs, results):
+            collected.setdefault(window, {})[key] = data
+            print_summary(
+                f"Collected data for {key[0]}, "
+                f"{window.since:%Y-%m-%d}..{window.now:%Y-%m-%d}",
+                data,
+            )
+
+        return {
+            window: [
+                report_data(spec, keys, collected[window])
+                for spec, keys in zip(specs, plan.keys)
+            ]
+            for window in windows
+        }
+
+    data, contributions = await asyncio.gather(
+        collect_windows(), get_agenda(session, events, cache=cache)
+    )
+    return data, contributions
+
+
+def report_name(config: str, window: Window) -> str:
+    """File name (without suffix) of the report of ``config`` for ``window``."""
+    return f"{config}_{window.since:%Y-%m-%d}_{window.now:%Y-%m-%d}"
+
+
+def _render(args) -> str:
+    spec, data, window, contributions, full_tex = args
+    return generate_latex(
+        spec,
+        data,
+        since=window.since,
+        now=window.now,
+        contributions=contributions,
+        full_tex=full_tex,
+    )
+
+
+def render_reports(
+    reports: Sequence[Tuple[Spec, Dict[str, Any], Window]],
+    contributions: List[Dict[str, Any]],
+    full_tex: bool,
+    jobs: Optional[int] = 1,
+) -> List[str]:
+    """
+    Render ``reports``, given as configuration, data and window, to LaTeX.
+    With more than one job, the reports are rendered in a pool of ``jobs``
+    processes (``None`` for one per CPU).
+    """
+    tasks = [
+        (spec, data, window, contributions, full_tex) for spec, data, window in reports
+    ]
+    if jobs == 1:
+        return [_render(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(_render, tasks))
@@ -0,0 +1,308 @@
+from collections.abc import MutableMapping
+import dataclasses
+import datetime
+import enum
+import functools
+import json
+import os
+from pathlib import Path
+import re
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, Optional, Union
+import urllib.parse
+import zlib
+
+from mtng import metrics
+from mtng.defaults import DEFAULT_CACHE_SIZE
+from mtng.projection import project
+
+if TYPE_CHECKING:
+    import diskcache
+
+# diskcache, appdirs and pydantic are imported on first use, so that
+# configuring the cache does not slow down the start of the CLI.
+
+DEFAULT_SIZE_LIMIT = DEFAULT_CACHE_SIZE
+
+# Time to live in seconds of memoized GitHub responses, by endpoint. Searches
+# change whenever any item changes, details and reviews of a single PR only
+# when that PR changes.
+DEFAULT_TTLS: Dict[str, float] = {
+    "search": 300,
+    "pull": 600,
+    "reviews": 600,
+    "default": 300,
+}
+
+_ENDPOINTS = [
+    ("search", re.compile(r"/search/")),
+    ("reviews", re.compile(r"/pulls/\d+/reviews$")),
+    ("pull", re.compile(r"/pulls/\d+$")),
+]
+
+# Validators are kept much longer than memoized responses: once those expire,
+# the response is revalidated with a conditional request instead of refetched.
+CONDITIONAL_EXPIRE = 30 * 24 * 3600
+
+# Version of the layout of cached values. Entries written with a different
+# version are treated as missing, and replaced on the next write.
+CACHE_SCHEMA_VERSION = 2
+
+_MISSING = object()
+
+_settings: Dict[str, Any] = {
+    "directory": None,
+    "size_limit": DEFAULT_SIZE_LIMIT,
+    "ttls": dict(DEFAULT_TTLS),
+}
+_cache: Optional["diskcache.Cache"] = None
+
+
+def configure(
+    directory: Optional[Path] = None,
+    size_limit: Optional[int] = None,
+    ttls: Optional[Dict[str, float]] = None,
+) -> None:
+    """
+    Change the location, size limit (in bytes) or TTLs of the cache. Takes
+    effect the next time the cache is used.
+    """
+    global _cache
+    if directory is not None:
+        _settings["directory"] = Path(directory)
+    if size_limit is not None:
+        _settings["size_limit"] = size_limit
+    if ttls is not None:
+        _settings["ttls"].update(ttls)
+    if _cache is not None:
+        _cache.close()
+        _cache = None
+
+
+def cache_dir() -> Path:
+    if _settings["directory"] is not None:
+        return _settings["directory"]
+    if "MTNG_CACHE_DIR" in os.environ:
+        return Path(os.environ["MTNG_CACHE_DIR"])
+    import appdirs
+
+    return Path(appdirs.user_cache_dir("mtng"))
+
+
+def get_cache() -> "diskcache.Cache":
+    """
+    The disk cache, opened on first use. Once it grows beyond the size limit,
+    the least recently used entries are evicted.
+    """
+    global _cache
+    if _cache is None:
+        import diskcache
+
+        _cache = diskcache.Cache(
+            cache_dir(),
+            size_limit=_settings["size_limit"],
+            eviction_policy="least-recently-used",
+        )
+        _cache.stats(enable=True)
+    return _cache
+
+
+def canonical_url(url: str) -> str:
+    """
+    Normalize a URL so that equivalent URLs yield the same cache key: the
+    scheme and host are lowercased, the default API host is dropped, query
+    parameters are decoded and sorted.
+    """
+    parts = urllib.parse.urlsplit(url)
+    netloc = parts.netloc.lower()
+    if netloc == "api.github.com":
+        netloc = ""
+    query = sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values=True))
+    return urllib.parse.urlunsplit(
+        (
+            parts.scheme.lower() if netloc else "",
+            netloc,
+            parts.path.rstrip("/"),
+            urllib.parse.urlencode(query),
+            "",
+        )
+    )
+
+
+def endpoint(url: str) -> str:
+    path = urllib.parse.urlsplit(url).path
+    for name, pattern in _ENDPOINTS:
+        if pattern.search(path):
+            return name
+    return "default"
+
+
+def ttl(url: str) -> float:
+    ttls = _settings["ttls"]
+    return ttls.get(endpoint(url), ttls["default"])
+
+
+def canonical(obj: Any) -> Any:
+    """
+    Convert function arguments into a JSON serializable form that does not
+    depend on how they were constructed. Aware datetimes are converted to UTC,
+    so that e.g. ``tzlocal()`` and an equivalent fixed offset give the same
+    key. Objects without a canonical form fall back to their ``repr``.
+    """
+    import pydantic
+
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    if isinstance(obj, enum.Enum):
+        return canonical(obj.value)
+    if isinstance(obj, datetime.datetime):
+        if obj.tzinfo is not None:
+            obj = obj.astimezone(datetime.timezone.utc)
+        return obj.isoformat()
+    if isinstance(obj, datetime.date):
+        return obj.isoformat()
+    if isinstance(obj, dict):
+        return {str(k): canonical(v) for k, v in sorted(obj.items())}
+    if isinstance(obj, (list, tuple)):
+        return [canonical(v) for v in obj]
+    if isinstance(obj, (set, frozenset)):
+        return sorted(canonical(v) for v in obj)
+    if isinstance(obj, pydantic.BaseModel):
+        return canonical(obj.dict())
+    if dataclasses.is_dataclass(obj):
+        return canonical(dataclasses.asdict(obj))
+    return repr(obj)
+
+
+def make_key(namespace: str, *args: Any, **kwargs: Any) -> str:
+    return namespace + ":" + json.dumps(canonical([args, kwargs]), sort_keys=True)
+
+
+def pack(obj: Any) -> bytes:
+    """Serialize a JSON document compactly, as compressed JSON."""
+    return zlib.compress(json.dumps(obj, separators=(",", ":")).encode())
+
+
+def unpack(blob: bytes) -> Any:
+    return json.loads(zlib.decompress(blob))
+
+
+def memoize(
+    expire: Union[float, str, Callable[..., float]] = 0,
+    key_func: Optional[Callable] = None,
+    compress: bool = False,
+):
+    """
+    Cache the result of a coroutine function in the disk cache, keyed by the
+    arguments ``key_func`` returns, for ``expire`` seconds or the TTL of an endpoint.
+    """
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapped(*args, **kwargs):
+            if key_func is None:
+                _args, _kwargs = args, kwargs
+            else:
+                _args, _kwargs = key_func(list(args), dict(kwargs))
+            key = make_key(fn.__name__, *_args, **_kwargs)
+
+            cache = get_cache()
+            hit = cache.get(key, default=_MISSING)
+            if compress and hit is not _MISSING:
+                version, blob = hit
+                hit = unpack(blob) if version == CACHE_SCHEMA_VERSION else _MISSING
+            metrics.current().memo_lookup(hit is not _MISSING)
+            if hit is not _MISSING:
+                return hit
+
+            result = await fn(*args, **kwargs)
+            if isinstance(expire, str):
+                _expire = _settings["ttls"].get(expire, _settings["ttls"]["default"])
+            elif callable(expire):
+                _expire = expire(*_args, **_kwargs)
+            else:
+                _expire = expire
+            value = (CACHE_SCHEMA_VERSION, pack(result)) if compress else result
+            cache.set(key, value, expire=_expire)
+            return result
+
+        return wrapped
+
+    return decorator
+
+
+class ConditionalCache(MutableMapping):
+    """
+    Cache of a gidgethub client, storing projected and compressed response bodies
+    with their validators for conditional requests.
+    """
+
+    prefix = "conditional:"
+
+    def __init__(
+        self,
+        cache: Optional["diskcache.Cache"] = None,
+        expire: float = CONDITIONAL_EXPIRE,
+    ):
+        self._cache = cache
+        self.expire = expire
+
+    @property
+    def cache(self) -> "diskcache.Cache":
+        return self._cache if self._cache is not None else get_cache()
+
+    def __getitem__(self, url: str) -> Any:
+        value = self.cache[self.prefix + canonical_url(url)]
+        if len(value) != 5 or value[0] != CACHE_SCHEMA_VERSION:
+            raise KeyError(url)
+        _, etag, last_modified, blob, more = value
+        return etag, last_modified, unpack(blob), more
+
+    def __setitem__(self, url: str, value: Any) -> None:
+        etag, last_modified, data, more = value
+        data = project(endpoint(url), data)
+        self.cache.set(
+            self.prefix + canonical_url(url),
+            (CACHE_SCHEMA_VERSION, etag, last_modified, pack(data), more),
+            expire=self.expire,
+        )
+
+    def __delitem__(self, url: str) -> None:
+        del self.cache[self.prefix + canonical_url(url)]
+
+    def __iter__(self) -> Iterator[str]:
+        for key in self.cache.iterkeys():
+            if isinstance(key, str) and key.startswith(self.prefix):
+                yield key[len(self.prefix) :]
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+def stats() -> Dict[str, Any]:
+    """
+    Summary of the cache contents, with the number of entries per key
+    namespace (memoized function or conditional request validators).
+    """
+    cache = get_cache()
+    hits, misses = cache.stats()
+    namespaces: Dict[str, int] = {}
+    for key in cache.iterkeys():
+        namespace = key.split(":", 1)[0] if isinstance(key, str) else "other"
+        namespaces[namespace] = namespaces.get(namespace, 0) + 1
+    return {
+        "directory": str(cache.directory),
+        "entries": len(cache),
+        "volume": cache.volume(),
+        "size_limit": _settings["size_limit"],
+        "hits": hits,
+        "misses": misses,
+        "namespaces": namespaces,
+    }
+
+
+def clear(expired_only: bool = False) -> int:
+    """Remove all (or only expired) entries, returns the number removed."""
+    cache = get_cache()
+    if expired_only:
+        return cache.expire()
+    return cache.clear()
@@ -1,160 +1,434 @@
-import os
-import shutil
-import subprocess
-from tempfile import TemporaryDirectory
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 import functools
-import asyncio
 import datetime
+import inspect
 from pathlib import Path
-import re
-import urllib.parse
 import json
 
 import typer
-from dotenv import load_dotenv
-from gidgethub.aiohttp import GitHubAPI
-import gidgethub
-import aiohttp
-import dateutil.parser
-import yaml
-import pydantic.schema
-from dateutil.tz import tzlocal
-from rich.status import Status
-from rich import print
-from rich.panel import Panel
-import rich.rule
-
-from mtng.generate import generate_latex
-from mtng.spec import Spec
-from mtng.collect import collect_repositories
-from mtng.generate import env
-from mtng import __version__
-
-load_dotenv(dotenv_path=Path.cwd() / ".env")
 
-cli = typer.Typer()
-
-
-def find_latexmk() -> Path:
-    try:
-        latexmk_path = Path(
-            subprocess.check_output(["which", "latexmk"]).decode().strip()
-        )
-    except subprocess.CalledProcessError:
-        return None
-    if not latexmk_path.exists():
-        return None
-    return latexmk_path
+from mtng.defaults import Backend, DEFAULT_CACHE_SIZE, DEFAULT_CONCURRENCY
 
+# Dependencies are imported in the commands that need them, so that the
+# lightweight commands and shell completion start quickly.
 
-def have_lualatex() -> bool:
-    try:
-        latexmk_path = Path(
-            subprocess.check_output(["which", "lualatex"]).decode().strip()
-        )
-    except subprocess.CalledProcessError:
-        return False
-    if not latexmk_path.exists():
-        return False
-    return True
+cli = typer.Typer()
 
 
 def make_sync(fn):
     @functools.wraps(fn)
     def wrapped(*args, **kwargs):
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(fn(*args, **kwargs))
+        import asyncio
+
+        asyncio.run(fn(*args, **kwargs))
 
     return wrapped
 
 
-async def collect(gh: GitHubAPI, repo: str, dt: datetime.datetime):
-    merged_prs = [
-        gh.getitem(f"/repos/{repo}/pulls/{issue['number']}")
-        async for issue in gh.getiter(
-            f"/search/issues?q=repo:{repo}+is:pr+merged:>={dt.strftime('%Y-%m-%d')}",
-        )
-    ]
+# Options overriding the HTTP settings of the configuration, see http_options
+def positive(value: Optional[float]) -> Optional[float]:
+    # a timeout of 0 disables it
+    if value is not None and value <= 0:
+        raise typer.BadParameter("must be greater than 0")
+    return value
 
-    open_prs = [
-        gh.getitem(f"/repos/{repo}/pulls/{issue['number']}")
-        async for issue in gh.getiter(
-            f'/search/issues?q=repo:{repo}+is:pr+is:open+-label:":construction: WIP"',
-        )
-    ]
 
-    stale = [
-        issue
-        async for issue in gh.getiter(
-            f"/search/issues?q=repo:{repo}+is:open+label:Stale"
-        )
-    ]
-
-    merged_prs = await asyncio.gather(*merged_prs)
-    open_prs = await asyncio.gather(*open_prs)
-    # stale = await asyncio.gather(*stale)
+HTTP_OPTIONS = {
+    "proxy": (
+        Optional[str],
+        typer.Option(
+            None,
+            help="HTTP proxy for all requests. Overrides the proxy given in the configuration.",
+            show_default=False,
+        ),
+    ),
+    "connect_timeout": (
+        Optional[float],
+        typer.Option(
+            None,
+            callback=positive,
+            help="Timeout in seconds for establishing a connection. Overrides the configuration.",
+            show_default=False,
+        ),
+    ),
+    "read_timeout": (
+        Optional[float],
+        typer.Option(
+            None,
+            callback=positive,
+            help="Timeout in seconds between two reads of a response. Overrides the configuration.",
+            show_default=False,
+        ),
+    ),
+    "connection_limit_per_host": (
+        Optional[int],
+        typer.Option(
+            None,
+            min=0,
+            help="Maximum number of connections to the same host, 0 for no limit. Overrides the configuration.",
+            show_default=False,
+        ),
+    ),
+}
 
-    return open_prs, merged_prs, stale
 
+def http_options(fn):
+    """
+    Add the options of :data:`HTTP_OPTIONS` to a command. ``fn`` receives
+    their values as the dictionary ``http_overrides``, to be passed on to
+    :func:`load_spec`.
+    """
 
-async def handle_event(event: str, session):
-    contributions = []
+    @functools.wraps(fn)
+    def wrapped(*args, **kwargs):
+        http_overrides = {name: kwargs.pop(name) for name in HTTP_OPTIONS}
+        return fn(*args, http_overrides=http_overrides, **kwargs)
 
-    indico_host, indico_id = re.match(r"https://(.*)/event/(\d*)/?", event).groups()
-    async with session.get(
-        f"https://{indico_host}/export/event/{indico_id}.json?detail=contributions",
-    ) as res:
-        event = await res.json()
+    signature = inspect.signature(fn)
+    parameters = [
+        p for p in signature.parameters.values() if p.name != "http_overrides"
+    ]
+    parameters += [
+        inspect.Parameter(
+            name,
+            inspect.Parameter.KEYWORD_ONLY,
+            default=option,
+            annotation=annotation,
+        )
+        for name, (annotation, option) in HTTP_OPTIONS.items()
+    ]
+    wrapped.__signature__ = signature.replace(parameters=parameters)
+    return wrapped
 
-        for contrib in event["results"][0]["contributions"]:
-            if contrib["title"] in ("Intro", "Introduction"):
-                continue
 
-            start = datetime.datetime.strptime(
-                contrib["startDate"]["date"] + " " + contrib["startDate"]["time"],
-                "%Y-%m-%d %H:%M:%S",
-            )
-            contributions.append(
-                {
-                    "title": contrib["title"],
-                    "speakers": [
-                        s["first_name"] + " " + s["last_name"]
-                        for s in contrib["speakers"]
-                    ],
-                    "start_date": start,
-                    "url": contrib["url"],
-                }
-            )
-    contributions = sorted(contributions, key=lambda c: c["start_date"])
-    return contributions
+# Options shared by the commands that collect data
+TOKEN_OPTION = typer.Option(
+    ...,
+    envvar="GH_TOKEN",
+    help="Github API token to use. Can be supplied with environment variable GH_TOKEN",
+    show_default=False,
+)
+SINCE_OPTION = typer.Option(
+    ...,
+    prompt="When was the last meeting? (YYYY-MM-DD)",
+    help="Start window for queries",
+)
+NOW_OPTION = typer.Option(
+    datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+    help="End window for queries",
+)
+EVENTS_OPTION = typer.Option(
+    [],
+    "--event",
+    help="Optionally attach an Indico based agenda overview. Can be given multiple times. This only works with public events!",
+)
+CONCURRENCY_OPTION = typer.Option(
+    DEFAULT_CONCURRENCY,
+    min=1,
+    help="Maximum number of GitHub API requests in flight at the same time",
+)
+BACKEND_OPTION = typer.Option(
+    None,
+    help="GitHub API used to collect data. Overrides the backend given in the configuration.",
+    show_default=False,
+)
+INCREMENTAL_OPTION = typer.Option(
+    False,
+    "--incremental",
+    help="Only fetch details of PRs that were updated since the previous run",
+)
+PROFILE_OPTION = typer.Option(
+    False,
+    "--profile",
+    help="Print the time spent per phase, the requests per endpoint, cache effectiveness and rate limit usage",
+)
+METRICS_OUT_OPTION = typer.Option(
+    None,
+    dir_okay=False,
+    help="Write the metrics shown by --profile as JSON to this file",
+    show_default=False,
+)
 
 
 @cli.command(
     help="Generate a LaTeX fragment that includes an overview of PRs, Issues and optionally an Indico agenda"
 )
 @make_sync
+@http_options
 async def generate(
     config: typer.FileText,
-    token: str = typer.Option(
-        os.environ.get("GH_TOKEN", ...),
-        help="Github API token to use. Can be supplied with environment variable GH_TOKEN",
-        show_default=False,
+    token: str = TOKEN_OPTION,
+    since: datetime.datetime = SINCE_OPTION,
+    now: datetime.datetime = NOW_OPTION,
+    events: List[str] = EVENTS_OPTION,
+    full_tex: bool = typer.Option(
+        False, "--full", help="Write a full LaTeX file that is compileable on it's own"
     ),
-    since: datetime.datetime = typer.Option(
-        ...,
-        prompt="When was the last meeting? (YYYY-MM-DD)",
-        help="Start window for queries",
+    pdf: Optional[Path] = typer.Option(
+        None,
+        dir_okay=False,
+        help="Compile the report as a PDF file. This requires a LaTeX installation.",
     ),
-    now: datetime.datetime = typer.Option(
-        datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
-        help="End window for queries",
+    tex: Optional[Path] = typer.Option(
+        None, dir_okay=False, help="Write LaTex output to this file"
+    ),
+    fragments: Optional[Path] = typer.Option(
+        None,
+        file_okay=False,
+        help="Write every repository to its own LaTeX file in this directory, together with a main.tex that inputs them. Files are only rewritten if they changed.",
+        show_default=False,
     ),
-    event: Optional[str] = typer.Option(
+    build_dir: Optional[Path] = typer.Option(
         None,
-        "--event",
-        help="Optionally attach an Indico based agenda overview. This only works with public events!",
+        file_okay=False,
+        help="Keep the LaTeX build files of --pdf in a subdirectory of this directory per configuration, so that later runs only rebuild what changed",
+        show_default=False,
+    ),
+    concurrency: int = CONCURRENCY_OPTION,
+    backend: Optional[Backend] = BACKEND_OPTION,
+    incremental: bool = INCREMENTAL_OPTION,
+    profile: bool = PROFILE_OPTION,
+    metrics_out: Optional[Path] = METRICS_OUT_OPTION,
+    *,
+    http_overrides: Dict[str, Any],
+):
+    from dateutil.tz import tzlocal
+
+    from mtng.pdf import find_latexmk
+
+    now = now.replace(tzinfo=tzlocal())
+    since = since.replace(tzinfo=tzlocal())
+
+    if pdf is not None and find_latexmk() is None:
+        raise ValueError("latexmk could not be found, cannot compile using --pdf")
+
+    config_text = config.read()
+    spec = load_spec(config_text, backend=backend, **http_overrides)
+
+    data, contributions = await collect_data(
+        spec,
+        token,
+        since=since,
+        now=now,
+        events=events,
+        concurrency=concurrency,
+        incremental=incremental,
+    )
+
+    render_output(
+        spec,
+        data,
+        since=since,
+        now=now,
+        contributions=contributions,
+        full_tex=full_tex,
+        pdf=pdf,
+        tex=tex,
+        fragments=fragments,
+        build_dir=build_dir,
+        workspace_name=Path(config.name).stem,
+        workspace_key=config_text,
+    )
+    report_metrics(profile, metrics_out)
+
+
+def load_spec(
+    config_text: str,
+    backend: Optional[Backend] = None,
+    proxy: Optional[str] = None,
+    connect_timeout: Optional[float] = None,
+    read_timeout: Optional[float] = None,
+    connection_limit_per_host: Optional[int] = None,
+):
+    """Parse the configuration, and apply the overrides given as options."""
+    import yaml
+
+    from mtng.spec import HttpSettings, Spec
+
+    spec = Spec.parse_obj(yaml.safe_load(config_text))
+    if backend is not None:
+        spec.backend = backend
+    overrides = {
+        "proxy": proxy,
+        "connect_timeout": connect_timeout,
+        "read_timeout": read_timeout,
+        "connection_limit_per_host": connection_limit_per_host,
+    }
+    spec.http = HttpSettings.parse_obj(
+        {**spec.http.dict(), **{k: v for k, v in overrides.items() if v is not None}}
+    )
+    return spec
+
+
+async def collect_data(
+    spec,
+    token: str,
+    since: datetime.datetime,
+    now: datetime.datetime,
+    events: List[str],
+    concurrency: int,
+    incremental: bool,
+):
+    from rich import print
+    from rich.panel import Panel
+
+    from mtng.cache import ConditionalCache
+    from mtng.collect import collect_report
+    from mtng.github import GitHubClient
+    from mtng.http import create_session
+
+    async with create_session(spec.http) as session:
+        cache = ConditionalCache()
+        gh = GitHubClient(
+            session,
+            __name__,
+            oauth_token=token,
+            concurrency=concurrency,
+            cache=cache,
+        )
+
+        print(Panel("Collection data from GitHub"))
+        return await collect_report(
+            spec.repos,
+            gh=gh,
+            since=since,
+            now=now,
+            session=session,
+            events=events,
+            cache=cache,
+            backend=spec.backend,
+            incremental=incremental,
+        )
+
+
+def render_output(
+    spec,
+    data,
+    since: datetime.datetime,
+    now: datetime.datetime,
+    contributions,
+    full_tex: bool,
+    pdf: Optional[Path],
+    tex: Optional[Path],
+    fragments: Optional[Path],
+    build_dir: Optional[Path],
+    workspace_name: str,
+    workspace_key: str,
+) -> None:
+    """
+    Render the LaTeX report, and print it or compile it to ``pdf``. With a
+    ``build_dir``, the PDF is built in a workspace identified by
+    ``workspace_name`` and ``workspace_key``, see :func:`mtng.pdf.workspace`.
+    """
+    from rich import print
+    from rich.panel import Panel
+    from rich.status import Status
+
+    from mtng.generate import generate_fragments, generate_latex
+    from mtng.pdf import compile_pdf, find_latexmk, workspace
+
+    if pdf is not None:
+        full_tex = True
+        latexmk = find_latexmk()
+        if latexmk is None:
+            raise ValueError("latexmk could not be found, cannot compile using --pdf")
+
+    with Status("Generating LaTeX"):
+        if fragments is not None:
+            latex = generate_fragments(
+                spec,
+                data,
+                since=since,
+                now=now,
+                contributions=contributions,
+                full_tex=full_tex,
+                directory=fragments,
+            )
+        else:
+            latex = generate_latex(
+                spec,
+                data,
+                since=since,
+                now=now,
+                contributions=contributions,
+                full_tex=full_tex,
+            )
+
+    if pdf is None:
+        if tex is not None:
+            tex.write_text(latex)
+        print(Panel(latex, title="LaTeX Output"))
+    else:
+        workdir = None
+        if build_dir is not None:
+            workdir = workspace(build_dir, workspace_name, workspace_key)
+        with Status("Compiling LaTeX"):
+            compile_pdf(latex, pdf, build_dir=workdir, latexmk=latexmk)
+
+
+def report_metrics(profile: bool, metrics_out: Optional[Path]) -> None:
+    from rich import print
+
+    from mtng import metrics
+
+    if profile:
+        for table in metrics.current().tables():
+            print(table)
+    if metrics_out is not None:
+        metrics.current().write(metrics_out)
+
+
+@cli.command(
+    help="Collect the data of a report from GitHub and Indico, and write it to a snapshot file that `mtng render` renders without network access"
+)
+@make_sync
+@http_options
+async def collect(
+    config: typer.FileText,
+    output: Path = typer.Option(
+        ..., "--output", "-o", dir_okay=False, help="Snapshot file to write"
     ),
+    token: str = TOKEN_OPTION,
+    since: datetime.datetime = SINCE_OPTION,
+    now: datetime.datetime = NOW_OPTION,
+    events: List[str] = EVENTS_OPTION,
+    concurrency: int = CONCURRENCY_OPTION,
+    backend: Optional[Backend] = BACKEND_OPTION,
+    incremental: bool = INCREMENTAL_OPTION,
+    profile: bool = PROFILE_OPTION,
+    metrics_out: Optional[Path] = METRICS_OUT_OPTION,
+    *,
+    http_overrides: Dict[str, Any],
+):
+    from dateutil.tz import tzlocal
+    from rich import print
+
+    from mtng.snapshot import ReportSnapshot
+
+    now = now.replace(tzinfo=tzlocal())
+    since = since.replace(tzinfo=tzlocal())
+
+    spec = load_spec(config.read(), backend=backend, **http_overrides)
+    data, contributions = await collect_data(
+        spec,
+        token,
+        since=since,
+        now=now,
+        events=events,
+        concurrency=concurrency,
+        incremental=incremental,
+    )
+
+    ReportSnapshot(spec, since, now, data, contributions).save(output)
+    print(f"Wrote {output}")
+    report_metrics(profile, metrics_out)
+
+
+@cli.command(
+    help="Render a report from a snapshot file written by `mtng collect`, without network access"
+)
+def render(
+    snapshot: Path = typer.Argument(..., exists=True, dir_okay=False),
     full_tex: bool = typer.Option(
         False, "--full", help="Write a full LaTeX file that is compileable on it's own"
     ),
@@ -166,82 +440,383 @@ async def generate(
     tex: Optional[Path] = typer.Option(
         None, dir_okay=False, help="Write LaTex output to this file"
     ),
+    fragments: Optional[Path] = typer.Option(
+        None,
+        file_okay=False,
+        help="Write every repository to its own LaTeX file in this directory, together with a main.tex that inputs them. Files are only rewritten if they changed.",
+        show_default=False,
+    ),
+    build_dir: Optional[Path] = typer.Option(
+        None,
+        file_okay=False,
+        help="Keep the LaTeX build files of --pdf in a subdirectory of this directory per snapshot, so that later runs only rebuild what changed",
+        show_default=False,
+    ),
+    profile: bool = typer.Option(
+        False,
+        "--profile",
+        help="Print the time spent rendering and compiling",
+    ),
+    metrics_out: Optional[Path] = METRICS_OUT_OPTION,
+):
+    from mtng.snapshot import ReportSnapshot
+
+    report = ReportSnapshot.load(snapshot)
+    render_output(
+        report.spec,
+        report.data,
+        since=report.since,
+        now=report.now,
+        contributions=report.contributions,
+        full_tex=full_tex,
+        pdf=pdf,
+        tex=tex,
+        fragments=fragments,
+        build_dir=build_dir,
+        workspace_name=snapshot.stem,
+        workspace_key=str(snapshot.resolve()),
+    )
+    report_metrics(profile, metrics_out)
+
+
+@cli.command(
+    help="Generate the reports of several configurations and time windows. Repositories that appear in several configurations are only collected once per window."
+)
+@make_sync
+@http_options
+async def batch(
+    configs: List[typer.FileText] = typer.Argument(...),
+    windows: List[str] = typer.Option(
+        ...,
+        "--window",
+        help="Time window of the reports, either START (up to --now) or START..END, as YYYY-MM-DD. Can be given multiple times.",
+    ),
+    output_dir: Path = typer.Option(
+        ...,
+        "--output-dir",
+        "-o",
+        file_okay=False,
+        help="Directory to write the reports to, as CONFIG_START_END.tex",
+    ),
+    token: str = TOKEN_OPTION,
+    now: datetime.datetime = typer.Option(
+        datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+        help="End of windows that do not give one",
+    ),
+    events: List[str] = EVENTS_OPTION,
+    full_tex: bool = typer.Option(
+        False, "--full", help="Write full LaTeX files that are compileable on their own"
+    ),
+    pdf: bool = typer.Option(
+        False,
+        "--pdf",
+        help="Also compile the reports to PDF files. This requires a LaTeX installation.",
+    ),
+    build_dir: Optional[Path] = typer.Option(
+        None,
+        file_okay=False,
+        help="Keep the LaTeX build files of --pdf in a subdirectory of this directory per report, so that later runs only rebuild what changed",
+        show_default=False,
+    ),
+    jobs: Optional[int] = typer.Option(
+        1,
+        "--jobs",
+        "-j",
+        min=1,
+        help="Number of processes rendering and compiling reports in parallel",
+    ),
+    concurrency: int = CONCURRENCY_OPTION,
+    backend: Optional[Backend] = BACKEND_OPTION,
+    incremental: bool = INCREMENTAL_OPTION,
+    profile: bool = PROFILE_OPTION,
+    metrics_out: Optional[Path] = METRICS_OUT_OPTION,
+    *,
+    http_overrides: Dict[str, Any],
 ):
+    from dateutil.tz import tzlocal
+    from rich import print
+    from rich.panel import Panel
+    from rich.status import Status
+
+    from mtng import metrics
+    from mtng.batch import collect_batch, parse_window, render_reports, report_name
+    from mtng.cache import ConditionalCache
+    from mtng.github import GitHubClient
+    from mtng.http import create_session
+    from mtng.pdf import compile_files, find_latexmk
+
     now = now.replace(tzinfo=tzlocal())
-    since = since.replace(tzinfo=tzlocal())
+    parsed_windows = [parse_window(w, now) for w in windows]
 
-    if pdf is not None:
+    if pdf:
         full_tex = True
         latexmk = find_latexmk()
         if latexmk is None:
             raise ValueError("latexmk could not be found, cannot compile using --pdf")
 
-    spec = Spec.parse_obj(yaml.safe_load(config))
-
-    async with aiohttp.ClientSession(loop=asyncio.get_event_loop()) as session:
-        if event is not None:
-            contributions = handle_event(event, session)
+    specs = [
+        load_spec(config.read(), backend=backend, **http_overrides)
+        for config in configs
+    ]
+    names = [Path(config.name).stem for config in configs]
+    # all requests go through one session
+    if any(spec.http != specs[0].http for spec in specs[1:]):
+        raise ValueError(
+            "The configurations have different http settings, which have to be the same for a batch"
+        )
 
-        gh = GitHubAPI(session, __name__, oauth_token=token)
+    async with create_session(specs[0].http) as session:
+        cache = ConditionalCache()
+        gh = GitHubClient(
+            session,
+            __name__,
+            oauth_token=token,
+            concurrency=concurrency,
+            cache=cache,
+        )
 
         print(Panel("Collection data from GitHub"))
-        data = await collect_repositories(spec.repos, gh=gh, since=since, now=now)
+        with metrics.phase("collect"):
+            data, contributions = await collect_batch(
+                specs,
+                parsed_windows,
+                gh=gh,
+                session=session,
+                events=events,
+                cache=cache,
+                incremental=incremental,
+            )
+
+    reports = []
+    files = []
+    for window in parsed_windows:
+        for name, spec, report in zip(names, specs, data[window]):
+            reports.append((spec, report, window))
+            files.append(output_dir / (report_name(name, window) + ".tex"))
+
+    with Status(f"Generating {len(reports)} reports"):
+        latex = render_reports(reports, contributions, full_tex=full_tex, jobs=jobs)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for path, content in zip(files, latex):
+        path.write_text(content)
+        print(f"Wrote {path}")
+
+    if pdf:
+        with Status(f"Compiling {len(files)} reports"):
+            compile_files(
+                [(path, path.with_suffix(".pdf")) for path in files],
+                build_root=build_dir,
+                jobs=jobs,
+                latexmk=latexmk,
+            )
 
-        contributions = await contributions if event is not None else []
+    report_metrics(profile, metrics_out)
 
-    with Status("Generating LaTeX"):
-        latex = generate_latex(
+
+@cli.command(
+    "compile",
+    help="Compile LaTeX reports to PDF files, several at a time. The PDFs are written next to the sources.",
+)
+def compile_(
+    sources: List[Path] = typer.Argument(..., exists=True, dir_okay=False),
+    build_dir: Optional[Path] = typer.Option(
+        None,
+        file_okay=False,
+        help="Keep the LaTeX build files in a subdirectory of this directory per source, so that later runs only rebuild what changed",
+        show_default=False,
+    ),
+    jobs: Optional[int] = typer.Option(
+        None,
+        "--jobs",
+        "-j",
+        min=1,
+        help="Number of reports compiled in parallel. Defaults to the number of CPUs.",
+        show_default=False,
+    ),
+):
+    from rich import print
+    from rich.status import Status
+
+    from mtng.pdf import compile_files, find_latexmk
+
+    latexmk = find_latexmk()
+    if latexmk is None:
+        raise ValueError("latexmk could not be found, cannot compile")
+
+    files = [(source, source.with_suffix(".pdf")) for source in sources]
+    with Status(f"Compiling {len(files)} reports"):
+        pdfs = compile_files(files, build_root=build_dir, jobs=jobs, latexmk=latexmk)
+    for pdf in pdfs:
+        print(f"Wrote {pdf}")
+
+
+@cli.command(
+    help="Serve reports over HTTP. The collected data is kept in memory and refreshed in the background, so reports are rendered without waiting for GitHub."
+)
+@make_sync
+@http_options
+async def serve(
+    config: typer.FileText,
+    token: str = TOKEN_OPTION,
+    host: str = typer.Option("127.0.0.1", help="Address to listen on"),
+    port: int = typer.Option(8080, help="Port to listen on"),
+    refresh: float = typer.Option(
+        15, min=1, help="Minutes between background refreshes of the collected data"
+    ),
+    window: int = typer.Option(
+        7,
+        min=1,
+        help="Days covered by reports that are requested without a 'since' date",
+    ),
+    events: List[str] = EVENTS_OPTION,
+    concurrency: int = CONCURRENCY_OPTION,
+    backend: Optional[Backend] = BACKEND_OPTION,
+    incremental: bool = typer.Option(
+        True,
+        help="Only fetch details of PRs that were updated since the previous refresh",
+    ),
+    *,
+    http_overrides: Dict[str, Any],
+):
+    import asyncio
+
+    from aiohttp import web
+    from rich import print
+
+    from mtng.cache import ConditionalCache
+    from mtng.github import GitHubClient
+    from mtng.http import create_session
+    from mtng.server import ReportServer
+
+    spec = load_spec(config.read(), backend=backend, **http_overrides)
+
+    async with create_session(spec.http) as session:
+        cache = ConditionalCache()
+        gh = GitHubClient(
+            session,
+            __name__,
+            oauth_token=token,
+            concurrency=concurrency,
+            cache=cache,
+        )
+        server = ReportServer(
             spec,
-            data,
-            since=since,
-            now=now,
-            contributions=contributions,
-            full_tex=full_tex,
+            gh,
+            session=session,
+            events=events,
+            cache=cache,
+            refresh_interval=refresh * 60,
+            default_window=datetime.timedelta(days=window),
+            incremental=incremental,
         )
 
-    if pdf is None:
-        if tex is not None:
-            tex.write_text(latex)
-        print(Panel(latex, title="LaTeX Output"))
-    else:
-        with TemporaryDirectory() as d:
-            d = Path(d)
-            source = d / "source.tex"
-            source.write_text(latex)
-            args = [
-                latexmk,
-                f"-output-directory={d}",
-                "-halt-on-error",
-                "-pdf",
-            ]
-
-            if have_lualatex():
-                args.append("-pdflatex=lualatex")
-            args.append(source)
-            with Status("Compiling LaTeX"):
-                subprocess.check_call(args)
-            shutil.copy(d / "source.pdf", pdf)
+        runner = web.AppRunner(server.app())
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, host, port).start()
+            print(f"Serving reports on http://{host}:{port}/report.tex")
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
 
 
 @cli.command(help="Print a preamble suitable to render fancy output")
 def preamble():
-    out = env.loader.get_source(env, "preamble.tex")[0]
+    from rich import print
 
-    print(out)
+    print((Path(__file__).parent / "template" / "preamble.tex").read_text())
 
 
 @cli.command(help="Print the configuration schema")
 def schema():
+    import pydantic.schema
+    from rich import print
+
+    from mtng.spec import Spec
+
     print(json.dumps(pydantic.schema.schema([Spec]), indent=2))
 
 
+cache_cli = typer.Typer(help="Inspect or clear the response cache")
+cli.add_typer(cache_cli, name="cache")
+
+
+@cache_cli.command("stats", help="Print statistics about the cache")
+def cache_stats():
+    from rich import print
+    from rich.table import Table
+
+    import mtng.cache
+
+    stats = mtng.cache.stats()
+
+    table = Table(show_header=False)
+    table.add_row("Directory", stats["directory"])
+    table.add_row("Entries", str(stats["entries"]))
+    table.add_row(
+        "Size",
+        f"{stats['volume'] / 2**20:.1f} MiB of {stats['size_limit'] / 2**20:.0f} MiB",
+    )
+    table.add_row("Hits", str(stats["hits"]))
+    table.add_row("Misses", str(stats["misses"]))
+    for namespace, count in sorted(stats["namespaces"].items()):
+        table.add_row(f"Entries: {namespace}", str(count))
+    print(table)
+
+
+@cache_cli.command("clear", help="Remove entries from the cache")
+def cache_clear(
+    expired: bool = typer.Option(
+        False, "--expired", help="Only remove entries that have expired"
+    ),
+):
+    from rich import print
+
+    import mtng.cache
+
+    removed = mtng.cache.clear(expired_only=expired)
+    print(f"Removed {removed} entries from {mtng.cache.cache_dir()}")
+
+
+def print_version(value: bool) -> None:
+    if value:
+        from mtng import __version__
+
+        print(f"mtng {__version__}")
+        raise typer.Exit()
+
+
 @cli.callback()
-def main():
-    pass
+def main(
+    version: bool = typer.Option(
+        False,
+        "--version",
+        callback=print_version,
+        is_eager=True,
+        help="Print the version and exit",
+    ),
+    cache_dir: Optional[Path] = typer.Option(
+        None,
+        file_okay=False,
+        envvar="MTNG_CACHE_DIR",
+        help="Directory of the response cache",
+        show_default=False,
+    ),
+    cache_size: int = typer.Option(
+        DEFAULT_CACHE_SIZE // 2**20,
+        min=1,
+        envvar="MTNG_CACHE_SIZE",
+        help="Size limit of the response cache in MiB. Least recently used entries are evicted beyond it.",
+    ),
+):
+    """
+    Meeting generation script
+    """
+    import mtng.cache
 
+    dotenv_path = Path.cwd() / ".env"
+    if dotenv_path.exists():
+        from dotenv import load_dotenv
 
-main.__doc__ = """
-Meeting generation script, version {version}
-""".format(
-    version=__version__
-)
+        load_dotenv(dotenv_path=dotenv_path)
+    mtng.cache.configure(directory=cache_dir, size_limit=cache_size * 2**20)
@@ -1,22 +1,55 @@
+import contextlib
+import dataclasses
 import functools
-from typing import Any, List, Optional, Literal, Dict
-from datetime import datetime
+import json
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterator,
+    List,
+    Optional,
+    Literal,
+    Dict,
+    FrozenSet,
+    Sequence,
+    Tuple,
+)
+from collections.abc import MutableMapping
+from datetime import date, datetime, time, timedelta, timezone
 import urllib.parse
 import asyncio
 import dateutil.parser
 
-import pickle
-
+import aiohttp
 from gidgethub.abc import GitHubAPI
 import pydantic
-import diskcache
-import appdirs
 from rich import print
 from rich.rule import Rule
-from rich.status import Status
-from rich.progress import Progress, track
+from rich.progress import Progress
+
+from mtng import metrics
+from mtng.cache import (
+    CACHE_SCHEMA_VERSION,
+    canonical_url,
+    endpoint,
+    get_cache,
+    make_key,
+    memoize,
+    pack,
+    ttl,
+    unpack,
+)
+from mtng.github import DEFAULT_CONCURRENCY
+from mtng.indico import get_agenda
+from mtng.projection import project
+from mtng.spec import Backend, Repository
 
-from mtng.spec import Repository
+if TYPE_CHECKING:
+    from mtng.snapshot import RepoSnapshot
 
 
 class Label(pydantic.BaseModel):
@@ -27,96 +60,508 @@ class User(pydantic.BaseModel):
     login: str
     html_url: str
 
+    class Config:
+        frozen = True
+        if pydantic.VERSION.startswith("1."):
+            # keep the shared instances of intern_user instead of copies
+            copy_on_model_validation = "none"
+
+
+@functools.lru_cache(maxsize=4096)
+def intern_user(login: str, html_url: str) -> User:
+    """
+    A shared :class:`User` instance per user. The same few people author,
+    review and are assigned most items of a repository, so every item refers
+    to the same instances instead of holding its own copies.
+    """
+    return User(login=login, html_url=html_url)
+
+
+def _as_user(value: Any) -> Any:
+    if isinstance(value, dict):
+        return intern_user(value["login"], value["html_url"])
+    return value
+
+
+def _label_name(value: Any) -> str:
+    if isinstance(value, Label):
+        return value.name
+    if isinstance(value, dict):
+        return value["name"]
+    return value
+
 
 class Review(pydantic.BaseModel):
+    """
+    A review of a PR. Only the fields the reports show are kept, in
+    particular not the review comment.
+    """
+
     user: User
     state: Literal["APPROVED", "COMMENTED", "CHANGES_REQUESTED", "DISMISSED"]
-    body: str
 
     submitted_at: datetime
 
+    _intern = pydantic.validator("user", pre=True, allow_reuse=True)(_as_user)
+
 
 class IssueBase(pydantic.BaseModel):
+    """An issue or PR, reduced to the fields the reports use."""
+
     title: str
     user: User
-    labels: List[Label]
+    labels: FrozenSet[str] = frozenset()
     html_url: str
     number: int
-    assignee: Optional[User]
+    assignee: Optional[User] = None
 
-    body: Optional[str]
+    body: Optional[str] = None
     url: str
 
     updated_at: datetime
     created_at: datetime
-    closed_at: Optional[datetime]
+    closed_at: Optional[datetime] = None
 
     is_wip: bool = False
     is_stale: bool = False
 
     draft: Optional[bool] = None
 
+    _intern = pydantic.validator("user", "assignee", pre=True, allow_reuse=True)(
+        _as_user
+    )
+
+    @pydantic.validator("labels", pre=True)
+    def _labels(cls, value):
+        return frozenset(_label_name(label) for label in value)
+
 
 class Issue(IssueBase):
     pull_request: Optional[Any] = None
 
+    @pydantic.validator("pull_request", pre=True)
+    def _pull_request(cls, value):
+        # only the API URL is needed, to fetch the details
+        if isinstance(value, dict):
+            return {"url": value["url"]}
+        return value
+
     @property
     def is_pr(self) -> bool:
         return self.pull_request is not None
 
 
+class ReviewSummary(pydantic.BaseModel):
+    """
+    The review shown for a PR: the last approval if there is one, else the
+    last comment, else the last review.
+    """
+
+    state: Literal["APPROVED", "COMMENTED", "CHANGES_REQUESTED", "DISMISSED"]
+    user: User
+
+    @classmethod
+    def from_reviews(cls, reviews: List[Review]) -> Optional["ReviewSummary"]:
+        approval = comment = None
+        for review in reviews:
+            if review.state == "APPROVED":
+                approval = review
+            elif review.state == "COMMENTED":
+                comment = review
+        review = approval or comment or (reviews[-1] if reviews else None)
+        if review is None:
+            return None
+        return cls(state=review.state, user=review.user)
+
+
 class PullRequest(IssueBase):
     requested_reviewers: List[User] = pydantic.Field(default_factory=list)
     reviews: List[Review] = pydantic.Field(default_factory=list)
+    merged_at: Optional[datetime] = None
+
+    review_summary: Optional[ReviewSummary] = None
+
+    @pydantic.validator("requested_reviewers", pre=True)
+    def _requested_reviewers(cls, value):
+        return [_as_user(user) for user in value]
+
+    @pydantic.validator("body", pre=True)
+    def _body(cls, value):
+        # PR descriptions are not shown
+        return None
+
+    @pydantic.validator("review_summary", always=True)
+    def _review_summary(cls, value, values):
+        # set again by collect_repository once the reviews are complete
+        return ReviewSummary.from_reviews(values.get("reviews", []))
 
     @property
     def is_pr(self) -> bool:
         return True
 
 
-cache = diskcache.Cache(appdirs.user_cache_dir("mtng"))
+def strip_github_api(args, kwargs):
+    """
+    Remove the GitHub client, progress display and incremental snapshot from
+    the arguments, none of which are part of the cache key.
+    """
+    kwargs.pop("gh", None)
+    kwargs.pop("progress", None)
+    kwargs.pop("snapshot", None)
+    args = list(filter(lambda o: not isinstance(o, (GitHubAPI, Progress)), args))
+    return args, kwargs
 
 
-def memoize(expire=0, key_func=None):
-    def decorator(fn):
-        @functools.wraps(fn)
-        async def wrapped(*args, **kwargs):
-            if key_func is None:
-                _args, _kwargs = args, kwargs
-            else:
-                _args, _kwargs = key_func(args, kwargs)
-            key = (
-                fn.__name__.encode("utf-8")
-                + b"_"
-                + pickle.dumps(_args)
-                + b"_"
-                + pickle.dumps(_kwargs)
-            )
+@contextlib.contextmanager
+def ensure_progress(progress: Optional[Progress]) -> Iterator[Progress]:
+    """
+    Use the given progress display, or show a new one for the duration of the
+    block. Only one live display can be active at a time, so concurrent
+    collections have to share a single one.
+    """
+    if progress is not None:
+        yield progress
+    else:
+        with Progress() as progress:
+            yield progress
 
-            if hit := cache.get(key):
-                return hit
 
-            result = await fn(*args, **kwargs)
-            cache.set(key, result, expire=expire)
-            return result
+@contextlib.contextmanager
+def progress_status(progress: Progress, description: str) -> Iterator[None]:
+    task = progress.add_task(description, total=None)
+    try:
+        yield
+    finally:
+        progress.remove_task(task)
 
-        return wrapped
 
-    return decorator
+# Maximum allowed by GitHub, the default is 30
+SEARCH_PAGE_SIZE = 100
 
+# GitHub only returns the first 1000 results of a search
+SEARCH_RESULT_LIMIT = 1000
 
-def strip_github_api(args, kwargs):
-    kwargs.pop("gh", None)
-    args = list(filter(lambda o: not isinstance(o, GitHubAPI), args))
-    return args, kwargs
+
+class SearchLimitExceeded(Exception):
+    """A search matches more items than GitHub returns, or timed out."""
+
+
+def search_terms(
+    repo_name: str,
+    qualifiers: List[str],
+    with_labels: List[str] = [],
+    without_labels: List[str] = [],
+    quote: Callable[[str], str] = lambda s: s,
+) -> List[str]:
+    """
+    Assemble the terms of an issue search query. REST URLs need the label
+    names quoted, GraphQL query strings do not.
+    """
+    terms = [f"repo:{repo_name}", *qualifiers]
+    terms += [f'-label:"{quote(label)}"' for label in without_labels]
+    terms += [f'label:"{quote(label)}"' for label in with_labels]
+    return terms
+
+
+def merged_qualifiers(start: date, end: date) -> List[str]:
+    return ["is:pr", f"merged:{start:%Y-%m-%d}..{end:%Y-%m-%d}"]
+
+
+def open_qualifiers(
+    type: Literal["pr", "issue", "any"],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> List[str]:
+    qualifiers = ["is:open"]
+    if type != "any":
+        qualifiers.append(f"is:{type}")
+    if start is not None and end is not None:
+        qualifiers.append(f"created:{start:%Y-%m-%d}..{end:%Y-%m-%d}")
+    elif start is not None:
+        qualifiers.append(f"created:{start:%Y-%m-%d}..*")
+    elif end is not None:
+        qualifiers.append(f"created:*..{end:%Y-%m-%d}")
+    return qualifiers
 
 
-@memoize(expire=300, key_func=strip_github_api)
+def strip_github_api_url(args, kwargs):
+    args, kwargs = strip_github_api(args, kwargs)
+    return [canonical_url(args[0]), *args[1:]], kwargs
+
+
+@memoize(
+    expire=lambda url, *args, **kwargs: ttl(url),
+    key_func=strip_github_api_url,
+    compress=True,
+)
 async def getitem(gh: GitHubAPI, url: str, *args: Any, **kwargs: Any) -> Any:
-    return await gh.getitem(url, *args, **kwargs)
+    """
+    GET a single resource. The response is projected to the fields the models
+    use before it is cached, see :mod:`mtng.projection`.
+    """
+    return project(endpoint(url), await gh.getitem(url, *args, **kwargs))
+
+
+async def stream_pull_details(
+    gh: GitHubAPI,
+    items: AsyncIterable[IssueBase],
+    progress: Optional[Progress] = None,
+    description: str = "",
+    snapshot: Optional["RepoSnapshot"] = None,
+) -> List[PullRequest]:
+    """
+    Fetch the details and reviews of the PRs in ``items`` while the search is
+    still running, in their order. PRs unchanged since ``snapshot`` are reused.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=2 * SEARCH_PAGE_SIZE)
+    results: Dict[int, PullRequest] = {}
+    workers = getattr(gh, "concurrency", DEFAULT_CONCURRENCY)
+
+    with ensure_progress(progress) as progress:
+        details_task = progress.add_task(f"{description}Getting PR details", total=None)
+        reviews_task = progress.add_task(f"{description}Getting PR reviews", total=None)
+
+        async def fetch(item: IssueBase) -> PullRequest:
+            if snapshot is not None and (pr := snapshot.get(item)) is not None:
+                progress.advance(details_task)
+                progress.advance(reviews_task)
+                return pr
+
+            url = item.pull_request["url"]
+
+            async def details():
+                result = await getitem(gh, url)
+                progress.advance(details_task)
+                return result
+
+            async def reviews():
+                result = await getitem(gh, f"{url}/reviews")
+                progress.advance(reviews_task)
+                return result
+
+            pr_data, review_data = await asyncio.gather(details(), reviews())
+            pr = PullRequest.parse_obj(pr_data)
+            pr.reviews = [Review.parse_obj(r) for r in review_data]
+            return pr
+
+        async def produce():
+            count = 0
+            async for item in items:
+                await queue.put((count, item))
+                count += 1
+                progress.update(details_task, total=count)
+                progress.update(reviews_task, total=count)
+            progress.update(details_task, total=count)
+            progress.update(reviews_task, total=count)
+            for _ in range(workers):
+                await queue.put(None)
+
+        async def work():
+            while (entry := await queue.get()) is not None:
+                index, item = entry
+                results[index] = await fetch(item)
+
+        try:
+            async with asyncio.TaskGroup() as tasks:
+                tasks.create_task(produce())
+                for _ in range(workers):
+                    tasks.create_task(work())
+        finally:
+            progress.remove_task(details_task)
+            progress.remove_task(reviews_task)
+
+    return [results[index] for index in range(len(results))]
+
+
+async def get_pull_details(
+    gh: GitHubAPI,
+    items: List[IssueBase],
+    progress: Optional[Progress] = None,
+    description: str = "",
+    snapshot: Optional["RepoSnapshot"] = None,
+) -> List[PullRequest]:
+    """
+    Fetch the PR details and reviews for a list of search results, see
+    :func:`stream_pull_details`.
+    """
+
+    async def iterate():
+        for item in items:
+            yield item
+
+    return await stream_pull_details(
+        gh, iterate(), progress=progress, description=description, snapshot=snapshot
+    )
+
+
+async def iter_issues(
+    gh: GitHubAPI, url: str, strict: bool = False
+) -> AsyncIterator[Issue]:
+    """
+    Iterate over the results of a search, page by page. GitHub only returns
+    the first :data:`SEARCH_RESULT_LIMIT` results. With ``strict``, a search
+    that matches more, or whose results are incomplete, raises
+    :class:`SearchLimitExceeded` before any result is returned.
+    """
+    page = 1
+    while True:
+        data = await gh.getitem(f"{url}&page={page}")
+        if (
+            strict
+            and page == 1
+            and (
+                data["total_count"] > SEARCH_RESULT_LIMIT or data["incomplete_results"]
+            )
+        ):
+            raise SearchLimitExceeded(url)
+        for issue in data["items"]:
+            yield Issue.parse_obj(issue)
+        total = min(data["total_count"], SEARCH_RESULT_LIMIT)
+        if len(data["items"]) == 0 or page * SEARCH_PAGE_SIZE >= total:
+            break
+        page += 1
+
+
+# Merged PRs do not change any more, so the merged PRs of a day are cached
+# for good once the day is over. Days are UTC calendar days, like the dates of
+# the search qualifiers. The search index lags behind a little, so a day is
+# only final some time after it ended.
+MERGED_DAY_SETTLE = timedelta(hours=6)
+
+
+def is_final(day: date, now: Optional[datetime] = None) -> bool:
+    """Whether the merged PRs of ``day`` can not change any more."""
+    now = now or datetime.now(timezone.utc)
+    end = datetime.combine(day + timedelta(days=1), time(), tzinfo=timezone.utc)
+    return end + MERGED_DAY_SETTLE <= now
+
+
+def day_ranges(days: List[date]) -> List[Tuple[date, date]]:
+    """Group sorted ``days`` into ranges of consecutive days."""
+    ranges: List[Tuple[date, date]] = []
+    for day in days:
+        if ranges and ranges[-1][1] + timedelta(days=1) == day:
+            ranges[-1] = (ranges[-1][0], day)
+        else:
+            ranges.append((day, day))
+    return ranges
+
+
+def merged_day(pr: PullRequest) -> Optional[date]:
+    merged_at = pr.merged_at or pr.closed_at
+    if merged_at is None:
+        return None
+    return merged_at.astimezone(timezone.utc).date()
+
+
+async def merged_by_day(
+    repo_name: str,
+    start: datetime,
+    end: datetime,
+    with_labels: List[str],
+    without_labels: List[str],
+    fetch: Callable[[date, date], Awaitable[List[PullRequest]]],
+    pending: Optional[Dict[date, "asyncio.Future[List[PullRequest]]"]] = None,
+) -> List[PullRequest]:
+    """
+    The merged PRs between ``start`` and ``end``, cached per final day. Missing
+    days are queried with ``fetch``, days in ``pending`` awaited from another call.
+    """
+    days = [
+        start.date() + timedelta(days=n)
+        for n in range((end.date() - start.date()).days + 1)
+    ]
+
+    def key(day: date) -> str:
+        return make_key(
+            "merged_day",
+            repo_name,
+            day,
+            with_labels=sorted(with_labels),
+            without_labels=sorted(without_labels),
+        )
+
+    cache = get_cache()
+    partitions: Dict[date, List[PullRequest]] = {}
+    for day in days:
+        if not is_final(day):
+            continue
+        hit = cache.get(key(day))
+        if hit is not None and hit[0] != CACHE_SCHEMA_VERSION:
+            hit = None
+        metrics.current().memo_lookup(hit is not None)
+        if hit is not None:
+            partitions[day] = [PullRequest.parse_obj(pr) for pr in unpack(hit[1])]
+
+    missing = [day for day in days if day not in partitions]
+    waiting: List[date] = []
+    owned: Dict[date, "asyncio.Future[List[PullRequest]]"] = {}
+    if pending is not None:
+        waiting = [day for day in missing if day in pending]
+        missing = [day for day in missing if day not in pending]
+        for day in missing:
+            pending[day] = owned[day] = asyncio.get_running_loop().create_future()
+
+    ranges = day_ranges(missing)
+    try:
+        fetched = await asyncio.gather(*(fetch(first, last) for first, last in ranges))
+    except BaseException as e:
+        for future in owned.values():
+            if isinstance(e, Exception):
+                future.set_exception(e)
+            else:
+                future.cancel()
+        raise
+
+    for day in missing:
+        partitions[day] = []
+
+    # A range can return PRs of other days, e.g. because GitHub's days differ
+    # from ours. They are kept if their day is queried in another range, and
+    # dropped if it is cached or outside of the window, as they are either
+    # known already or not asked for. The days of such a range are not
+    # cached, as the range may lack PRs of its own days as well.
+    unassigned: List[PullRequest] = []
+    final: List[date] = []
+    for (first, last), prs in zip(ranges, fetched):
+        complete = True
+        for pr in prs:
+            day = merged_day(pr)
+            if day is not None and first <= day <= last:
+                partitions[day].append(pr)
+                continue
+            complete = False
+            if day is None:
+                unassigned.append(pr)
+            elif day in missing:
+                partitions[day].append(pr)
+        if complete:
+            final += [day for day in missing if first <= day <= last and is_final(day)]
+
+    with cache.transact():
+        for day in final:
+            payload = [json.loads(pr.json()) for pr in unique_pulls(partitions[day])]
+            cache.set(key(day), (CACHE_SCHEMA_VERSION, pack(payload)))
+
+    for day, future in owned.items():
+        future.set_result(unique_pulls(partitions[day]))
+    for day in waiting:
+        partitions[day] = await pending[day]
+
+    return unique_pulls([pr for day in days for pr in partitions[day]] + unassigned)
+
+
+def unique_pulls(prs: List[PullRequest]) -> List[PullRequest]:
+    """``prs`` without repetitions of a PR number, in their order."""
+    seen = set()
+    result = []
+    for pr in prs:
+        if pr.number not in seen:
+            seen.add(pr.number)
+            result.append(pr)
+    return result
 
 
-#  @memoize(expire=300, key_func=strip_github_api)
 async def get_merged_pulls(
     gh: GitHubAPI,
     repo_name: str,
@@ -124,31 +569,36 @@ async def get_merged_pulls(
     end: datetime,
     with_labels: List[str] = [],
     without_labels: List[str] = [],
+    progress: Optional[Progress] = None,
+    snapshot: Optional["RepoSnapshot"] = None,
+    pending: Optional[Dict[date, "asyncio.Future[List[PullRequest]]"]] = None,
 ) -> List[PullRequest]:
-    url = f"/search/issues?q=repo:{repo_name}+is:pr+merged:{start:%Y-%m-%d}..{end:%Y-%m-%d}"
-    for label in without_labels:
-        url += f'+-label:"{urllib.parse.quote(label)}"'
-    for label in with_labels:
-        url += f'+label:"{urllib.parse.quote(label)}"'
-
-    with Status("Getting merged PR list"):
-        items = [Issue.parse_obj(issue) async for issue in gh.getiter(url)]
-
-    prs = [
-        PullRequest.parse_obj(await getitem(gh, item.pull_request["url"]))
-        for item in track(items, description="Getting PR details")
-    ]
+    """The PRs merged between ``start`` and ``end``, see :func:`merged_by_day`."""
 
-    for pr in track(prs, description="Getting PR reviews"):
-        pr.reviews = [
-            Review.parse_obj(r) for r in await getitem(gh, f"{pr.url}/reviews")
-        ]
+    async def fetch(first: date, last: date) -> List[PullRequest]:
+        url = f"/search/issues?per_page={SEARCH_PAGE_SIZE}&q=" + "+".join(
+            search_terms(
+                repo_name,
+                merged_qualifiers(first, last),
+                with_labels=with_labels,
+                without_labels=without_labels,
+                quote=urllib.parse.quote,
+            )
+        )
+        return await stream_pull_details(
+            gh,
+            iter_issues(gh, url),
+            progress=progress,
+            description=f"{repo_name}: merged: ",
+            snapshot=snapshot,
+        )
 
-    return prs
+    return await merged_by_day(
+        repo_name, start, end, with_labels, without_labels, fetch, pending
+    )
 
 
-@memoize(expire=300, key_func=strip_github_api)
-async def get_open_issues(
+def iter_open_issues(
     gh: GitHubAPI,
     repo_name: str,
     with_labels: List[str] = [],
@@ -156,136 +606,573 @@ async def get_open_issues(
     start: Optional[datetime] = None,
     end: Optional[datetime] = None,
     type: Literal["pr", "issue", "any"] = "issue",
-) -> List[Issue]:
-    url = f"/search/issues?q=repo:{repo_name}+is:open"
-    if type != "any":
-        url += f"+is:{type}"
-    if start is not None and end is not None:
-        url += f"+created:{start:%Y-%m-%d}..{end:%Y-%m-%d}"
-    elif start is not None:
-        url += f"+created:{start:%Y-%m-%d}..*"
-    elif end is not None:
-        url += f"+created:*..{end:%Y-%m-%d}"
-    for label in without_labels:
-        url += f'+-label:"{urllib.parse.quote(label)}"'
-    for label in with_labels:
-        url += f'+label:"{urllib.parse.quote(label)}"'
-    obj = [Issue.parse_obj(issue) async for issue in gh.getiter(url)]
+    strict: bool = False,
+) -> AsyncIterator[Issue]:
+    url = f"/search/issues?per_page={SEARCH_PAGE_SIZE}&q=" + "+".join(
+        search_terms(
+            repo_name,
+            open_qualifiers(type, start, end),
+            with_labels=with_labels,
+            without_labels=without_labels,
+            quote=urllib.parse.quote,
+        )
+    )
+    return iter_issues(gh, url, strict=strict)
+
+
+@memoize(expire="search", key_func=strip_github_api)
+async def get_open_issues(gh: GitHubAPI, *args: Any, **kwargs: Any) -> List[Issue]:
+    return [issue async for issue in iter_open_issues(gh, *args, **kwargs)]
+
+
+GRAPHQL_PAGE_SIZE = 50
+
+_GRAPHQL_ISSUE_FIELDS = """
+    title
+    number
+    url
+    body
+    createdAt
+    updatedAt
+    closedAt
+    author { login url }
+    labels(first: 100) { nodes { name } }
+    assignees(first: 1) { nodes { login url } }
+"""
+
+_GRAPHQL_PULL_FIELDS = """
+    isDraft
+    mergedAt
+    reviewRequests(first: 100) {
+      nodes { requestedReviewer { ... on User { login url } } }
+    }
+    reviews(first: 100) {
+      nodes { author { login url } state submittedAt }
+    }
+"""
+
+_GRAPHQL_SEARCH = """
+query($query: String!, $first: Int!, $cursor: String) {
+  search(query: $query, type: ISSUE, first: $first, after: $cursor) {
+    issueCount
+    pageInfo { hasNextPage endCursor }
+    nodes {
+      __typename
+      ... on Issue { %(issue)s }
+      ... on PullRequest { %(issue)s %(pull)s }
+    }
+  }
+}
+"""
+
+_GHOST = {"login": "ghost", "html_url": "https://github.com/ghost"}
+
+
+async def graphql_search(
+    gh: GitHubAPI, query: str, details: bool = False, strict: bool = False
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Iterate over the nodes of a GraphQL issue search, in pages of
+    :data:`GRAPHQL_PAGE_SIZE`. Reviews and requested reviewers of PRs are
+    only requested if ``details`` is set. ``strict`` works like for
+    :func:`iter_issues`.
+    """
+    document = _GRAPHQL_SEARCH % {
+        "issue": _GRAPHQL_ISSUE_FIELDS,
+        "pull": _GRAPHQL_PULL_FIELDS if details else "isDraft",
+    }
+    cursor = None
+    while True:
+        result = await gh.graphql(
+            document,
+            endpoint=f"{gh.base_url}/graphql",
+            query=query,
+            first=GRAPHQL_PAGE_SIZE,
+            cursor=cursor,
+        )
+        search = result["search"]
+        if strict and cursor is None and search["issueCount"] > SEARCH_RESULT_LIMIT:
+            raise SearchLimitExceeded(query)
+        for node in search["nodes"]:
+            yield node
+        if not search["pageInfo"]["hasNextPage"]:
+            break
+        cursor = search["pageInfo"]["endCursor"]
+
+
+def _graphql_user(node: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if node is None or "login" not in node:
+        return _GHOST
+    return {"login": node["login"], "html_url": node["url"]}
+
 
-    if type == "pr":
-        obj
+def from_graphql(
+    gh: GitHubAPI, repo_name: str, node: Dict[str, Any], details: bool = False
+) -> IssueBase:
+    """
+    Convert a GraphQL search node into the same model the REST endpoints
+    produce. ``url`` is filled with the REST URL of the item. PRs become
+    :class:`PullRequest` if the node was requested with ``details``.
+    """
+    is_pr = node["__typename"] == "PullRequest"
+    cls = PullRequest if is_pr and details else Issue
+    kind = "pulls" if is_pr else "issues"
+    obj = {
+        "title": node["title"],
+        "number": node["number"],
+        "html_url": node["url"],
+        "url": f"{gh.base_url}/repos/{repo_name}/{kind}/{node['number']}",
+        "body": node["body"],
+        "created_at": node["createdAt"],
+        "updated_at": node["updatedAt"],
+        "closed_at": node["closedAt"],
+        "user": _graphql_user(node["author"]),
+        "labels": node["labels"]["nodes"],
+        "assignee": (
+            _graphql_user(node["assignees"]["nodes"][0])
+            if len(node["assignees"]["nodes"]) > 0
+            else None
+        ),
+        "draft": node.get("isDraft"),
+    }
 
-    return obj
+    if cls is PullRequest:
+        obj["merged_at"] = node.get("mergedAt")
+        obj["requested_reviewers"] = [
+            _graphql_user(r["requestedReviewer"])
+            for r in node["reviewRequests"]["nodes"]
+            # team review requests do not match the User fragment
+            if r["requestedReviewer"]
+        ]
+        obj["reviews"] = [
+            {
+                "user": _graphql_user(r["author"]),
+                "state": r["state"],
+                "submitted_at": r["submittedAt"],
+            }
+            for r in node["reviews"]["nodes"]
+            # pending reviews are only visible to their author
+            if r["state"] != "PENDING"
+        ]
+    elif is_pr:
+        obj["pull_request"] = {
+            "url": f"{gh.base_url}/repos/{repo_name}/pulls/{node['number']}"
+        }
+
+    return cls.parse_obj(obj)
 
 
-@memoize(expire=300, key_func=strip_github_api)
-async def get_open_pulls(
+async def get_merged_pulls_graphql(
     gh: GitHubAPI,
-    *args: Any,
-    **kwargs: Any,
+    repo_name: str,
+    start: datetime,
+    end: datetime,
+    with_labels: List[str] = [],
+    without_labels: List[str] = [],
+    progress: Optional[Progress] = None,
+    pending: Optional[Dict[date, "asyncio.Future[List[PullRequest]]"]] = None,
 ) -> List[PullRequest]:
-    with Status("Getting open PR list"):
-        items = await get_open_issues(gh, *args, type="pr", **kwargs)
+    async def fetch(first: date, last: date) -> List[PullRequest]:
+        query = " ".join(
+            search_terms(
+                repo_name,
+                merged_qualifiers(first, last),
+                with_labels=with_labels,
+                without_labels=without_labels,
+            )
+        )
+        return [
+            from_graphql(gh, repo_name, node, details=True)
+            async for node in graphql_search(gh, query, details=True)
+        ]
+
+    with ensure_progress(progress) as progress:
+        with progress_status(progress, f"{repo_name}: Getting merged PRs"):
+            return await merged_by_day(
+                repo_name, start, end, with_labels, without_labels, fetch, pending
+            )
 
-    prs = [
-        PullRequest.parse_obj(await getitem(gh, item.pull_request["url"]))
-        for item in track(items, description="Getting PR details")
+
+@memoize(expire="search", key_func=strip_github_api)
+async def get_open_issues_graphql(
+    gh: GitHubAPI,
+    repo_name: str,
+    with_labels: List[str] = [],
+    without_labels: List[str] = [],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    type: Literal["pr", "issue", "any"] = "issue",
+    details: bool = False,
+    strict: bool = False,
+) -> List[IssueBase]:
+    """
+    Like :func:`get_open_issues`, but if ``details`` is set, PRs are returned
+    as :class:`PullRequest` including their reviews.
+    """
+    query = " ".join(
+        search_terms(
+            repo_name,
+            open_qualifiers(type, start, end),
+            with_labels=with_labels,
+            without_labels=without_labels,
+        )
+    )
+    return [
+        from_graphql(gh, repo_name, node, details=details)
+        async for node in graphql_search(gh, query, details=details, strict=strict)
     ]
 
-    for pr in track(prs, description="Getting PR reviews"):
-        pr.reviews = [
-            Review.parse_obj(r) for r in await getitem(gh, f"{pr.url}/reviews")
-        ]
 
-    return prs
+@dataclasses.dataclass(frozen=True)
+class OpenQuery:
+    """
+    A search for open items. The fields are the arguments of
+    :func:`iter_open_issues` that select the items.
+    """
 
+    type: Literal["pr", "issue", "any"]
+    with_labels: Tuple[str, ...] = ()
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
 
-async def collect_repositories(
-    repos: List[Repository], since: datetime, now: datetime, gh: GitHubAPI
+
+def section_queries(
+    repo: Repository, since: datetime, now: datetime
+) -> List[OpenQuery]:
+    """The search of every section of ``repo`` that lists open items."""
+    queries = []
+    if repo.do_open_prs:
+        queries.append(OpenQuery("pr"))
+    if repo.do_stale:
+        queries.append(OpenQuery("any", with_labels=(repo.stale_label,)))
+    if repo.do_recent_issues:
+        queries.append(OpenQuery("issue", start=since, end=now))
+    if repo.needs_discussion_label is not None:
+        queries.append(OpenQuery("issue", with_labels=(repo.needs_discussion_label,)))
+    return queries
+
+
+def plan_open_queries(queries: List[OpenQuery]) -> List[OpenQuery]:
+    """
+    The searches that serve the section ``queries``, combined into one search
+    of all open items unless the sections only list labelled items.
+    """
+    if len(queries) <= 1 or all(len(q.with_labels) > 0 for q in queries):
+        return queries
+    types = {q.type for q in queries}
+    return [OpenQuery(types.pop() if len(types) == 1 else "any")]
+
+
+def classify_open_items(
+    repo: Repository,
+    items: List[IssueBase],
+    since: datetime,
+    now: datetime,
+) -> Dict[str, List[IssueBase]]:
+    """
+    Split the result of the open items search into the report sections.
+    Items are not copied, so an item that appears in several sections is the
+    same object in all of them. The bodies of items that do not need
+    discussion are dropped, as they are not shown.
+    """
+    sections = {
+        "open_prs": [],
+        "stale": [],
+        "recent_issues": [],
+        "needs_discussion": [],
+    }
+
+    for item in items:
+        if repo.do_open_prs and item.is_pr:
+            if repo.show_wip or repo.wip_label not in item.labels:
+                sections["open_prs"].append(item)
+        if repo.do_stale and repo.stale_label in item.labels:
+            sections["stale"].append(item)
+        if item.is_pr:
+            continue
+        if (
+            repo.do_recent_issues
+            and since.date() <= item.created_at.date() <= now.date()
+        ):
+            sections["recent_issues"].append(item)
+        if (
+            repo.needs_discussion_label is not None
+            and repo.needs_discussion_label in item.labels
+        ):
+            sections["needs_discussion"].append(item)
+        else:
+            # only shown for items that need discussion
+            item.body = None
+
+    return sections
+
+
+async def collect_repository(
+    repo: Repository,
+    since: datetime,
+    now: datetime,
+    gh: GitHubAPI,
+    progress: Optional[Progress] = None,
+    backend: Backend = Backend.rest,
+    incremental: bool = False,
+    searches: Optional[Dict[Any, "asyncio.Future[List[IssueBase]]"]] = None,
+    merged_days: Optional[Dict[date, "asyncio.Future[List[PullRequest]]"]] = None,
+    snapshot: Optional["RepoSnapshot"] = None,
 ):
+    """
+    Collect all sections of a single repository. ``searches`` and ``merged_days``
+    share work with concurrent collections of the same repository and settings.
+    """
+    if repo.do_stale and repo.stale_label is None:
+        raise ValueError("Provide stale label if do_stale=True")
+
+    owns_snapshot = False
+    if snapshot is None and incremental and backend == Backend.rest:
+        from mtng.snapshot import RepoSnapshot
+
+        snapshot = RepoSnapshot.load(repo.name)
+        owns_snapshot = True
+
     data = {}
+    data["merged_prs"] = []
+    data["open_prs"] = []
+    data["stale"] = []
+    data["recent_issues"] = []
+    data["needs_discussion"] = []
+    data["spec"] = repo
+
+    queries = section_queries(repo, since, now)
+    planned = plan_open_queries(queries)
 
-    for repo in repos:
-        print(Rule(f"Collecting data for {repo.name}"))
-        data[repo.name] = {}
-        data[repo.name]["merged_prs"] = []
-        data[repo.name]["open_prs"] = []
-        data[repo.name]["stale"] = []
-        data[repo.name]["recent_issues"] = []
-        data[repo.name]["needs_discussion"] = []
-        data[repo.name]["spec"] = repo
-
-        if repo.do_merged_prs:
-            print(Rule("Fetching merged PRs", align="left"))
-            merged_prs = await get_merged_pulls(
+    async def merged_prs():
+        if backend == Backend.graphql:
+            data["merged_prs"] = await get_merged_pulls_graphql(
                 gh,
                 repo.name,
                 since,
                 now,
                 without_labels=repo.filter_labels,
+                progress=progress,
+                pending=merged_days,
             )
-            data[repo.name]["merged_prs"] = merged_prs
-
-        if repo.do_open_prs:
-            print(Rule("Fetching open PRs", align="left"))
-            open_prs = await get_open_pulls(
+        else:
+            data["merged_prs"] = await get_merged_pulls(
                 gh,
                 repo.name,
+                since,
+                now,
                 without_labels=repo.filter_labels,
+                progress=progress,
+                snapshot=snapshot,
+                pending=merged_days,
             )
+            if snapshot is not None:
+                for pr in data["merged_prs"]:
+                    snapshot.update(pr)
 
-            if not repo.show_wip:
-                open_prs = list(
-                    filter(
-                        lambda pr: repo.wip_label not in [l.name for l in pr.labels],
-                        open_prs,
-                    )
-                )
-            data[repo.name]["open_prs"] = open_prs
+    async def search(queries: List[OpenQuery], strict: bool) -> List[IssueBase]:
+        """
+        The items found by ``queries``, each only once, with the open PRs
+        fetched in detail.
+        """
+        seen = set()
+
+        def first_seen(item: IssueBase) -> bool:
+            if item.number in seen:
+                return False
+            seen.add(item.number)
+            return True
 
-        if repo.do_stale:
-            if repo.stale_label is None:
-                raise ValueError("Provide stale label if do_stale=True")
-            with Status("Getting stale issues"):
-                stale = await get_open_issues(
+        items: List[IssueBase] = []
+        if backend == Backend.graphql:
+            for query in queries:
+                found = await get_open_issues_graphql(
                     gh,
                     repo.name,
-                    with_labels=[repo.stale_label],
                     without_labels=repo.filter_labels,
-                    type="any",
+                    details=repo.do_open_prs,
+                    strict=strict,
+                    **dataclasses.asdict(query),
                 )
+                items += filter(first_seen, found)
+            return items
 
-                data[repo.name]["stale"] = stale
-
-        if repo.do_recent_issues:
-            with Status("Getting recent issues"):
-                recent_issues = await get_open_issues(
+        if not repo.do_open_prs:
+            for query in queries:
+                found = await get_open_issues(
                     gh,
                     repo.name,
-                    start=since,
-                    end=now,
                     without_labels=repo.filter_labels,
+                    strict=strict,
+                    **dataclasses.asdict(query),
                 )
+                items += filter(first_seen, found)
+            return items
 
-                data[repo.name]["recent_issues"] = recent_issues
-
-        for prk in "open_prs", "merged_prs", "stale", "recent_issues":
-            for pr in data[repo.name][prk]:
-                pr.is_wip = repo.wip_label in [l.name for l in pr.labels]
-                if pr.is_pr:
-                    pr.is_wip = pr.is_wip or (
-                        pr.draft if pr.draft is not None else False
-                    )
-                pr.is_stale = repo.stale_label in [l.name for l in pr.labels]
-
-        if repo.needs_discussion_label is not None:
-            with Status("Getting items that need discussion"):
-                needs_discussion = await get_open_issues(
+        # Open PRs are handed to the detail workers while the remaining
+        # search pages are still being fetched.
+        async def open_pulls():
+            for query in queries:
+                async for item in iter_open_issues(
                     gh,
                     repo.name,
-                    with_labels=[repo.needs_discussion_label],
                     without_labels=repo.filter_labels,
+                    strict=strict,
+                    **dataclasses.asdict(query),
+                ):
+                    if first_seen(item):
+                        items.append(item)
+                        if item.is_pr:
+                            yield item
+
+        pulls = await stream_pull_details(
+            gh,
+            open_pulls(),
+            progress=progress,
+            description=f"{repo.name}: open: ",
+            snapshot=snapshot,
+        )
+        if snapshot is not None:
+            for pr in pulls:
+                snapshot.update(pr)
+        by_number = {pr.number: pr for pr in pulls}
+        return [by_number.get(item.number, item) for item in items]
+
+    def shared_search(queries: List[OpenQuery], strict: bool):
+        if searches is None:
+            return search(queries, strict)
+        key = (tuple(queries), strict)
+        if key not in searches:
+            searches[key] = asyncio.ensure_future(search(queries, strict))
+        return searches[key]
+
+    async def open_items():
+        with progress_status(progress, f"{repo.name}: Getting open items"):
+            # A shared search is not used if GitHub does not return all of
+            # its results, the section searches are narrower.
+            items = None
+            try:
+                items = await shared_search(planned, strict=planned != queries)
+            except* SearchLimitExceeded:
+                print(
+                    f"{repo.name}: more than {SEARCH_RESULT_LIMIT} open items, "
+                    "searching per section"
+                )
+            if items is None:
+                items = await shared_search(queries, strict=False)
+
+        data.update(classify_open_items(repo, items, since=since, now=now))
+
+    sections = []
+    if repo.do_merged_prs:
+        sections.append(merged_prs())
+    if len(queries) > 0:
+        sections.append(open_items())
+
+    with ensure_progress(progress) as progress:
+        await asyncio.gather(*sections)
+
+    if owns_snapshot:
+        snapshot.save()
+
+    for prk in "open_prs", "merged_prs", "stale", "recent_issues":
+        for pr in data[prk]:
+            pr.is_wip = repo.wip_label in pr.labels
+            if pr.is_pr:
+                pr.is_wip = pr.is_wip or (pr.draft if pr.draft is not None else False)
+            if isinstance(pr, PullRequest):
+                pr.review_summary = ReviewSummary.from_reviews(pr.reviews)
+            pr.is_stale = repo.stale_label in pr.labels
+
+    return data
+
+
+async def collect_repositories(
+    repos: List[Repository],
+    since: datetime,
+    now: datetime,
+    gh: GitHubAPI,
+    backend: Backend = Backend.rest,
+    incremental: bool = False,
+):
+    """
+    Collect all repositories concurrently. All requests share the budget of
+    the client ``gh``. A summary is printed per repository once all of them
+    are done.
+    """
+    with Progress(transient=True) as progress:
+        results = await asyncio.gather(
+            *(
+                collect_repository(
+                    repo,
+                    since=since,
+                    now=now,
+                    gh=gh,
+                    progress=progress,
+                    backend=backend,
+                    incremental=incremental,
                 )
-                data[repo.name]["needs_discussion"] = needs_discussion
+                for repo in repos
+            )
+        )
+
+    data = {}
+    for repo, result in zip(repos, results):
+        data[repo.name] = result
+        print_summary(f"Collected data for {repo.name}", result)
 
     return data
+
+
+def print_summary(title: str, data: Dict[str, Any]) -> None:
+    """Print the number of items per section of one repository."""
+    print(Rule(title))
+    for key, name in [
+        ("merged_prs", "merged PRs"),
+        ("open_prs", "open PRs"),
+        ("stale", "stale items"),
+        ("recent_issues", "recent issues"),
+        ("needs_discussion", "items that need discussion"),
+    ]:
+        if len(data[key]) > 0:
+            print(f"{len(data[key])} {name}")
+
+
+async def collect_report(
+    repos: List[Repository],
+    since: datetime,
+    now: datetime,
+    gh: GitHubAPI,
+    session: Optional[aiohttp.ClientSession] = None,
+    events: Sequence[str] = (),
+    cache: Optional[MutableMapping] = None,
+    backend: Backend = Backend.rest,
+    incremental: bool = False,
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Collect the repositories, and the agenda of the Indico ``events`` with
+    ``session`` at the same time. Indico responses are revalidated with the
+    validators stored in ``cache``, see :func:`mtng.indico.fetch_json`.
+    Returns the data per repository and the contributions.
+    """
+
+    async def github():
+        with metrics.phase("collect.github"):
+            return await collect_repositories(
+                repos,
+                since=since,
+                now=now,
+                gh=gh,
+                backend=backend,
+                incremental=incremental,
+            )
+
+    async def indico():
+        with metrics.phase("collect.indico"):
+            return await get_agenda(session, events, cache=cache)
+
+    with metrics.phase("collect"):
+        data, contributions = await asyncio.gather(github(), indico())
+    if len(events) > 0:
+        print(f"{len(contributions)} contributions from {len(events)} Indico events")
+    return data, contributions
@@ -0,0 +1,14 @@
+"""Defaults and choices that the CLI needs to declare its options."""
+from enum import Enum
+
+
+class Backend(str, Enum):
+    rest = "rest"
+    graphql = "graphql"
+
+
+# Maximum number of GitHub API requests in flight at the same time
+DEFAULT_CONCURRENCY = 10
+
+# Size limit of the response cache in bytes
+DEFAULT_CACHE_SIZE = 256 * 2**20
@@ -1,34 +1,88 @@
+import dataclasses
+import functools
 from datetime import datetime
 from pathlib import Path
-import re
+from typing import Any, Dict, List
 from jinja2 import Environment, FileSystemLoader
+from jinja2.bccache import Bucket, FileSystemBytecodeCache
+
+from mtng import metrics
+from mtng.cache import cache_dir
+from mtng.collect import IssueBase, PullRequest
+from mtng.pdf import write_if_changed
+from mtng.spec import Repository, Spec
+
+
+class TemplateBytecodeCache(FileSystemBytecodeCache):
+    """
+    Keeps the compiled templates in the ``jinja`` subdirectory of the cache directory.
+    """
+
+    def __init__(self) -> None:
+        self.pattern = "%s.cache"
+
+    @property
+    def directory(self) -> str:
+        return str(cache_dir() / "jinja")
+
+    def dump_bytecode(self, bucket: Bucket) -> None:
+        try:
+            Path(self.directory).mkdir(parents=True, exist_ok=True)
+            super().dump_bytecode(bucket)
+        except OSError:
+            # not being able to cache the templates only costs time
+            pass
 
-from mtng.spec import Spec
 
 env = Environment(
     loader=FileSystemLoader(Path(__file__).parent / "template"),
+    bytecode_cache=TemplateBytecodeCache(),
 )
 
 
-def sanitize(s):
-    def repl(m):
-        orig = m.group(0)
-        return {
-            "_": "\\_",
-            "%": "\\%",
-            "#": "\\#",
-            "$": "\\$",
-            "&": "\\&",
-            "<": "\\textless{}",
-            ">": "\\textgreater{}",
-            "\\": "\\textbackslash{}",
-            "{": "\\{",
-            "}": "\\}",
-            "^": "\\textasciicircum{}",
-        }[orig]
+_LATEX_ESCAPES = {
+    "_": "\\_",
+    "%": "\\%",
+    "#": "\\#",
+    "$": "\\$",
+    "&": "\\&",
+    "<": "\\textless{}",
+    ">": "\\textgreater{}",
+    "\\": "\\textbackslash{}",
+    "{": "\\{",
+    "}": "\\}",
+    "^": "\\textasciicircum{}",
+}
+_LATEX_TABLE = str.maketrans(_LATEX_ESCAPES)
+_LONG_ORDER = "{}" + "".join(c for c in _LATEX_ESCAPES if c not in "{}\\")
+
+# Titles and logins repeat a lot, bodies rarely and can be large
+_SANITIZE_CACHED_LENGTH = 256
 
-    s = re.sub(r"[\\^_{}&$%#<>%]", repl, s)
-    return s
+
+@functools.lru_cache(maxsize=4096)
+def _sanitize_cached(s: str) -> str:
+    return s.translate(_LATEX_TABLE)
+
+
+def _sanitize_long(s: str) -> str:
+    # One str.replace per character is much faster than str.translate with
+    # multi-character replacements on large strings. Braces go first, so that
+    # the braces of e.g. \textless{} are not escaped, and backslashes are
+    # parked on a placeholder until all other escapes are in place.
+    if "\0" in s:
+        return s.translate(_LATEX_TABLE)
+    s = s.replace("\\", "\0")
+    for char in _LONG_ORDER:
+        s = s.replace(char, _LATEX_ESCAPES[char])
+    return s.replace("\0", _LATEX_ESCAPES["\\"])
+
+
+def sanitize(s: str) -> str:
+    """Escape the characters that have a special meaning in LaTeX."""
+    if len(s) <= _SANITIZE_CACHED_LENGTH:
+        return _sanitize_cached(s)
+    return _sanitize_long(s)
 
 
 env.filters["sanitize"] = sanitize
@@ -36,16 +90,109 @@ env.filters["sanitize"] = sanitize
 env.globals["include_raw"] = lambda q: env.loader.get_source(env, q)[0]
 
 
+@dataclasses.dataclass
+class RepoReport:
+    """
+    The sections of one repository in the order they are shown, so that the
+    templates only have to iterate over them.
+    """
+
+    spec: Repository
+    needs_discussion: List[IssueBase]
+    merged_prs: List[PullRequest]
+    open_prs: List[PullRequest]
+    recent_issues: List[IssueBase]
+    newly_stale: List[IssueBase]
+    stale: List[IssueBase]
+
+    @classmethod
+    def build(cls, data: Dict[str, Any], since: datetime) -> "RepoReport":
+        """
+        Merged PRs are sorted by merge date, all other sections by last update,
+        most recent first. Open PRs that are WIP come last. Newly stale items
+        are the stale items that were updated since the last meeting.
+        """
+
+        def by_update(items):
+            return sorted(items, key=lambda i: i.updated_at, reverse=True)
+
+        open_prs = by_update(data["open_prs"])
+        return cls(
+            spec=data["spec"],
+            needs_discussion=data["needs_discussion"],
+            merged_prs=sorted(data["merged_prs"], key=lambda pr: pr.closed_at),
+            open_prs=[pr for pr in open_prs if not pr.is_wip]
+            + [pr for pr in open_prs if pr.is_wip],
+            recent_issues=by_update(data["recent_issues"]),
+            newly_stale=[i for i in data["stale"] if i.updated_at > since],
+            stale=by_update(data["stale"]),
+        )
+
+
 def generate_latex(
     spec: Spec, data, since: datetime, now: datetime, contributions, full_tex: bool
 ) -> str:
-    tpl = env.get_template("main.tex")
-
-    return tpl.render(
-        repos=data,
-        spec=spec,
-        since=since,
-        now=now,
-        contributions=contributions,
-        full_tex=full_tex,
-    ).strip()
+    with metrics.phase("render"):
+        tpl = env.get_template("main.tex")
+
+        repos = {name: RepoReport.build(repo, since) for name, repo in data.items()}
+
+        return tpl.render(
+            repos=repos,
+            spec=spec,
+            since=since,
+            now=now,
+            contributions=contributions,
+            full_tex=full_tex,
+        ).strip()
+
+
+def fragment_path(directory: Path, repo_name: str) -> Path:
+    return directory / (repo_name.replace("/", "__") + ".tex")
+
+
+def generate_fragments(
+    spec: Spec,
+    data,
+    since: datetime,
+    now: datetime,
+    contributions,
+    full_tex: bool,
+    directory: Path,
+) -> str:
+    """
+    Render every repository into its own fragment file in ``directory``, and
+    return a main document that ``\\input``s them. The main document is also
+    written to ``main.tex`` in ``directory``. Files are only written if their
+    content changed, so latexmk only reruns if a repository's output changed.
+    """
+    with metrics.phase("render"):
+        directory.mkdir(parents=True, exist_ok=True)
+        tpl = env.get_template("fragment.tex")
+
+        repos = {name: RepoReport.build(repo, since) for name, repo in data.items()}
+
+        fragments = {}
+        for name, repo in repos.items():
+            path = fragment_path(directory, name)
+            content = tpl.render(
+                repo_name=name, repo=repo, spec=spec, since=since, now=now
+            )
+            write_if_changed(path, content.strip() + "\n")
+            fragments[name] = path.resolve().as_posix()
+
+        latex = (
+            env.get_template("main.tex")
+            .render(
+                repos=repos,
+                fragments=fragments,
+                spec=spec,
+                since=since,
+                now=now,
+                contributions=contributions,
+                full_tex=full_tex,
+            )
+            .strip()
+        )
+        write_if_changed(directory / "main.tex", latex + "\n")
+        return latex
@@ -0,0 +1,157 @@
+import asyncio
+import time
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+import aiohttp
+from gidgethub import sansio
+from gidgethub.aiohttp import GitHubAPI
+from rich import print
+
+from mtng import metrics
+from mtng.cache import endpoint
+from mtng.defaults import DEFAULT_CONCURRENCY
+
+DEFAULT_MAX_RETRIES = 5
+
+# GitHub asks to wait at least a minute after a secondary rate limit
+# response without a retry-after header, and to back off exponentially.
+SECONDARY_BACKOFF = 60
+
+
+class RateLimitBucket:
+    """
+    Budget of one GitHub rate limit resource (``core``, ``search``,
+    ``graphql``), as reported by the ``x-ratelimit-*`` response headers.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.remaining: Optional[int] = None
+        self.reset: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def update(self, rate_limit: sansio.RateLimit) -> None:
+        self.remaining = rate_limit.remaining
+        self.reset = rate_limit.reset_datetime.timestamp()
+
+    async def acquire(self, sleep) -> None:
+        """
+        Reserve one request from the budget. If the budget is used up, wait
+        until it resets. Requests of the same bucket queue up behind the
+        waiting one, requests of other buckets are not affected.
+        """
+        async with self._lock:
+            if self.remaining is not None and self.remaining <= 0:
+                delay = self.reset - time.time() + 1 if self.reset is not None else 0
+                if delay > 0:
+                    print(
+                        f"GitHub {self.name} rate limit exhausted, waiting {delay:.0f}s"
+                    )
+                    await sleep(delay)
+                self.remaining = None
+            if self.remaining is not None:
+                self.remaining -= 1
+
+
+class GitHubClient(GitHubAPI):
+    """
+    GitHub API client that bounds the number of requests in flight and
+    respects GitHub's rate limits.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        requester: str,
+        *,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        **kwargs: Any,
+    ) -> None:
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        super().__init__(session, requester, **kwargs)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.buckets: Dict[str, RateLimitBucket] = {}
+
+    def bucket(self, name: str) -> RateLimitBucket:
+        if name not in self.buckets:
+            self.buckets[name] = RateLimitBucket(name)
+        return self.buckets[name]
+
+    def resource_for(self, url: str) -> str:
+        path = url[len(self.base_url) :] if url.startswith(self.base_url) else url
+        if path.startswith("/search/"):
+            return "search"
+        if path.startswith("/graphql"):
+            return "graphql"
+        return "core"
+
+    def retry_delay(
+        self, status: int, headers: Mapping[str, str], body: bytes, attempt: int
+    ) -> Optional[float]:
+        """
+        How long to wait before retrying a response, or ``None`` if the
+        response is not due to a rate limit.
+        """
+        if status not in (403, 429):
+            return None
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+        if headers.get("x-ratelimit-remaining") == "0":
+            reset = float(headers.get("x-ratelimit-reset", time.time()))
+            return max(reset - time.time(), 0) + 1
+        if b"secondary rate limit" in body.lower():
+            return SECONDARY_BACKOFF * 2**attempt
+        return None
+
+    async def _request(
+        self, method: str, url: str, headers: Mapping[str, str], body: bytes = b""
+    ) -> Tuple[int, Mapping[str, str], bytes]:
+        bucket = self.bucket(self.resource_for(url))
+        name = "graphql" if bucket.name == "graphql" else endpoint(url)
+        conditional = any(
+            k.lower() in ("if-none-match", "if-modified-since") for k in headers
+        )
+
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire(self.sleep)
+            async with self._semaphore:
+                start = time.perf_counter()
+                response = await super()._request(method, url, headers, body)
+
+            status, res_headers, res_body = response
+            metrics.current().request(
+                name,
+                status,
+                time.perf_counter() - start,
+                conditional=conditional,
+                bytes_sent=len(body),
+                bytes_received=len(res_body),
+                retry=attempt > 0,
+            )
+            rate_limit = sansio.RateLimit.from_http(res_headers)
+            if rate_limit is not None:
+                resource = res_headers.get("x-ratelimit-resource", bucket.name)
+                self.bucket(resource).update(rate_limit)
+                # 304 Not Modified responses do not count against the limit
+                metrics.current().rate_limit(
+                    resource,
+                    rate_limit.limit,
+                    rate_limit.remaining,
+                    counted=status != 304,
+                )
+
+            delay = self.retry_delay(status, res_headers, res_body, attempt)
+            if delay is None or attempt == self.max_retries:
+                return response
+
+            print(
+                f"GitHub {bucket.name} rate limit hit (HTTP {status}), "
+                f"retrying in {delay:.0f}s"
+            )
+            await self.sleep(delay)
+
+        return response
@@ -0,0 +1,34 @@
+from typing import Optional
+
+import aiohttp
+
+from mtng.spec import HttpSettings
+
+
+def create_session(settings: Optional[HttpSettings] = None) -> aiohttp.ClientSession:
+    """
+    The HTTP session shared by the GitHub client and the Indico fetcher.
+    Connections are kept alive and reused across requests, DNS lookups are
+    cached, and the timeouts make sure that a hanging server fails the run
+    instead of stalling it.
+    """
+    settings = settings or HttpSettings()
+    connector = aiohttp.TCPConnector(
+        limit=settings.connection_limit,
+        limit_per_host=settings.connection_limit_per_host,
+        keepalive_timeout=settings.keepalive_timeout,
+        use_dns_cache=settings.dns_cache_ttl != 0,
+        ttl_dns_cache=settings.dns_cache_ttl,
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=settings.total_timeout,
+        connect=settings.connect_timeout,
+        sock_read=settings.read_timeout,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=timeout,
+        # a default proxy for all requests needs aiohttp 3.11
+        proxy=settings.proxy,
+        trust_env=settings.proxy is None,
+    )
@@ -0,0 +1,118 @@
+import asyncio
+from collections.abc import MutableMapping
+import datetime
+import re
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import aiohttp
+
+from mtng import metrics
+
+# Contributions that are not listed in the agenda overview
+SKIPPED_TITLES = ("Intro", "Introduction")
+
+_EVENT_URL = re.compile(r"(https?)://(.+?)/event/(\d+)")
+
+
+def export_url(event: str) -> str:
+    """
+    The JSON export URL of an Indico event page, e.g.
+    ``https://indico.cern.ch/event/1234/``. Indico instances that are not
+    served from the root of their host are supported as well.
+    """
+    m = _EVENT_URL.match(event)
+    if m is None:
+        raise ValueError(f"Not an Indico event URL: {event}")
+    scheme, host, event_id = m.groups()
+    return f"{scheme}://{host}/export/event/{event_id}.json?detail=contributions"
+
+
+async def fetch_json(
+    session: aiohttp.ClientSession,
+    url: str,
+    cache: Optional[MutableMapping] = None,
+) -> Any:
+    """GET a JSON document, revalidated with the validators stored in ``cache``."""
+    headers = {}
+    cached: Optional[Tuple] = None
+    if cache is not None:
+        cached = cache.get(url)
+    if cached is not None:
+        etag, last_modified = cached[:2]
+        if etag is not None:
+            headers["If-None-Match"] = etag
+        if last_modified is not None:
+            headers["If-Modified-Since"] = last_modified
+
+    start = time.perf_counter()
+    async with session.get(url, headers=headers) as response:
+        content = await response.read()
+        metrics.current().request(
+            "indico",
+            response.status,
+            time.perf_counter() - start,
+            conditional=len(headers) > 0,
+            bytes_received=len(content),
+        )
+        if response.status == 304 and cached is not None:
+            return cached[2]
+        response.raise_for_status()
+        data = await response.json(content_type=None)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+
+    if cache is not None and (etag is not None or last_modified is not None):
+        cache[url] = (etag, last_modified, data, None)
+    return data
+
+
+def parse_contributions(event: Dict[str, Any]) -> List[Dict[str, Any]]:
+    contributions = []
+    for result in event["results"]:
+        for contrib in result["contributions"]:
+            if contrib["title"] in SKIPPED_TITLES:
+                continue
+
+            start = datetime.datetime.strptime(
+                contrib["startDate"]["date"] + " " + contrib["startDate"]["time"],
+                "%Y-%m-%d %H:%M:%S",
+            )
+            contributions.append(
+                {
+                    "title": contrib["title"],
+                    "speakers": [
+                        s["first_name"] + " " + s["last_name"]
+                        for s in contrib["speakers"]
+                    ],
+                    "start_date": start,
+                    "url": contrib["url"],
+                }
+            )
+    return contributions
+
+
+async def get_contributions(
+    session: aiohttp.ClientSession,
+    event: str,
+    cache: Optional[MutableMapping] = None,
+) -> List[Dict[str, Any]]:
+    """The contributions of a public Indico event, sorted by start time."""
+    data = await fetch_json(session, export_url(event), cache=cache)
+    return sorted(parse_contributions(data), key=lambda c: c["start_date"])
+
+
+async def get_agenda(
+    session: aiohttp.ClientSession,
+    events: Sequence[str],
+    cache: Optional[MutableMapping] = None,
+) -> List[Dict[str, Any]]:
+    """
+    The contributions of several events, fetched concurrently and merged into
+    a single list sorted by start time.
+    """
+    results = await asyncio.gather(
+        *(get_contributions(session, event, cache=cache) for event in events)
+    )
+    contributions = [c for result in results for c in result]
+    return sorted(contributions, key=lambda c: c["start_date"])
@@ -0,0 +1,200 @@
+"""
+Wall time per phase, requests per endpoint, cache effectiveness and rate
+limit budget of a run.
+"""
+from collections import Counter
+import contextlib
+import dataclasses
+import json
+from pathlib import Path
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional
+
+if TYPE_CHECKING:
+    from rich.table import Table
+
+METRICS_VERSION = 1
+
+
+@dataclasses.dataclass
+class Phase:
+    wall_time: float = 0.0
+    calls: int = 0
+
+
+@dataclasses.dataclass
+class Endpoint:
+    requests: int = 0
+    # requests that were sent with ETag / Last-Modified validators, and how
+    # many of those were answered with 304 Not Modified
+    conditional: int = 0
+    not_modified: int = 0
+    retries: int = 0
+    errors: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    wall_time: float = 0.0
+
+
+@dataclasses.dataclass
+class RateLimit:
+    limit: Optional[int] = None
+    remaining: Optional[int] = None
+    # requests that count against the limit, i.e. not 304 Not Modified
+    used: int = 0
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.phases: Dict[str, Phase] = {}
+        self.endpoints: Dict[str, Endpoint] = {}
+        self.rate_limits: Dict[str, RateLimit] = {}
+        # memoized function results, see mtng.cache.memoize
+        self.memo: Counter = Counter()
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Measure the wall time of a block. Phases that run concurrently, e.g.
+        the GitHub and Indico collection, are measured independently.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            phase = self.phases.setdefault(name, Phase())
+            phase.wall_time += time.perf_counter() - start
+            phase.calls += 1
+
+    def request(
+        self,
+        endpoint: str,
+        status: int,
+        wall_time: float,
+        conditional: bool = False,
+        bytes_sent: int = 0,
+        bytes_received: int = 0,
+        retry: bool = False,
+    ) -> None:
+        e = self.endpoints.setdefault(endpoint, Endpoint())
+        e.requests += 1
+        e.wall_time += wall_time
+        e.conditional += conditional
+        e.not_modified += status == 304
+        e.retries += retry
+        e.errors += status >= 400
+        e.bytes_sent += bytes_sent
+        e.bytes_received += bytes_received
+
+    def rate_limit(
+        self, resource: str, limit: int, remaining: int, counted: bool = True
+    ) -> None:
+        r = self.rate_limits.setdefault(resource, RateLimit())
+        r.limit = limit
+        r.remaining = remaining
+        r.used += counted
+
+    def memo_lookup(self, hit: bool) -> None:
+        self.memo["hits" if hit else "misses"] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": METRICS_VERSION,
+            "phases": {k: dataclasses.asdict(v) for k, v in self.phases.items()},
+            "endpoints": {
+                k: dataclasses.asdict(v) for k, v in sorted(self.endpoints.items())
+            },
+            "rate_limits": {
+                k: dataclasses.asdict(v) for k, v in sorted(self.rate_limits.items())
+            },
+            "memo": {"hits": self.memo["hits"], "misses": self.memo["misses"]},
+        }
+
+    def write(self, path: Path) -> None:
+        path.write_text(json.dumps(self.to_dict(), indent=2))
+
+    def tables(self) -> List["Table"]:
+        """Human readable summary, as rich tables."""
+        from rich.table import Table
+
+        phases = Table(title="Phases")
+        phases.add_column("Phase")
+        phases.add_column("Calls", justify="right")
+        phases.add_column("Wall time", justify="right")
+        for name, p in self.phases.items():
+            phases.add_row(name, str(p.calls), f"{p.wall_time:.3f}s")
+
+        endpoints = Table(title="Requests")
+        endpoints.add_column("Endpoint")
+        for column in (
+            "Requests",
+            "Revalidated",
+            "Not modified",
+            "Retries",
+            "Errors",
+            "Received",
+            "Time",
+        ):
+            endpoints.add_column(column, justify="right")
+        for name, e in sorted(self.endpoints.items()):
+            endpoints.add_row(
+                name,
+                str(e.requests),
+                str(e.conditional),
+                _ratio(e.not_modified, e.conditional),
+                str(e.retries),
+                str(e.errors),
+                _size(e.bytes_received),
+                f"{e.wall_time:.3f}s",
+            )
+
+        memo = Table(title="Memoized results")
+        memo.add_column("Lookups", justify="right")
+        memo.add_column("Hits", justify="right")
+        memo.add_column("Misses", justify="right")
+        hits, misses = self.memo["hits"], self.memo["misses"]
+        memo.add_row(str(hits + misses), _ratio(hits, hits + misses), str(misses))
+
+        rate_limits = Table(title="Rate limits")
+        rate_limits.add_column("Resource")
+        rate_limits.add_column("Used", justify="right")
+        rate_limits.add_column("Remaining", justify="right")
+        rate_limits.add_column("Limit", justify="right")
+        for name, r in sorted(self.rate_limits.items()):
+            rate_limits.add_row(name, str(r.used), str(r.remaining), str(r.limit))
+
+        return [phases, endpoints, memo, rate_limits]
+
+
+def _ratio(n: int, total: int) -> str:
+    if total == 0:
+        return "-"
+    return f"{n} ({n / total:.0%})"
+
+
+def _size(n: int) -> str:
+    if n < 2**10:
+        return f"{n} B"
+    if n < 2**20:
+        return f"{n / 2**10:.1f} KiB"
+    return f"{n / 2**20:.1f} MiB"
+
+
+_current = Metrics()
+
+
+def current() -> Metrics:
+    """The metrics that instrumented code records into."""
+    return _current
+
+
+def reset() -> Metrics:
+    """Start recording into a new, empty set of metrics and return it."""
+    global _current
+    _current = Metrics()
+    return _current
+
+
+def phase(name: str):
+    """Shortcut for ``current().phase(name)``."""
+    return current().phase(name)
@@ -0,0 +1,142 @@
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+from pathlib import Path
+import shutil
+import subprocess
+from tempfile import TemporaryDirectory
+from typing import List, Optional, Sequence, Tuple
+
+from mtng import metrics
+
+
+def find_latexmk() -> Optional[Path]:
+    try:
+        latexmk_path = Path(
+            subprocess.check_output(["which", "latexmk"]).decode().strip()
+        )
+    except subprocess.CalledProcessError:
+        return None
+    if not latexmk_path.exists():
+        return None
+    return latexmk_path
+
+
+def have_lualatex() -> bool:
+    try:
+        latexmk_path = Path(
+            subprocess.check_output(["which", "lualatex"]).decode().strip()
+        )
+    except subprocess.CalledProcessError:
+        return False
+    if not latexmk_path.exists():
+        return False
+    return True
+
+
+def workspace(build_root: Path, name: str, key: str) -> Path:
+    """
+    Persistent build directory below ``build_root`` for one report. ``key``
+    identifies the report, e.g. the content of its configuration, so that
+    different reports never share (and invalidate) each other's aux files.
+    """
+    digest = hashlib.sha256(key.encode()).hexdigest()[:12]
+    return build_root / f"{name}-{digest}"
+
+
+def write_if_changed(path: Path, content: str) -> bool:
+    """
+    Write ``content`` unless the file already has it. Keeping the file
+    untouched lets latexmk see that nothing has to be rerun.
+    """
+    if path.exists() and path.read_text() == content:
+        return False
+    path.write_text(content)
+    return True
+
+
+def run_latexmk(
+    source: Path,
+    build_dir: Path,
+    latexmk: Optional[Path] = None,
+    lualatex: Optional[bool] = None,
+    quiet: bool = False,
+) -> Path:
+    """
+    Compile ``source`` in ``build_dir`` and return the path of the PDF.
+    latexmk keeps track of the dependencies of a build in its
+    ``.fdb_latexmk`` file, and only reruns LaTeX if any of them changed.
+    """
+    latexmk = latexmk or find_latexmk()
+    if latexmk is None:
+        raise ValueError("latexmk could not be found, cannot compile LaTeX")
+    if lualatex is None:
+        lualatex = have_lualatex()
+
+    args = [
+        str(latexmk),
+        f"-output-directory={build_dir}",
+        "-halt-on-error",
+        "-pdf",
+    ]
+    if lualatex:
+        args.append("-pdflatex=lualatex")
+    if quiet:
+        args.append("-quiet")
+    args.append(str(source))
+    subprocess.run(args, check=True)
+    return build_dir / (source.stem + ".pdf")
+
+
+def compile_pdf(
+    latex: str,
+    pdf: Path,
+    build_dir: Optional[Path] = None,
+    latexmk: Optional[Path] = None,
+    lualatex: Optional[bool] = None,
+    quiet: bool = False,
+) -> None:
+    """
+    Compile the document ``latex`` to ``pdf``. Without a ``build_dir``, it is
+    built from scratch in a temporary directory. With one, the aux files of
+    the previous build are reused, and unchanged documents are not rebuilt.
+    """
+    if build_dir is None:
+        with TemporaryDirectory() as d:
+            compile_pdf(latex, pdf, Path(d), latexmk, lualatex, quiet)
+        return
+
+    build_dir.mkdir(parents=True, exist_ok=True)
+    source = build_dir / "source.tex"
+    write_if_changed(source, latex)
+    with metrics.phase("compile"):
+        result = run_latexmk(source, build_dir, latexmk, lualatex, quiet)
+    shutil.copy(result, pdf)
+
+
+def _compile_file(args: Tuple[Path, Path, Optional[Path], Optional[Path], bool]):
+    tex, pdf, build_root, latexmk, lualatex = args
+    build_dir = None
+    if build_root is not None:
+        build_dir = workspace(build_root, tex.stem, str(tex.resolve()))
+    compile_pdf(tex.read_text(), pdf, build_dir, latexmk, lualatex, quiet=True)
+    return pdf
+
+
+def compile_files(
+    files: Sequence[Tuple[Path, Path]],
+    build_root: Optional[Path] = None,
+    jobs: Optional[int] = None,
+    latexmk: Optional[Path] = None,
+) -> List[Path]:
+    """
+    Compile pairs of LaTeX sources and PDF outputs in a pool of ``jobs``
+    processes. Each source gets its own workspace below ``build_root``.
+    """
+    latexmk = latexmk or find_latexmk()
+    if latexmk is None:
+        raise ValueError("latexmk could not be found, cannot compile LaTeX")
+    lualatex = have_lualatex()
+
+    tasks = [(tex, pdf, build_root, latexmk, lualatex) for tex, pdf in files]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(_compile_file, tasks))
@@ -0,0 +1,87 @@
+"""
+Reduce GitHub API payloads to the fields the models in :mod:`mtng.collect` use,
+before they are stored in the cache.
+"""
+from typing import Any, Dict, Optional
+
+USER_FIELDS = ("login", "html_url")
+
+ISSUE_FIELDS = (
+    "title",
+    "user",
+    "labels",
+    "html_url",
+    "number",
+    "assignee",
+    "body",
+    "url",
+    "updated_at",
+    "created_at",
+    "closed_at",
+    "draft",
+    "pull_request",
+)
+
+# PR descriptions are not shown, see mtng.collect.PullRequest
+PULL_FIELDS = tuple(f for f in ISSUE_FIELDS if f not in ("body", "pull_request")) + (
+    "requested_reviewers",
+    "merged_at",
+)
+
+REVIEW_FIELDS = ("user", "state", "submitted_at")
+
+SEARCH_FIELDS = ("total_count", "incomplete_results", "items")
+
+
+def project_user(obj: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if obj is None:
+        return None
+    return {k: obj[k] for k in USER_FIELDS if k in obj}
+
+
+def _project(obj: Dict[str, Any], fields) -> Dict[str, Any]:
+    result = {k: obj[k] for k in fields if k in obj}
+    for k in ("user", "assignee"):
+        if k in result:
+            result[k] = project_user(result[k])
+    if "requested_reviewers" in result:
+        result["requested_reviewers"] = [
+            project_user(u) for u in result["requested_reviewers"]
+        ]
+    if "labels" in result:
+        result["labels"] = [
+            label["name"] if isinstance(label, dict) else label
+            for label in result["labels"]
+        ]
+    if isinstance(result.get("pull_request"), dict):
+        result["pull_request"] = {"url": result["pull_request"]["url"]}
+    return result
+
+
+def project_issue(obj: Dict[str, Any]) -> Dict[str, Any]:
+    return _project(obj, ISSUE_FIELDS)
+
+
+def project_pull(obj: Dict[str, Any]) -> Dict[str, Any]:
+    return _project(obj, PULL_FIELDS)
+
+
+def project_review(obj: Dict[str, Any]) -> Dict[str, Any]:
+    return _project(obj, REVIEW_FIELDS)
+
+
+def project(endpoint: str, data: Any) -> Any:
+    """
+    Project the response ``data`` of an ``endpoint`` (see
+    :func:`mtng.cache.endpoint`). Responses of other endpoints, and responses
+    that do not have the expected shape, e.g. errors, are returned unchanged.
+    """
+    if endpoint == "search" and isinstance(data, dict) and "items" in data:
+        result = {k: data[k] for k in SEARCH_FIELDS if k in data}
+        result["items"] = [project_issue(item) for item in data["items"]]
+        return result
+    if endpoint == "pull" and isinstance(data, dict):
+        return project_pull(data)
+    if endpoint == "reviews" and isinstance(data, list):
+        return [project_review(review) for review in data]
+    return data
@@ -0,0 +1,234 @@
+import asyncio
+from collections.abc import MutableMapping
+import dataclasses
+import datetime
+from typing import Any, Dict, List, Optional, Sequence
+import weakref
+
+import aiohttp
+from aiohttp import web
+from dateutil.tz import tzlocal
+from gidgethub.abc import GitHubAPI
+from rich import print
+
+from mtng import metrics
+from mtng.cache import cache_dir
+from mtng.collect import collect_report
+from mtng.generate import generate_latex
+from mtng.pdf import compile_pdf, find_latexmk
+from mtng.spec import Spec
+
+DEFAULT_REFRESH_INTERVAL = 15 * 60
+DEFAULT_WINDOW = datetime.timedelta(days=7)
+
+# Windows (start dates) whose data is kept warm
+MAX_WINDOWS = 8
+
+
+@dataclasses.dataclass
+class Collection:
+    since: datetime.datetime
+    now: datetime.datetime
+    data: Dict[str, Any]
+    contributions: List[Dict[str, Any]]
+    last_used: float = 0.0
+
+
+class ReportServer:
+    """
+    Serves reports from data collected per start date, which is refreshed in the
+    background every ``refresh_interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        spec: Spec,
+        gh: GitHubAPI,
+        session: Optional[aiohttp.ClientSession] = None,
+        events: Sequence[str] = (),
+        cache: Optional[MutableMapping] = None,
+        refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+        default_window: datetime.timedelta = DEFAULT_WINDOW,
+        incremental: bool = False,
+    ) -> None:
+        self.spec = spec
+        self.gh = gh
+        self.session = session
+        self.events = events
+        self.cache = cache
+        self.refresh_interval = refresh_interval
+        self.default_window = default_window
+        self.incremental = incremental
+
+        self.collections: Dict[datetime.date, Collection] = {}
+        self._locks: Dict[datetime.date, asyncio.Lock] = {}
+        # only kept while a compilation of the window is running or waiting
+        self._compile_locks: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def default_since(self) -> datetime.date:
+        return datetime.date.today() - self.default_window
+
+    async def collect(self, since: datetime.date) -> Collection:
+        """Collect the window starting at ``since`` and store it."""
+        start = datetime.datetime.combine(since, datetime.time(), tzinfo=tzlocal())
+        now = datetime.datetime.now(tz=tzlocal())
+        data, contributions = await collect_report(
+            self.spec.repos,
+            since=start,
+            now=now,
+            gh=self.gh,
+            session=self.session,
+            events=self.events,
+            cache=self.cache,
+            backend=self.spec.backend,
+            incremental=self.incremental,
+        )
+        collection = Collection(start, now, data, contributions)
+        previous = self.collections.get(since)
+        collection.last_used = previous.last_used if previous else _clock()
+        self.collections[since] = collection
+        self._evict()
+        return collection
+
+    def _evict(self) -> None:
+        while len(self.collections) > MAX_WINDOWS:
+            since = min(self.collections, key=lambda k: self.collections[k].last_used)
+            del self.collections[since]
+            self._locks.pop(since, None)
+
+    async def get(self, since: datetime.date) -> Collection:
+        """
+        The data of a window, collected now if it is not warm yet. Concurrent
+        requests for the same window wait for a single collection.
+        """
+        lock = self._locks.setdefault(since, asyncio.Lock())
+        async with lock:
+            collection = self.collections.get(since)
+            if collection is None:
+                collection = await self.collect(since)
+        collection.last_used = _clock()
+        return collection
+
+    async def refresh(self) -> None:
+        """Collect all warm windows again."""
+        for since in list(self.collections) or [self.default_since()]:
+            lock = self._locks.setdefault(since, asyncio.Lock())
+            async with lock:
+                await self.collect(since)
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:  # keep serving the data we have
+                print(f"Refreshing failed: {e!r}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def render(self, collection: Collection, full_tex: bool) -> str:
+        return generate_latex(
+            self.spec,
+            collection.data,
+            since=collection.since,
+            now=collection.now,
+            contributions=collection.contributions,
+            full_tex=full_tex,
+        )
+
+    def _since(self, request: web.Request) -> datetime.date:
+        if "since" not in request.query:
+            return self.default_since()
+        try:
+            return datetime.date.fromisoformat(request.query["since"])
+        except ValueError:
+            raise web.HTTPBadRequest(text="since must be a date (YYYY-MM-DD)")
+
+    async def handle_tex(self, request: web.Request) -> web.Response:
+        collection = await self.get(self._since(request))
+        full_tex = request.query.get("full", "0") not in ("0", "false", "")
+        return web.Response(
+            text=self.render(collection, full_tex), content_type="text/x-tex"
+        )
+
+    async def handle_pdf(self, request: web.Request) -> web.Response:
+        latexmk = find_latexmk()
+        if latexmk is None:
+            raise web.HTTPNotImplemented(text="latexmk could not be found")
+
+        since = self._since(request)
+        collection = await self.get(since)
+        latex = self.render(collection, full_tex=True)
+        # one persistent build directory per window, see mtng.pdf
+        build_dir = cache_dir() / "serve" / since.isoformat()
+        pdf = build_dir / "report.pdf"
+        lock = self._compile_locks.setdefault(since, asyncio.Lock())
+        async with lock:
+            await asyncio.to_thread(
+                compile_pdf,
+                latex,
+                pdf,
+                build_dir=build_dir,
+                latexmk=latexmk,
+                quiet=True,
+            )
+            body = pdf.read_bytes()
+        return web.Response(body=body, content_type="application/pdf")
+
+    async def handle_status(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "repos": [repo.name for repo in self.spec.repos],
+                "refresh_interval": self.refresh_interval,
+                "windows": {
+                    since.isoformat(): {
+                        "collected_at": c.now.isoformat(),
+                        "items": {
+                            name: sum(
+                                len(repo[k])
+                                for k in ("merged_prs", "open_prs", "stale")
+                            )
+                            for name, repo in c.data.items()
+                        },
+                    }
+                    for since, c in sorted(self.collections.items())
+                },
+            }
+        )
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.json_response(metrics.current().to_dict())
+
+    async def handle_refresh(self, request: web.Request) -> web.Response:
+        await self.refresh()
+        return await self.handle_status(request)
+
+    async def _start_refresh(self, app: web.Application) -> None:
+        self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def _stop_refresh(self, app: web.Application) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+
+    def app(self, background_refresh: bool = True) -> web.Application:
+        app = web.Application()
+        app.add_routes(
+            [
+                web.get("/report.tex", self.handle_tex),
+                web.get("/report.pdf", self.handle_pdf),
+                web.get("/status", self.handle_status),
+                web.get("/metrics", self.handle_metrics),
+                web.post("/refresh", self.handle_refresh),
+            ]
+        )
+        if background_refresh:
+            app.on_startup.append(self._start_refresh)
+            app.on_cleanup.append(self._stop_refresh)
+        return app
+
+
+def _clock() -> float:
+    return asyncio.get_running_loop().time()
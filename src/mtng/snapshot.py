@@ -0,0 +1,179 @@
+import dataclasses
+import datetime
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from mtng.cache import cache_dir
+from mtng.collect import Issue, IssueBase, PullRequest
+from mtng.spec import Spec
+
+SNAPSHOT_VERSION = 1
+
+
+def snapshot_dir() -> Path:
+    return cache_dir() / "snapshots"
+
+
+class RepoSnapshot:
+    """
+    PRs of one repository as they were collected in the previous run,
+    including their reviews. Used by the incremental mode: the details and
+    reviews of a PR only have to be fetched again if its ``updated_at``
+    timestamp in the search results moved.
+    """
+
+    def __init__(
+        self, repo_name: str, path: Path, pulls: Dict[int, PullRequest]
+    ) -> None:
+        self.repo_name = repo_name
+        self.path = path
+        self.pulls = pulls
+        self._seen: Set[int] = set()
+
+    @classmethod
+    def load(cls, repo_name: str, directory: Optional[Path] = None) -> "RepoSnapshot":
+        directory = directory or snapshot_dir()
+        path = directory / (repo_name.replace("/", "__") + ".json")
+
+        pulls = {}
+        if path.exists():
+            try:
+                data = json.loads(path.read_text())
+            except json.JSONDecodeError:
+                data = {}
+            if data.get("version") == SNAPSHOT_VERSION:
+                for obj in data["pulls"]:
+                    pr = PullRequest.parse_obj(obj)
+                    pulls[pr.number] = pr
+
+        return cls(repo_name, path, pulls)
+
+    def get(self, item: IssueBase) -> Optional[PullRequest]:
+        """
+        The stored PR for a search result, if it has not been updated since.
+        """
+        pr = self.pulls.get(item.number)
+        if pr is None or pr.updated_at != item.updated_at:
+            return None
+        return pr
+
+    def update(self, pr: PullRequest) -> None:
+        self.pulls[pr.number] = pr
+        self._seen.add(pr.number)
+
+    def save(self) -> None:
+        """
+        Write the snapshot. Only PRs that were part of this run are kept, so
+        the snapshot does not grow with the history of the repository.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        pulls = [json.loads(self.pulls[number].json()) for number in sorted(self._seen)]
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(
+            json.dumps(
+                {
+                    "version": SNAPSHOT_VERSION,
+                    "repo": self.repo_name,
+                    "pulls": pulls,
+                }
+            )
+        )
+        tmp.replace(self.path)
+
+
+REPORT_VERSION = 1
+
+SECTIONS = ("merged_prs", "open_prs", "stale", "recent_issues", "needs_discussion")
+
+
+@dataclasses.dataclass
+class ReportSnapshot:
+    """
+    Everything a report is rendered from: the configuration, the time window,
+    the collected data per repository and the Indico contributions. Written by
+    ``mtng collect`` and read by ``mtng render``, so that a report can be
+    rendered again without collecting it again.
+    """
+
+    spec: Spec
+    since: datetime.datetime
+    now: datetime.datetime
+    data: Dict[str, Any]
+    contributions: List[Dict[str, Any]]
+
+    def to_dict(self) -> Dict[str, Any]:
+        repos = {}
+        for name, repo in self.data.items():
+            # items appearing in several sections are stored once
+            items: Dict[int, IssueBase] = {}
+            for section in SECTIONS:
+                for item in repo[section]:
+                    items.setdefault(item.number, item)
+            repos[name] = {
+                "items": [
+                    {
+                        "type": "pull" if isinstance(item, PullRequest) else "issue",
+                        **json.loads(item.json()),
+                    }
+                    for item in items.values()
+                ],
+                **{
+                    section: [item.number for item in repo[section]]
+                    for section in SECTIONS
+                },
+            }
+
+        return {
+            "version": REPORT_VERSION,
+            "spec": json.loads(self.spec.json()),
+            "since": self.since.isoformat(),
+            "now": self.now.isoformat(),
+            "repos": repos,
+            "contributions": [
+                {**c, "start_date": c["start_date"].isoformat()}
+                for c in self.contributions
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, obj: Dict[str, Any]) -> "ReportSnapshot":
+        if obj.get("version") != REPORT_VERSION:
+            raise ValueError(
+                f"Unsupported report snapshot version {obj.get('version')}, "
+                f"expected {REPORT_VERSION}. Collect the report again."
+            )
+        spec = Spec.parse_obj(obj["spec"])
+        repos = {repo.name: repo for repo in spec.repos}
+
+        data = {}
+        for name, repo in obj["repos"].items():
+            items = {}
+            for item in repo["items"]:
+                model = PullRequest if item.pop("type") == "pull" else Issue
+                items[item["number"]] = model.parse_obj(item)
+            data[name] = {
+                section: [items[number] for number in repo[section]]
+                for section in SECTIONS
+            }
+            data[name]["spec"] = repos[name]
+
+        return cls(
+            spec=spec,
+            since=datetime.datetime.fromisoformat(obj["since"]),
+            now=datetime.datetime.fromisoformat(obj["now"]),
+            data=data,
+            contributions=[
+                {**c, "start_date": datetime.datetime.fromisoformat(c["start_date"])}
+                for c in obj["contributions"]
+            ],
+        )
+
+    def save(self, path: Path) -> None:
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(self.to_dict()))
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path) -> "ReportSnapshot":
+        return cls.from_dict(json.loads(path.read_text()))
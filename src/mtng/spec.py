@@ -2,6 +2,8 @@ from typing import List, Optional
 import pydantic
 from pydantic import validator, root_validator
 
+from mtng.defaults import Backend
+
 
 class BaseModel(pydantic.BaseModel):
     class Config:
@@ -69,5 +71,47 @@ class Repository(BaseModel):
         return self.stale_label is not None
 
 
+class HttpSettings(BaseModel):
+    connection_limit: int = pydantic.Field(
+        100, ge=1, description="Maximum number of simultaneous connections."
+    )
+    connection_limit_per_host: int = pydantic.Field(
+        0,
+        ge=0,
+        description="Maximum number of simultaneous connections to the same host. 0 means no limit.",
+    )
+    connect_timeout: Optional[float] = pydantic.Field(
+        10, gt=0, description="Timeout in seconds for establishing a connection."
+    )
+    read_timeout: Optional[float] = pydantic.Field(
+        60,
+        gt=0,
+        description="Timeout in seconds between two reads of a response, so that a hanging server does not stall the run.",
+    )
+    total_timeout: Optional[float] = pydantic.Field(
+        None, gt=0, description="Timeout in seconds for a whole request."
+    )
+    keepalive_timeout: float = pydantic.Field(
+        30, ge=0, description="Seconds an idle connection is kept open for reuse."
+    )
+    dns_cache_ttl: Optional[int] = pydantic.Field(
+        300, ge=0, description="Seconds DNS lookups are cached."
+    )
+    proxy: Optional[str] = pydantic.Field(
+        None,
+        description="URL of an HTTP proxy. If not set, the HTTP_PROXY / HTTPS_PROXY environment variables are used.",
+    )
+
+
 class Spec(BaseModel):
     repos: List[Repository]
+
+    http: HttpSettings = pydantic.Field(
+        default_factory=HttpSettings,
+        description="Connection settings shared by all requests to GitHub and Indico.",
+    )
+
+    backend: Backend = pydantic.Field(
+        Backend.rest,
+        description="GitHub API used to collect data. 'graphql' fetches items including their reviews in batches, and needs far fewer requests than 'rest'.",
+    )
@@ -0,0 +1,20 @@
+import pytest
+
+import mtng.cache
+import mtng.metrics
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path_factory):
+    """Every test gets its own empty response cache."""
+    directory = tmp_path_factory.mktemp("cache")
+    mtng.cache.configure(directory=directory)
+    yield directory
+    # closes the cache
+    mtng.cache.configure()
+
+
+@pytest.fixture(autouse=True)
+def isolated_metrics():
+    """Every test records into its own metrics."""
+    return mtng.metrics.reset()
@@ -0,0 +1,270 @@
+"""
+Local stand-in for the parts of the GitHub REST API used by mtng: issue
+search, PR details and PR reviews. Serves synthetic repositories, used by the
+tests and the benchmarks in ``benchmarks/``.
+"""
+import asyncio
+from collections import Counter
+import dataclasses
+from datetime import date, datetime, timedelta, timezone
+import hashlib
+import json
+import shlex
+import time
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+START = datetime(2022, 8, 1, tzinfo=timezone.utc)
+
+
+@dataclasses.dataclass
+class FakeRepo:
+    """
+    A synthetic repository with ``size`` items: 40% merged PRs, 30% open PRs
+    and 30% open issues. Every tenth item is stale, every 25th open PR is a
+    WIP draft. Each PR has ``reviews`` reviews. Items are created ``spacing``
+    minutes apart, and merged two days after they were created.
+    """
+
+    name: str
+    size: int
+    reviews: int = 2
+    spacing: int = 1
+    stale_label: str = "Stale"
+    wip_label: str = ":construction: WIP"
+
+    def kind(self, number: int) -> str:
+        bucket = number % 10
+        if bucket < 4:
+            return "merged"
+        if bucket < 7:
+            return "pr"
+        return "issue"
+
+    def labels(self, number: int) -> List[Dict[str, str]]:
+        labels = [{"name": "Component"}]
+        if number % 10 == 9 or number % 20 == 5:
+            labels.append({"name": self.stale_label})
+        if self.kind(number) == "pr" and number % 25 == 5:
+            labels.append({"name": self.wip_label})
+        return labels
+
+    def issue(self, base_url: str, number: int) -> Dict:
+        kind = self.kind(number)
+        created = START + timedelta(minutes=number * self.spacing)
+        url = f"{base_url}/repos/{self.name}"
+        data = {
+            "title": f"Item {number}: change the {number % 7}th thing & more",
+            "user": user(number),
+            "labels": self.labels(number),
+            "html_url": f"https://github.com/{self.name}/issues/{number}",
+            "number": number,
+            "assignee": user(number + 1) if number % 3 == 0 else None,
+            "body": "Some description of the change.\n" * 5,
+            "url": f"{url}/issues/{number}",
+            "updated_at": (created + timedelta(days=1)).isoformat(),
+            "created_at": created.isoformat(),
+            "closed_at": (
+                (created + timedelta(days=2)).isoformat() if kind == "merged" else None
+            ),
+        }
+        if kind != "issue":
+            data["pull_request"] = {"url": f"{url}/pulls/{number}"}
+            data["draft"] = number % 25 == 5
+        return data
+
+    def pull(self, base_url: str, number: int) -> Dict:
+        data = self.issue(base_url, number)
+        data["url"] = data.pop("pull_request")["url"]
+        data["requested_reviewers"] = [user(number + 2)]
+        data["merged_at"] = data["closed_at"]
+        return data
+
+    def review_list(self, number: int) -> List[Dict]:
+        return [
+            {
+                "user": user(number + i),
+                "state": ["APPROVED", "COMMENTED", "CHANGES_REQUESTED"][i % 3],
+                "body": "Looks good",
+                "submitted_at": (START + timedelta(hours=number + i)).isoformat(),
+            }
+            for i in range(self.reviews)
+        ]
+
+    def merged_on(self, number: int) -> date:
+        return (START + timedelta(minutes=number * self.spacing, days=2)).date()
+
+    def search(self, terms: List[str]) -> List[int]:
+        """Item numbers matching the qualifiers of a search query."""
+        merged = [t.split(":", 1)[1] for t in terms if t.startswith("merged:")]
+        numbers = []
+        for number in range(1, self.size + 1):
+            kind = self.kind(number)
+            if "is:merged" in terms or merged:
+                match = kind == "merged"
+                for window in merged:
+                    first, last = (date.fromisoformat(d) for d in window.split(".."))
+                    match = match and first <= self.merged_on(number) <= last
+            else:
+                match = kind != "merged"
+            if "is:pr" in terms:
+                match = match and kind != "issue"
+            if "is:issue" in terms:
+                match = match and kind == "issue"
+            names = {label["name"] for label in self.labels(number)}
+            for term in terms:
+                if term.startswith("label:"):
+                    match = match and term[len("label:") :] in names
+                elif term.startswith("-label:"):
+                    match = match and term[len("-label:") :] not in names
+            if match:
+                numbers.append(number)
+        return numbers
+
+
+def user(number: int) -> Dict[str, str]:
+    login = f"user{number % 13}"
+    return {"login": login, "html_url": f"https://github.com/{login}"}
+
+
+class FakeGitHub:
+    """
+    aiohttp application serving the repositories ``repos``. Every response
+    waits ``latency`` seconds, carries rate limit headers and an ETag, and
+    answers conditional requests with 304 Not Modified. Once ``rate_limit``
+    requests of a resource have been made, requests fail with 403 until the
+    window of ``rate_limit_window`` seconds has passed. Requests are counted
+    per endpoint in ``requests``.
+    """
+
+    def __init__(
+        self,
+        repos: List[FakeRepo],
+        latency: float = 0.0,
+        rate_limit: int = 5000,
+        rate_limit_window: float = 3600,
+    ) -> None:
+        self.repos = {repo.name: repo for repo in repos}
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.requests: Counter = Counter()
+        self._used: Counter = Counter()
+        self._reset: Dict[str, float] = {}
+
+        self.app = web.Application()
+        self.app.add_routes(
+            [
+                web.get("/search/issues", self.handle_search),
+                web.get("/repos/{owner}/{repo}/pulls/{number}", self.handle_pull),
+                web.get(
+                    "/repos/{owner}/{repo}/pulls/{number}/reviews",
+                    self.handle_reviews,
+                ),
+                web.get("/_stats", self.handle_stats),
+            ]
+        )
+
+    def base_url(self, request: web.Request) -> str:
+        return f"{request.scheme}://{request.host}"
+
+    def repo(self, request: web.Request) -> FakeRepo:
+        name = f"{request.match_info['owner']}/{request.match_info['repo']}"
+        if name not in self.repos:
+            raise web.HTTPNotFound()
+        return self.repos[name]
+
+    async def respond(
+        self,
+        request: web.Request,
+        endpoint: str,
+        data,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> web.Response:
+        self.requests[endpoint] += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+
+        resource = "search" if endpoint == "search" else "core"
+        now = time.time()
+        if now >= self._reset.get(resource, 0):
+            self._reset[resource] = now + self.rate_limit_window
+            self._used[resource] = 0
+        self._used[resource] += 1
+        remaining = self.rate_limit - self._used[resource]
+        headers = {
+            **(headers or {}),
+            "x-ratelimit-limit": str(self.rate_limit),
+            "x-ratelimit-remaining": str(max(remaining, 0)),
+            "x-ratelimit-reset": str(int(self._reset[resource])),
+            "x-ratelimit-used": str(self._used[resource]),
+            "x-ratelimit-resource": resource,
+        }
+        if remaining < 0:
+            self.requests["rate_limited"] += 1
+            return web.json_response(
+                {"message": "API rate limit exceeded"}, status=403, headers=headers
+            )
+
+        body = json.dumps(data).encode()
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        headers["ETag"] = etag
+        if request.headers.get("If-None-Match") == etag:
+            self.requests["not_modified"] += 1
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=body, content_type="application/json", headers=headers)
+
+    async def handle_search(self, request: web.Request) -> web.Response:
+        terms = shlex.split(request.query.get("q", ""))
+        repo_name = next(
+            (t.split(":", 1)[1] for t in terms if t.startswith("repo:")), None
+        )
+        repo = self.repos.get(repo_name)
+        numbers = repo.search(terms) if repo is not None else []
+
+        per_page = min(int(request.query.get("per_page", 30)), 100)
+        page = int(request.query.get("page", 1))
+        chunk = numbers[(page - 1) * per_page : page * per_page]
+
+        headers = {}
+        if page * per_page < len(numbers):
+            url = request.url.update_query(page=page + 1)
+            headers["Link"] = f'<{url}>; rel="next"'
+
+        base_url = self.base_url(request)
+        return await self.respond(
+            request,
+            "search",
+            {
+                "total_count": len(numbers),
+                "incomplete_results": False,
+                "items": [repo.issue(base_url, n) for n in chunk],
+            },
+            headers,
+        )
+
+    async def handle_pull(self, request: web.Request) -> web.Response:
+        repo = self.repo(request)
+        number = int(request.match_info["number"])
+        return await self.respond(
+            request, "pull", repo.pull(self.base_url(request), number)
+        )
+
+    async def handle_reviews(self, request: web.Request) -> web.Response:
+        repo = self.repo(request)
+        number = int(request.match_info["number"])
+        return await self.respond(request, "reviews", repo.review_list(number))
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(self.requests))
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> web.AppRunner:
+        """Serve the application, the URL is stored in ``url``."""
+        runner = web.AppRunner(self.app)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        port = runner.addresses[0][1]
+        self.url = f"http://{host}:{port}"
+        return runner
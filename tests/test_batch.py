@@ -0,0 +1,216 @@
+from datetime import datetime
+
+import aiohttp
+from dateutil.tz import tzlocal
+import pytest
+from typer.testing import CliRunner
+
+from fake_github import FakeGitHub, FakeRepo
+import mtng.cache
+from mtng.batch import Plan, Window, collect_batch, parse_window, render_reports
+from mtng.cache import ConditionalCache
+from mtng.cli import cli
+from mtng.collect import ReviewSummary, collect_repositories
+from mtng.github import GitHubClient
+from mtng.spec import Repository, Spec
+
+NOW = datetime(2022, 8, 15, tzinfo=tzlocal())
+
+
+def test_parse_window():
+    assert parse_window("2022-08-01", NOW) == Window(
+        datetime(2022, 8, 1, tzinfo=tzlocal()), NOW
+    )
+    assert parse_window("2022-08-01..2022-08-08", NOW) == Window(
+        datetime(2022, 8, 1, tzinfo=tzlocal()), datetime(2022, 8, 8, tzinfo=tzlocal())
+    )
+    with pytest.raises(ValueError):
+        parse_window("last week", NOW)
+
+
+def test_plan():
+    specs = [
+        Spec(
+            repos=[
+                Repository(name="a/a", do_reviewers=True),
+                Repository(name="b/b", filter_labels=["x"]),
+            ]
+        ),
+        Spec(
+            repos=[
+                Repository(name="a/a", do_merged_prs=False, do_recent_issues=True),
+                Repository(name="b/b", filter_labels=["y"]),
+            ]
+        ),
+    ]
+    plan = Plan.build(specs)
+
+    # a/a is shared, b/b is filtered differently
+    assert len(plan.repos) == 3
+    assert plan.keys[0][0] == plan.keys[1][0]
+    merged = plan.repos[plan.keys[0][0]]
+    assert merged.do_merged_prs and merged.do_recent_issues
+
+
+@pytest.mark.asyncio
+async def test_collect_batch():
+    shared = FakeRepo(name="shared/repo", size=40)
+    other = FakeRepo(name="other/repo", size=20)
+    server = FakeGitHub([shared, other])
+    runner = await server.start()
+
+    def repo(fake, **kwargs):
+        return Repository(
+            name=fake.name,
+            stale_label=fake.stale_label,
+            wip_label=fake.wip_label,
+            **kwargs,
+        )
+
+    specs = [
+        Spec(repos=[repo(shared, do_reviewers=True), repo(other)]),
+        Spec(repos=[repo(shared, do_merged_prs=False)]),
+    ]
+    window = Window(datetime(2022, 8, 1, tzinfo=tzlocal()), NOW)
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            gh = GitHubClient(
+                session, "mtng-test", base_url=server.url, cache=ConditionalCache()
+            )
+            data, contributions = await collect_batch(specs, [window], gh=gh)
+            batch_requests = dict(server.requests)
+
+            # the same as collecting the distinct repositories once
+            server.requests.clear()
+            mtng.cache.get_cache().clear()
+            await collect_repositories(
+                specs[0].repos,
+                since=window.since,
+                now=window.now,
+                gh=GitHubClient(session, "mtng-test", base_url=server.url),
+            )
+    finally:
+        await runner.cleanup()
+
+    assert batch_requests == dict(server.requests)
+    assert contributions == []
+
+    first, second = data[window]
+    assert list(first) == ["shared/repo", "other/repo"]
+    assert first["shared/repo"]["spec"].do_reviewers
+    assert len(first["shared/repo"]["merged_prs"]) > 0
+    for pr in first["shared/repo"]["merged_prs"]:
+        assert pr.review_summary == ReviewSummary.from_reviews(pr.reviews)
+        assert pr.review_summary is not None
+    assert second["shared/repo"]["merged_prs"] == []
+    # items are shared between the reports
+    assert first["shared/repo"]["open_prs"][0] is second["shared/repo"]["open_prs"][0]
+
+    reports = [(spec, report, window) for spec, report in zip(specs, data[window])]
+    latex = render_reports(reports, contributions, full_tex=False)
+    assert "shared/repo: PRs merged" in latex[0]
+    assert "No merged PRs" in latex[1]
+    assert render_reports(reports, contributions, full_tex=False, jobs=2) == latex
+
+
+@pytest.mark.asyncio
+async def test_collect_batch_windows():
+    fake = FakeRepo(name="shared/repo", size=40)
+    server = FakeGitHub([fake])
+    runner = await server.start()
+
+    repo = Repository(
+        name=fake.name,
+        stale_label=fake.stale_label,
+        wip_label=fake.wip_label,
+        do_merged_prs=False,
+        do_recent_issues=True,
+    )
+    specs = [Spec(repos=[repo]), Spec(repos=[repo.copy(update={"show_wip": True})])]
+    windows = [
+        Window(datetime(2022, 8, 1, tzinfo=tzlocal()), NOW),
+        Window(datetime(2022, 8, 8, tzinfo=tzlocal()), NOW),
+    ]
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            gh = GitHubClient(session, "mtng-test", base_url=server.url)
+            data, _ = await collect_batch(specs, windows, gh=gh)
+    finally:
+        await runner.cleanup()
+
+    # one shared search per collection key, whatever the number of windows
+    assert server.requests["search"] == 2
+
+    first, second = (data[window][0]["shared/repo"] for window in windows)
+    assert first["open_prs"][0] is second["open_prs"][0]
+    assert all(
+        windows[1].since.date() <= i.created_at.date() for i in second["recent_issues"]
+    )
+    assert len(second["recent_issues"]) < len(first["recent_issues"])
+
+
+def test_batch_http_settings(tmp_path):
+    configs = [tmp_path / "a.yml", tmp_path / "b.yml"]
+    configs[0].write_text("repos: []\n")
+    configs[1].write_text("repos: []\nhttp:\n  proxy: http://proxy.example.com:3128\n")
+
+    result = CliRunner().invoke(
+        cli,
+        [
+            "batch",
+            *map(str, configs),
+            "--window",
+            "2022-08-01",
+            "--output-dir",
+            str(tmp_path / "reports"),
+            "--token",
+            "token",
+        ],
+    )
+    assert result.exit_code != 0
+    assert "different http settings" in str(result.exception)
+
+
+@pytest.mark.asyncio
+async def test_collect_batch_overlapping_windows():
+    fake = FakeRepo(name="shared/repo", size=200, spacing=60)
+    server = FakeGitHub([fake])
+    runner = await server.start()
+
+    specs = [
+        Spec(
+            repos=[
+                Repository(
+                    name=fake.name,
+                    stale_label=fake.stale_label,
+                    wip_label=fake.wip_label,
+                )
+            ]
+        )
+    ]
+    first = Window(datetime(2022, 8, 1, tzinfo=tzlocal()), NOW)
+    second = Window(datetime(2022, 8, 6, tzinfo=tzlocal()), NOW)
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            gh = GitHubClient(session, "mtng-test", base_url=server.url)
+            await collect_batch(specs, [first], gh=gh)
+            single = dict(server.requests)
+
+            server.requests.clear()
+            mtng.cache.get_cache().clear()
+            data, _ = await collect_batch(specs, [first, second], gh=gh)
+    finally:
+        await runner.cleanup()
+
+    # the days of the second window are fetched only once
+    assert single["pull"] > 0
+    assert dict(server.requests) == single
+
+    merged = {
+        window: {pr.number for pr in data[window][0]["shared/repo"]["merged_prs"]}
+        for window in (first, second)
+    }
+    assert merged[second] < merged[first]
@@ -0,0 +1,81 @@
+from datetime import datetime, timezone
+from pathlib import Path
+import sys
+
+import aiohttp
+import pytest
+
+from fake_github import FakeGitHub, FakeRepo
+from mtng.cache import ConditionalCache
+from mtng.collect import collect_repositories
+from mtng.generate import generate_latex
+from mtng.github import GitHubClient
+from mtng.spec import Repository, Spec
+
+
+@pytest.mark.asyncio
+async def test_collect_from_fake_github():
+    repo = FakeRepo(name="bench/repo", size=250)
+    server = FakeGitHub([repo])
+    runner = await server.start()
+    spec = Spec(
+        repos=[
+            Repository(
+                name=repo.name,
+                stale_label=repo.stale_label,
+                wip_label=repo.wip_label,
+                do_recent_issues=True,
+            )
+        ]
+    )
+    since = datetime(2022, 8, 1, tzinfo=timezone.utc)
+    now = datetime(2022, 8, 15, tzinfo=timezone.utc)
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            gh = GitHubClient(
+                session,
+                "mtng-test",
+                base_url=server.url,
+                concurrency=4,
+                cache=ConditionalCache(),
+            )
+            data = await collect_repositories(spec.repos, since=since, now=now, gh=gh)
+    finally:
+        await runner.cleanup()
+
+    result = data[repo.name]
+    assert len(result["merged_prs"]) == 100
+    assert len(result["recent_issues"]) == 75
+    # WIP drafts are not listed
+    assert len(result["open_prs"]) == 75 - 5
+    assert all(len(pr.reviews) == 2 for pr in result["merged_prs"])
+
+    # one search page for merged PRs and two for open items, details and
+    # reviews for every PR
+    assert server.requests == {"search": 1 + 2, "pull": 175, "reviews": 175}
+
+    latex = generate_latex(
+        spec, data, since=since, now=now, contributions=[], full_tex=False
+    )
+    assert "Item 1: change the 1th thing \\& more" in latex
+
+
+def test_benchmark_runner(capsys):
+    sys.path.insert(0, str(Path(__file__).parent.parent / "benchmarks"))
+    try:
+        import bench_collect
+    finally:
+        sys.path.pop(0)
+
+    results = bench_collect.main(["--sizes", "10", "--latency", "0"])
+
+    assert [r.phase for r in results] == [
+        "collect (cold)",
+        "collect (warm)",
+        "render",
+    ]
+    assert results[0].requests["pull"] == 7
+    assert results[1].requests["not_modified"] == 16
+    assert all(r.peak_memory > 0 for r in results)
+    assert "mtng benchmark" in capsys.readouterr().out
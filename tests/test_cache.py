@@ -0,0 +1,123 @@
+from datetime import datetime, timezone
+
+import pytest
+from dateutil.tz import tzlocal
+from typer.testing import CliRunner
+
+import mtng.cache
+import mtng.metrics
+from mtng.cache import ConditionalCache, canonical_url, make_key, memoize
+from mtng.cli import cli
+
+
+def test_canonical_url():
+    assert (
+        canonical_url("https://API.github.com/search/issues?q=repo:a/b&per_page=100")
+        == canonical_url("/search/issues?per_page=100&q=repo%3Aa%2Fb")
+        == "/search/issues?per_page=100&q=repo%3Aa%2Fb"
+    )
+    assert canonical_url("http://localhost:8080/repos/a/b/pulls/1/") == (
+        "http://localhost:8080/repos/a/b/pulls/1"
+    )
+
+
+def test_stable_keys():
+    local = datetime(2022, 8, 1, 12, tzinfo=tzlocal())
+    utc = local.astimezone(timezone.utc)
+    assert make_key("fn", "a/b", start=local) == make_key("fn", "a/b", start=utc)
+    assert make_key("fn", ["x"], type="pr") != make_key("fn", ["x"], type="any")
+
+
+def test_endpoint_ttls():
+    assert mtng.cache.ttl("/search/issues?q=x") == mtng.cache.DEFAULT_TTLS["search"]
+    assert mtng.cache.ttl("/repos/a/b/pulls/1") == mtng.cache.DEFAULT_TTLS["pull"]
+    assert (
+        mtng.cache.ttl("https://api.github.com/repos/a/b/pulls/1/reviews")
+        == mtng.cache.DEFAULT_TTLS["reviews"]
+    )
+
+
+@pytest.mark.asyncio
+async def test_memoize_falsy_results():
+    calls = 0
+
+    @memoize(expire=60)
+    async def fetch(url):
+        nonlocal calls
+        calls += 1
+        return []
+
+    assert await fetch("/a") == []
+    assert await fetch("/a") == []
+    assert calls == 1
+
+    await fetch("/b")
+    assert calls == 2
+
+
+def test_size_limit(tmp_path):
+    mtng.cache.configure(directory=tmp_path, size_limit=2**20)
+    cache = mtng.cache.get_cache()
+    assert cache.size_limit == 2**20
+    assert cache.eviction_policy == "least-recently-used"
+
+
+def test_cache_commands(isolated_cache):
+    runner = CliRunner()
+    mtng.cache.get_cache().set("getitem:x", 1)
+
+    result = runner.invoke(cli, ["--cache-dir", str(isolated_cache), "cache", "stats"])
+    assert result.exit_code == 0, result.output
+    assert "getitem" in result.output
+
+    result = runner.invoke(cli, ["--cache-dir", str(isolated_cache), "cache", "clear"])
+    assert result.exit_code == 0, result.output
+    assert "Removed 1 entries" in result.output
+    assert len(mtng.cache.get_cache()) == 0
+
+
+@pytest.mark.asyncio
+async def test_memoize_compress():
+    @memoize(expire=60, compress=True)
+    async def fetch(url):
+        return {"url": url, "items": [1, 2]}
+
+    assert await fetch("/a") == {"url": "/a", "items": [1, 2]}
+    (key,) = list(mtng.cache.get_cache().iterkeys())
+    version, blob = mtng.cache.get_cache()[key]
+    assert version == mtng.cache.CACHE_SCHEMA_VERSION
+    assert mtng.cache.unpack(blob) == {"url": "/a", "items": [1, 2]}
+    assert await fetch("/a") == {"url": "/a", "items": [1, 2]}
+    assert mtng.metrics.current().memo["hits"] == 1
+
+
+def test_conditional_cache_projects_payloads():
+    pull = {
+        "number": 1,
+        "title": "A PR",
+        "body": "A long description",
+        "user": {"login": "a", "html_url": "https://example.com", "id": 1},
+        "labels": [{"name": "Stale", "color": "ededed"}],
+        "head": {"repo": {"full_name": "a/b", "description": "x" * 1000}},
+        "_links": {"self": {"href": "https://example.com"}},
+    }
+    cache = ConditionalCache()
+    cache["/repos/a/b/pulls/1"] = ('"abc"', None, pull, None)
+
+    etag, last_modified, data, more = cache["/repos/a/b/pulls/1"]
+    assert etag == '"abc"'
+    assert data == {
+        "number": 1,
+        "title": "A PR",
+        "user": {"login": "a", "html_url": "https://example.com"},
+        "labels": ["Stale"],
+    }
+
+    # other endpoints are stored as they are
+    cache["/other"] = (None, "yesterday", {"x": [1]}, None)
+    assert cache["/other"] == (None, "yesterday", {"x": [1]}, None)
+
+    # entries of another schema version are ignored
+    mtng.cache.get_cache()[ConditionalCache.prefix + "/old"] = ("e", None, {}, None)
+    with pytest.raises(KeyError):
+        cache["/old"]
@@ -0,0 +1,663 @@
+import asyncio
+from datetime import date, datetime, timezone
+import time
+from unittest.mock import patch
+import uuid
+
+import pytest
+import aiohttp
+import gidgethub.abc
+import diskcache
+from dateutil.tz import tzlocal
+from rich.progress import Progress
+
+import mtng.cache
+import mtng.collect
+from mtng.cache import ConditionalCache
+import mtng.github
+from fake_github import FakeGitHub as FakeGitHubServer, FakeRepo
+from mtng.collect import Issue, PullRequest
+from mtng.github import GitHubClient
+from mtng.snapshot import RepoSnapshot
+from mtng.spec import Repository
+
+
+def make_issue(number: int, prefix: str = "https://api.github.com/repos/a/b"):
+    return {
+        "title": f"Item {number}",
+        "user": {"login": "someone", "html_url": "https://example.com"},
+        "labels": [],
+        "html_url": "https://example.com",
+        "number": number,
+        "assignee": None,
+        "body": None,
+        "url": f"{prefix}/issues/{number}",
+        "updated_at": "2022-08-01T00:00:00+00:00",
+        "created_at": "2022-08-01T00:00:00+00:00",
+        "closed_at": None,
+        "pull_request": {"url": f"{prefix}/pulls/{number}"},
+    }
+
+
+class FakeGitHub(gidgethub.abc.GitHubAPI):
+    def __init__(self):
+        super().__init__("mtng-test")
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.urls = []
+
+    async def getitem(self, url):
+        self.urls.append(url)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.001)
+        self.in_flight -= 1
+        if url.endswith("/reviews"):
+            return []
+        number = int(url.rsplit("/", 1)[1])
+        prefix = url.rsplit("/pulls/", 1)[0]
+        return {**make_issue(number, prefix), "url": url}
+
+    async def _request(self, method, url, headers, body=b""):
+        raise NotImplementedError
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+
+@pytest.mark.asyncio
+async def test_get_pull_details_concurrent():
+    gh = FakeGitHub()
+    prefix = f"https://example.com/{uuid.uuid4()}"
+    items = [Issue.parse_obj(make_issue(n, prefix)) for n in range(20)]
+
+    prs = await mtng.collect.get_pull_details(gh, items)
+
+    assert [pr.number for pr in prs] == list(range(20))
+    assert all(pr.reviews == [] for pr in prs)
+    assert len(gh.urls) == 40
+    assert gh.max_in_flight > 1
+
+
+@pytest.mark.asyncio
+async def test_stream_pull_details_overlaps_paging():
+    gh = FakeGitHub()
+    prefix = f"https://example.com/{uuid.uuid4()}"
+    first_fetched = asyncio.Event()
+
+    async def getitem(url):
+        first_fetched.set()
+        return await FakeGitHub.getitem(gh, url)
+
+    gh.getitem = getitem
+
+    async def pages():
+        for n in range(5):
+            yield Issue.parse_obj(make_issue(n, prefix))
+        # the next page is only requested once details of the first are in flight
+        await asyncio.wait_for(first_fetched.wait(), timeout=5)
+        for n in range(5, 10):
+            yield Issue.parse_obj(make_issue(n, prefix))
+
+    progress = Progress()
+    prs = await mtng.collect.stream_pull_details(gh, pages(), progress=progress)
+
+    assert [pr.number for pr in prs] == list(range(10))
+    assert len(gh.urls) == 20
+    # the bars of a finished stream are removed
+    assert progress.tasks == []
+
+
+@pytest.mark.asyncio
+async def test_client_bounds_requests_in_flight():
+    in_flight = 0
+    max_in_flight = 0
+
+    async def request(self, method, url, headers, body=b""):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        return 200, {"content-type": "application/json"}, b"{}"
+
+    with patch("gidgethub.aiohttp.GitHubAPI._request", request):
+        async with aiohttp.ClientSession() as session:
+            gh = GitHubClient(session, "mtng-test", concurrency=3)
+            await asyncio.gather(*(gh.getitem(f"/items/{i}") for i in range(20)))
+
+    assert max_in_flight == 3
+
+
+@pytest.mark.asyncio
+async def test_collect_repositories_concurrent(monkeypatch):
+    in_flight = 0
+    max_in_flight = 0
+
+    async def fetch(*args, **kwargs):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return []
+
+    async def search(*args, **kwargs):
+        for item in await fetch():
+            yield item
+
+    monkeypatch.setattr("mtng.collect.get_merged_pulls", fetch)
+    monkeypatch.setattr("mtng.collect.get_open_issues", fetch)
+    monkeypatch.setattr("mtng.collect.iter_open_issues", search)
+
+    repos = [
+        Repository(name=f"org/repo{i}", stale_label="Stale", do_recent_issues=True)
+        for i in range(3)
+    ]
+    since = datetime(2022, 8, 1, tzinfo=tzlocal())
+    now = datetime(2022, 8, 11, tzinfo=tzlocal())
+    data = await mtng.collect.collect_repositories(repos, since=since, now=now, gh=None)
+
+    assert list(data.keys()) == [r.name for r in repos]
+    assert all(data[r.name]["spec"] is r for r in repos)
+    # one search for merged PRs and one for all open items per repo
+    assert max_in_flight == 6
+
+
+def make_graphql_node(number: int):
+    return {
+        "__typename": "PullRequest",
+        "title": f"PR {number}",
+        "number": number,
+        "url": f"https://github.com/a/b/pull/{number}",
+        "body": "",
+        "createdAt": "2022-08-01T00:00:00Z",
+        "updatedAt": "2022-08-02T00:00:00Z",
+        "closedAt": None,
+        "author": None,
+        "labels": {"nodes": [{"name": "Stale"}]},
+        "assignees": {"nodes": [{"login": "someone", "url": "https://example.com"}]},
+        "isDraft": False,
+        "reviewRequests": {
+            "nodes": [
+                {"requestedReviewer": {"login": "another", "url": "https://x.com"}},
+                # team review requests have no login
+                {"requestedReviewer": {}},
+            ]
+        },
+        "reviews": {
+            "nodes": [
+                {
+                    "author": {"login": "another", "url": "https://x.com"},
+                    "state": "APPROVED",
+                    "body": "",
+                    "submittedAt": "2022-08-02T00:00:00Z",
+                },
+                {
+                    "author": {"login": "someone", "url": "https://x.com"},
+                    "state": "PENDING",
+                    "body": "",
+                    "submittedAt": None,
+                },
+            ]
+        },
+    }
+
+
+@pytest.mark.asyncio
+async def test_graphql_merged_pulls():
+    class FakeGraphQL:
+        base_url = "https://api.github.com"
+
+        def __init__(self):
+            self.calls = []
+
+        async def graphql(self, document, *, endpoint, **variables):
+            self.calls.append(variables)
+            numbers = range(1, 51) if variables["cursor"] is None else range(51, 61)
+            return {
+                "search": {
+                    "pageInfo": {
+                        "hasNextPage": variables["cursor"] is None,
+                        "endCursor": "next",
+                    },
+                    "nodes": [make_graphql_node(n) for n in numbers],
+                }
+            }
+
+    gh = FakeGraphQL()
+    prs = await mtng.collect.get_merged_pulls_graphql(
+        gh,
+        "a/b",
+        datetime(2022, 8, 1),
+        datetime(2022, 8, 11),
+        without_labels=["backport"],
+    )
+
+    assert len(gh.calls) == 2
+    assert gh.calls[0]["query"] == (
+        'repo:a/b is:pr merged:2022-08-01..2022-08-11 -label:"backport"'
+    )
+    assert [pr.number for pr in prs] == list(range(1, 61))
+    pr = prs[0]
+    assert isinstance(pr, PullRequest)
+    assert pr.url == "https://api.github.com/repos/a/b/pulls/1"
+    assert pr.user.login == "ghost"
+    assert pr.assignee.login == "someone"
+    assert [u.login for u in pr.requested_reviewers] == ["another"]
+    assert [r.state for r in pr.reviews] == ["APPROVED"]
+
+
+class ScriptedClient(GitHubClient):
+    """Client that answers from a list of responses and does not sleep."""
+
+    def __init__(self, session, responses, **kwargs):
+        super().__init__(session, "mtng-test", **kwargs)
+        self.responses = list(responses)
+        self.urls = []
+        self.sleeps = []
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+
+
+async def scripted_request(self, method, url, headers, body=b""):
+    self.urls.append(url)
+    return self.responses.pop(0)
+
+
+@pytest.mark.asyncio
+async def test_client_retries_secondary_rate_limit():
+    json_headers = {"content-type": "application/json"}
+    responses = [
+        (403, {**json_headers, "retry-after": "3"}, b'{"message": "slow down"}'),
+        (
+            403,
+            json_headers,
+            b'{"message": "You have exceeded a secondary rate limit"}',
+        ),
+        (200, json_headers, b'{"ok": true}'),
+    ]
+
+    with patch("gidgethub.aiohttp.GitHubAPI._request", scripted_request):
+        async with aiohttp.ClientSession() as session:
+            gh = ScriptedClient(session, responses)
+            assert await gh.getitem("/repos/a/b") == {"ok": True}
+
+    assert gh.sleeps == [3.0, mtng.github.SECONDARY_BACKOFF * 2]
+
+
+@pytest.mark.asyncio
+async def test_client_paces_rate_limit_buckets():
+    reset = time.time() + 30
+
+    def headers(resource, remaining):
+        return {
+            "content-type": "application/json",
+            "x-ratelimit-limit": "30",
+            "x-ratelimit-remaining": str(remaining),
+            "x-ratelimit-reset": str(reset),
+            "x-ratelimit-resource": resource,
+        }
+
+    responses = [
+        (200, headers("search", 0), b"{}"),
+        (200, headers("core", 100), b"{}"),
+        (200, headers("search", 29), b"{}"),
+    ]
+
+    with patch("gidgethub.aiohttp.GitHubAPI._request", scripted_request):
+        async with aiohttp.ClientSession() as session:
+            gh = ScriptedClient(session, responses)
+            await gh.getitem("/search/issues?q=a")
+            await gh.getitem("/repos/a/b/pulls/1")
+            assert gh.sleeps == []
+            await gh.getitem("/search/issues?q=b")
+
+    # only the second search request has to wait for the search limit to reset
+    assert len(gh.sleeps) == 1
+    assert 25 < gh.sleeps[0] <= 31
+    assert gh.buckets["search"].remaining == 29
+    assert gh.buckets["core"].remaining == 100
+
+
+@pytest.mark.asyncio
+async def test_client_conditional_requests(tmp_path):
+    json_headers = {"content-type": "application/json"}
+    responses = [
+        (200, {**json_headers, "etag": '"abc"'}, b'{"number": 1}'),
+        (304, {"etag": '"abc"'}, b""),
+    ]
+    sent_headers = []
+
+    async def request(self, method, url, headers, body=b""):
+        sent_headers.append(dict(headers))
+        return self.responses.pop(0)
+
+    with diskcache.Cache(tmp_path) as cache:
+        with patch("gidgethub.aiohttp.GitHubAPI._request", request):
+            async with aiohttp.ClientSession() as session:
+                gh = ScriptedClient(session, responses, cache=ConditionalCache(cache))
+                assert await gh.getitem("/repos/a/b/pulls/1") == {"number": 1}
+                assert await gh.getitem("/repos/a/b/pulls/1") == {"number": 1}
+
+        assert list(ConditionalCache(cache)) == ["/repos/a/b/pulls/1"]
+
+    assert "if-none-match" not in sent_headers[0]
+    assert sent_headers[1]["if-none-match"] == '"abc"'
+
+
+@pytest.mark.asyncio
+async def test_incremental_snapshot(tmp_path):
+    gh = FakeGitHub()
+    prefix = f"https://example.com/{uuid.uuid4()}"
+    items = [Issue.parse_obj(make_issue(n, prefix)) for n in range(5)]
+
+    snapshot = RepoSnapshot.load("a/b", directory=tmp_path)
+    prs = await mtng.collect.get_pull_details(gh, items, snapshot=snapshot)
+    assert len(gh.urls) == 10
+    for pr in prs[:4]:
+        snapshot.update(pr)
+    snapshot.save()
+
+    snapshot = RepoSnapshot.load("a/b", directory=tmp_path)
+    assert sorted(snapshot.pulls) == [0, 1, 2, 3]
+
+    items[1].updated_at = datetime(2022, 8, 5, tzinfo=tzlocal())
+    gh.urls = []
+    mtng.cache.clear()
+    prs = await mtng.collect.get_pull_details(gh, items, snapshot=snapshot)
+
+    # item 1 was updated, item 4 is not in the snapshot
+    assert sorted(gh.urls) == sorted(
+        [f"{prefix}/pulls/{n}{suffix}" for n in (1, 4) for suffix in ("", "/reviews")]
+    )
+    assert [pr.number for pr in prs] == list(range(5))
+
+
+def test_plan_and_classify_open_items():
+    repo = Repository(
+        name="a/b",
+        stale_label="Stale",
+        wip_label="WIP",
+        do_recent_issues=True,
+        needs_discussion_label="Discuss",
+    )
+    since = datetime(2022, 8, 1, tzinfo=tzlocal())
+    now = datetime(2022, 8, 11, tzinfo=tzlocal())
+    OpenQuery = mtng.collect.OpenQuery
+
+    def plan(repo):
+        queries = mtng.collect.section_queries(repo, since, now)
+        return mtng.collect.plan_open_queries(queries)
+
+    assert plan(repo) == [OpenQuery("any")]
+    assert plan(Repository(name="a/b")) == [OpenQuery("pr")]
+    assert plan(Repository(name="a/b", do_open_prs=False)) == []
+    # a single section keeps its own qualifiers
+    assert plan(Repository(name="a/b", do_open_prs=False, do_recent_issues=True)) == [
+        OpenQuery("issue", start=since, end=now)
+    ]
+    # only labelled sections are served by label-filtered searches
+    assert plan(
+        Repository(
+            name="a/b",
+            do_open_prs=False,
+            stale_label="Stale",
+            needs_discussion_label="Discuss",
+        )
+    ) == [
+        OpenQuery("any", with_labels=("Stale",)),
+        OpenQuery("issue", with_labels=("Discuss",)),
+    ]
+
+    def item(number, labels=[], pr=False, created="2022-07-01T00:00:00+00:00"):
+        obj = make_issue(number)
+        obj["labels"] = [{"name": l} for l in labels]
+        obj["created_at"] = created
+        if not pr:
+            obj["pull_request"] = None
+        return Issue.parse_obj(obj)
+
+    items = [
+        item(1, pr=True),
+        item(2, ["WIP"], pr=True),
+        item(3, ["Stale"], pr=True),
+        item(4, ["Stale", "Discuss"]),
+        item(5, created="2022-08-05T00:00:00+00:00"),
+        item(6),
+    ]
+    sections = mtng.collect.classify_open_items(repo, items, since=since, now=now)
+
+    numbers = {k: [i.number for i in v] for k, v in sections.items()}
+    assert numbers == {
+        "open_prs": [1, 3],
+        "stale": [3, 4],
+        "recent_issues": [5],
+        "needs_discussion": [4],
+    }
+    # shared between sections
+    assert sections["open_prs"][1] is sections["stale"][0]
+
+
+@pytest.mark.asyncio
+async def test_open_item_searches(monkeypatch):
+    repo = FakeRepo(name="a/b", size=200)
+    server = FakeGitHubServer([repo])
+    runner = await server.start()
+    since = datetime(2022, 8, 1, tzinfo=tzlocal())
+    now = datetime(2022, 8, 11, tzinfo=tzlocal())
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            gh = GitHubClient(session, "mtng-test", base_url=server.url)
+
+            async def collect(spec):
+                server.requests.clear()
+                mtng.cache.clear()
+                data = await mtng.collect.collect_repository(
+                    spec, since=since, now=now, gh=gh
+                )
+                numbers = {
+                    k: sorted(i.number for i in v)
+                    for k, v in data.items()
+                    if k not in ("spec", "merged_prs")
+                }
+                return numbers, dict(server.requests)
+
+            # the stale section alone uses a label-filtered search
+            stale_only = Repository(
+                name=repo.name,
+                stale_label=repo.stale_label,
+                do_open_prs=False,
+                do_merged_prs=False,
+            )
+            numbers, requests = await collect(stale_only)
+            assert requests == {"search": 1}
+            assert len(numbers["stale"]) > 0
+
+            # more open items than a search returns: per section searches
+            full = stale_only.copy(update={"do_open_prs": True})
+            expected, requests = await collect(full)
+            assert requests["search"] == 2
+
+            monkeypatch.setattr(mtng.collect, "SEARCH_RESULT_LIMIT", 100)
+            numbers, requests = await collect(full)
+            assert numbers == expected
+            # the first page of the shared search, then one search per section
+            assert requests["search"] == 1 + 2
+    finally:
+        await runner.cleanup()
+
+
+def test_compact_models():
+    obj = make_issue(1)
+    obj["labels"] = [{"name": "Stale", "color": "ededed", "id": 1}]
+    obj["body"] = "A long description"
+    obj["assignee"] = {"login": "someone", "html_url": "https://example.com"}
+    obj["pull_request"] = {
+        "url": obj["pull_request"]["url"],
+        "diff_url": "https://example.com/1.diff",
+    }
+
+    issue = Issue.parse_obj(obj)
+    assert issue.labels == frozenset(["Stale"])
+    assert issue.pull_request == {"url": obj["pull_request"]["url"]}
+    assert issue.user is issue.assignee
+
+    pr = PullRequest.parse_obj(
+        {
+            **obj,
+            "requested_reviewers": [obj["user"]],
+            "reviews": [
+                {
+                    "user": obj["user"],
+                    "state": "APPROVED",
+                    "body": "LGTM",
+                    "submitted_at": "2022-08-01T00:00:00+00:00",
+                }
+            ],
+        }
+    )
+    # shared between items
+    assert pr.user is issue.user
+    assert pr.requested_reviewers[0] is pr.reviews[0].user is issue.user
+    # not shown in the report
+    assert pr.body is None
+    assert not hasattr(pr.reviews[0], "body")
+
+    # round trip through snapshots
+    assert PullRequest.parse_raw(pr.json()).labels == pr.labels
+
+
+def test_classify_drops_bodies():
+    repo = Repository(
+        name="a/b", do_recent_issues=True, needs_discussion_label="Discuss"
+    )
+
+    def item(number, labels):
+        obj = make_issue(number)
+        obj["labels"] = [{"name": l} for l in labels]
+        obj["body"] = f"Body {number}"
+        obj["pull_request"] = None
+        return Issue.parse_obj(obj)
+
+    items = [item(1, ["Discuss"]), item(2, [])]
+    mtng.collect.classify_open_items(
+        repo,
+        items,
+        since=datetime(2022, 7, 1, tzinfo=tzlocal()),
+        now=datetime(2022, 8, 11, tzinfo=tzlocal()),
+    )
+    assert [i.body for i in items] == ["Body 1", None]
+
+
+def test_projection_covers_models():
+    from mtng.collect import Review
+    from mtng.projection import ISSUE_FIELDS, PULL_FIELDS, REVIEW_FIELDS
+
+    computed = {"is_wip", "is_stale", "review_summary"}
+    assert set(Issue.__fields__) - computed == set(ISSUE_FIELDS)
+    assert set(PullRequest.__fields__) - computed - {"reviews"} == set(PULL_FIELDS) | {
+        "body"
+    }
+    assert set(Review.__fields__) == set(REVIEW_FIELDS)
+
+
+def test_day_ranges():
+    days = [date(2022, 8, d) for d in (1, 2, 3, 5, 7, 8)]
+    assert mtng.collect.day_ranges(days) == [
+        (date(2022, 8, 1), date(2022, 8, 3)),
+        (date(2022, 8, 5), date(2022, 8, 5)),
+        (date(2022, 8, 7), date(2022, 8, 8)),
+    ]
+    now = datetime(2022, 8, 10, 12, tzinfo=timezone.utc)
+    assert mtng.collect.is_final(date(2022, 8, 9), now)
+    assert not mtng.collect.is_final(date(2022, 8, 10), now)
+
+
+@pytest.mark.asyncio
+async def test_merged_pulls_by_day():
+    repo = FakeRepo(name="a/b", size=120, spacing=60)
+    server = FakeGitHubServer([repo])
+    runner = await server.start()
+
+    def window(first, last):
+        return (
+            datetime(2022, 8, first, tzinfo=timezone.utc),
+            datetime(2022, 8, last, tzinfo=timezone.utc),
+        )
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            gh = GitHubClient(session, "mtng-test", base_url=server.url)
+
+            async def merged(first, last):
+                server.requests.clear()
+                prs = await mtng.collect.get_merged_pulls(
+                    gh, repo.name, *window(first, last)
+                )
+                return {pr.number for pr in prs}, dict(server.requests)
+
+            first, requests = await merged(1, 4)
+            assert requests["search"] > 0
+            assert {repo.merged_on(n) for n in first} == {
+                date(2022, 8, 3),
+                date(2022, 8, 4),
+            }
+
+            # all days are cached
+            assert await merged(1, 4) == (first, {})
+
+            # only the days that have not been seen are queried
+            second, requests = await merged(3, 8)
+            expected = {
+                n
+                for n in range(1, repo.size + 1)
+                if repo.kind(n) == "merged"
+                and date(2022, 8, 3) <= repo.merged_on(n) <= date(2022, 8, 8)
+            }
+            assert second == expected
+            assert requests["pull"] == len(
+                {n for n in expected if repo.merged_on(n) > date(2022, 8, 4)}
+            )
+    finally:
+        await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_merged_by_day_overlapping_cache():
+    def merged(number, day):
+        obj = make_issue(number)
+        obj["merged_at"] = f"2022-08-{day:02d}T12:00:00+00:00"
+        return PullRequest.parse_obj(obj)
+
+    async def by_day(first, last, prs):
+        ranges = []
+
+        async def fetch(start, end):
+            ranges.append((start, end))
+            return prs
+
+        result = await mtng.collect.merged_by_day(
+            "a/b",
+            datetime(2022, 8, first, tzinfo=timezone.utc),
+            datetime(2022, 8, last, tzinfo=timezone.utc),
+            with_labels=[],
+            without_labels=[],
+            fetch=fetch,
+        )
+        return [pr.number for pr in result], ranges
+
+    assert await by_day(1, 2, [merged(1, 1), merged(2, 2)]) == (
+        [1, 2],
+        [(date(2022, 8, 1), date(2022, 8, 2))],
+    )
+
+    # the search for days 3 and 4 also returns a PR of the cached day 2, and
+    # one outside of the window
+    numbers, ranges = await by_day(
+        1, 4, [merged(2, 2), merged(3, 3), merged(4, 4), merged(9, 9)]
+    )
+    assert ranges == [(date(2022, 8, 3), date(2022, 8, 4))]
+    assert numbers == [1, 2, 3, 4]
@@ -1,6 +1,7 @@
 from asyncio.subprocess import STDOUT
 import itertools
 from re import sub
+import re
 import shutil
 from unittest.mock import Mock
 import asyncio
@@ -20,7 +21,55 @@ from dateutil.tz import tzlocal
 import mtng.collect
 from mtng.generate import generate_latex, env
 from mtng.spec import Repository, Spec
-from mtng.collect import Label, PullRequest, Issue, Review, User, get_open_pulls
+from mtng.collect import (
+    Label,
+    PullRequest,
+    Issue,
+    Review,
+    User,
+    iter_open_issues,
+    stream_pull_details,
+)
+
+
+def reference_data():
+    """
+    Mocks serving the reference data. The open items search streams the union
+    of the stale items, open PRs and recent issues.
+    """
+    ref = Path(__file__).parent / "ref"
+
+    def load(file: str, cls):
+        with (ref / file).open() as fh:
+            return [cls.parse_obj(o) for o in json.load(fh)]
+
+    def get_file_content(file: str, cls):
+        f = asyncio.Future()
+        f.set_result(load(file, cls))
+        return f
+
+    def get_open_items(*args, **kwargs):
+        items = {}
+        for file in "stale.json", "open_prs.json", "recent_issues.json":
+            for item in load(file, Issue):
+                if file == "open_prs.json":
+                    item.pull_request = {"url": item.url}
+                items.setdefault(item.number, item)
+
+        async def iterate():
+            for item in items.values():
+                yield item
+
+        return iterate()
+
+    async def get_pull_details(gh, items, **kwargs):
+        pulls = {pr.number: pr for pr in load("open_prs.json", PullRequest)}
+        return [
+            pulls.get(item.number, PullRequest.parse_obj(item.dict()))
+            async for item in items
+        ]
+
+    return get_file_content, get_open_items, get_pull_details
 
 
 @pytest.mark.asyncio
@@ -35,32 +84,19 @@ async def test_generate(monkeypatch: pytest.MonkeyPatch, tmp_path):
 
     ref = Path(__file__).parent / "ref"
 
-    def get_file_content(file: str, cls):
-        f = asyncio.Future()
-        with (ref / file).open() as fh:
-            f.set_result([cls.parse_obj(o) for o in json.load(fh)])
-        return f
+    get_file_content, get_open_items, get_pull_details = reference_data()
 
     monkeypatch.setattr(
         "mtng.collect.get_merged_pulls",
         Mock(return_value=get_file_content("merged_prs.json", PullRequest)),
     )
     monkeypatch.setattr(
-        "mtng.collect.get_open_issues",
-        Mock(
-            side_effect=[
-                get_file_content("stale.json", Issue),
-                get_file_content("recent_issues.json", Issue),
-            ]
-        ),
+        "mtng.collect.iter_open_issues",
+        Mock(side_effect=get_open_items),
     )
     monkeypatch.setattr(
-        "mtng.collect.get_open_pulls",
-        Mock(
-            side_effect=[
-                get_file_content("open_prs.json", Issue),
-            ]
-        ),
+        "mtng.collect.stream_pull_details",
+        Mock(side_effect=get_pull_details),
     )
     since = datetime(2022, 8, 1, tzinfo=tzlocal())
     now = datetime(2022, 8, 11, tzinfo=tzlocal())
@@ -86,6 +122,69 @@ async def test_generate(monkeypatch: pytest.MonkeyPatch, tmp_path):
     assert output == ref_file.read_text(), str(act_file)
 
 
+@pytest.mark.asyncio
+async def test_generate_fragments(monkeypatch: pytest.MonkeyPatch, tmp_path):
+    from mtng.generate import fragment_path, generate_fragments
+
+    repo = Repository(
+        name="acts-project/acts",
+        stale_label="Stale",
+        wip_label=":construction: WIP",
+    )
+
+    get_file_content, get_open_items, get_pull_details = reference_data()
+    monkeypatch.setattr(
+        "mtng.collect.get_merged_pulls",
+        Mock(return_value=get_file_content("merged_prs.json", PullRequest)),
+    )
+    monkeypatch.setattr(
+        "mtng.collect.iter_open_issues", Mock(side_effect=get_open_items)
+    )
+    monkeypatch.setattr(
+        "mtng.collect.stream_pull_details", Mock(side_effect=get_pull_details)
+    )
+    since = datetime(2022, 8, 1, tzinfo=tzlocal())
+    now = datetime(2022, 8, 11, tzinfo=tzlocal())
+    result = await mtng.collect.collect_repositories(
+        [repo], since=since, now=now, gh=Mock()
+    )
+
+    def generate(result):
+        return generate_fragments(
+            Spec(repos=[r["spec"] for r in result.values()]),
+            result,
+            since=since,
+            now=now,
+            contributions=[],
+            full_tex=False,
+            directory=tmp_path,
+        )
+
+    output = generate(result)
+    fragment = fragment_path(tmp_path, repo.name)
+    assert (tmp_path / "main.tex").read_text() == output + "\n"
+    assert f"\\input{{{fragment.resolve().as_posix()}}}" in output
+
+    # with the fragment inlined, the output matches the monolithic one
+    inlined = output.replace(
+        f"\\input{{{fragment.resolve().as_posix()}}}", fragment.read_text()
+    )
+    reference = (Path(__file__).parent / "ref" / "reference.tex").read_text()
+    assert inlined.split() == reference.split()
+
+    # unchanged fragments are not rewritten
+    os.utime(fragment, (0, 0))
+    generate(result)
+    assert fragment.stat().st_mtime == 0
+
+    other = repo.copy(update={"name": "acts-project/other", "do_recent_issues": True})
+    result["acts-project/other"] = {**result[repo.name], "spec": other}
+    output = generate(result)
+    assert fragment.stat().st_mtime == 0
+    assert fragment_path(tmp_path, other.name).exists()
+    assert output.count("\\input{") == 2
+
+
 @pytest.mark.asyncio
 async def test_collect(tmp_path):
     repo = Repository(
@@ -126,10 +225,11 @@ async def test_get_open_pulls():
 
     async with aiohttp.ClientSession(loop=asyncio.get_event_loop()) as session:
         gh = GitHubAPI(session, __name__, oauth_token=os.environ["GH_TOKEN"])
-        open_prs = await get_open_pulls(
+        open_prs = await stream_pull_details(
             gh,
-            repo.name,
-            without_labels=repo.filter_labels,
+            iter_open_issues(
+                gh, repo.name, without_labels=repo.filter_labels, type="pr"
+            ),
         )
 
         for pr in open_prs:
@@ -158,32 +258,19 @@ async def test_compile(monkeypatch, full_tex, tmp_path):
 
     ref = Path(__file__).parent / "ref"
 
-    def get_file_content(file: str, cls):
-        f = asyncio.Future()
-        with (ref / file).open() as fh:
-            f.set_result([cls.parse_obj(o) for o in json.load(fh)])
-        return f
+    get_file_content, get_open_items, get_pull_details = reference_data()
 
     monkeypatch.setattr(
         "mtng.collect.get_merged_pulls",
         Mock(return_value=get_file_content("merged_prs.json", PullRequest)),
     )
     monkeypatch.setattr(
-        "mtng.collect.get_open_issues",
-        Mock(
-            side_effect=[
-                get_file_content("stale.json", Issue),
-                get_file_content("recent_issues.json", Issue),
-            ]
-        ),
+        "mtng.collect.iter_open_issues",
+        Mock(side_effect=get_open_items),
     )
     monkeypatch.setattr(
-        "mtng.collect.get_open_pulls",
-        Mock(
-            side_effect=[
-                get_file_content("open_prs.json", Issue),
-            ]
-        ),
+        "mtng.collect.stream_pull_details",
+        Mock(side_effect=get_pull_details),
     )
 
     gh = Mock()
@@ -390,3 +477,143 @@ def test_sanitization(try_render, prob):
     spec = Repository(name="acts-project/acts")
 
     assert try_render(ctpl.render(item=item, spec=spec, mode="MERGED"))
+
+
+def test_template_bytecode_cache():
+    from jinja2 import DictLoader, Environment
+
+    import mtng.cache
+    from mtng.generate import TemplateBytecodeCache
+
+    templates = {"main.tex": "Hello {{ name }}"}
+
+    def render():
+        cached = Environment(
+            loader=DictLoader(templates), bytecode_cache=TemplateBytecodeCache()
+        )
+        return cached.get_template("main.tex").render(name="World")
+
+    assert render() == "Hello World"
+    files = list((mtng.cache.cache_dir() / "jinja").iterdir())
+    assert len(files) == 1
+    assert render() == "Hello World"
+
+    # changed sources are compiled again
+    templates["main.tex"] = "Goodbye {{ name }}"
+    assert render() == "Goodbye World"
+
+
+def test_repo_report():
+    from mtng.collect import ReviewSummary
+    from mtng.generate import RepoReport
+
+    def make(number, updated, **kwargs):
+        return PullRequest(
+            title=f"PR {number}",
+            user=User(login="someone", html_url="https://example.com"),
+            labels=[],
+            number=number,
+            html_url="https://example.com",
+            url="https://example.com",
+            assignee=None,
+            body=None,
+            updated_at=datetime(2022, 8, updated),
+            created_at=datetime(2022, 7, 1),
+            closed_at=datetime(2022, 8, 20 - updated),
+            **kwargs,
+        )
+
+    prs = [make(1, 3), make(2, 5, is_wip=True), make(3, 4), make(4, 1)]
+    report = RepoReport.build(
+        {
+            "spec": Repository(name="acts-project/acts"),
+            "needs_discussion": [],
+            "merged_prs": prs,
+            "open_prs": prs,
+            "recent_issues": [],
+            "stale": prs,
+        },
+        since=datetime(2022, 8, 2),
+    )
+
+    assert [pr.number for pr in report.merged_prs] == [2, 3, 1, 4]
+    assert [pr.number for pr in report.open_prs] == [3, 1, 4, 2]
+    assert [pr.number for pr in report.stale] == [2, 3, 1, 4]
+    assert [pr.number for pr in report.newly_stale] == [1, 2, 3]
+
+    def review(login, state):
+        return Review(
+            user=User(login=login, html_url="https://example.com"),
+            state=state,
+            body="",
+            submitted_at=datetime(2022, 8, 1),
+        )
+
+    assert make(5, 1).review_summary is None
+    summary = make(
+        6,
+        1,
+        reviews=[
+            review("a", "APPROVED"),
+            review("b", "COMMENTED"),
+            review("c", "APPROVED"),
+            review("d", "CHANGES_REQUESTED"),
+        ],
+    ).review_summary
+    assert summary == ReviewSummary(
+        state="APPROVED", user=User(login="c", html_url="https://example.com")
+    )
+    summary = make(
+        7, 1, reviews=[review("b", "COMMENTED"), review("d", "CHANGES_REQUESTED")]
+    ).review_summary
+    assert (summary.state, summary.user.login) == ("COMMENTED", "b")
+    summary = make(8, 1, reviews=[review("d", "CHANGES_REQUESTED")]).review_summary
+    assert (summary.state, summary.user.login) == ("CHANGES_REQUESTED", "d")
+
+
+def regex_sanitize(s):
+    # The original implementation, which the translation table has to match
+    def repl(m):
+        return {
+            "_": "\\_",
+            "%": "\\%",
+            "#": "\\#",
+            "$": "\\$",
+            "&": "\\&",
+            "<": "\\textless{}",
+            ">": "\\textgreater{}",
+            "\\": "\\textbackslash{}",
+            "{": "\\{",
+            "}": "\\}",
+            "^": "\\textasciicircum{}",
+        }[m.group(0)]
+
+    return re.sub(r"[\\^_{}&$%#<>%]", repl, s)
+
+
+@pytest.mark.parametrize(
+    "prob", prob + [a + b for a, b in itertools.combinations_with_replacement(prob, 2)]
+)
+def test_sanitize_matches_regex(prob):
+    from mtng.generate import sanitize
+
+    for s in (
+        prob,
+        f"feat: I'm{prob} a {prob}PR: {prob} ",
+        f"someone_{prob}",
+        f"body {prob}\n" * 100,
+    ):
+        assert sanitize(s) == regex_sanitize(s)
+
+
+def test_sanitize_random():
+    import random
+
+    from mtng.generate import sanitize
+
+    rng = random.Random(42)
+    alphabet = "".join(prob) + "ab c\n\t\0ä€🚀"
+    for length in [0, 1, 10, 255, 256, 257, 5000]:
+        for _ in range(20):
+            s = "".join(rng.choice(alphabet) for _ in range(length))
+            assert sanitize(s) == regex_sanitize(s)
@@ -0,0 +1,72 @@
+import asyncio
+
+import aiohttp
+from aiohttp import web
+import pydantic
+import pytest
+
+from mtng.http import create_session
+from mtng.spec import HttpSettings, Spec
+
+
+@pytest.mark.asyncio
+async def test_create_session_settings():
+    settings = HttpSettings(
+        connection_limit=20,
+        connection_limit_per_host=5,
+        connect_timeout=3,
+        read_timeout=7,
+        keepalive_timeout=15,
+        proxy="http://proxy.example.com:3128",
+    )
+    async with create_session(settings) as session:
+        assert session.connector.limit == 20
+        assert session.connector.limit_per_host == 5
+        assert session.timeout.connect == 3
+        assert session.timeout.sock_read == 7
+        assert session.timeout.total is None
+        assert session.trust_env is False
+
+    async with create_session() as session:
+        assert session.trust_env is True
+        assert session.timeout.sock_read == HttpSettings().read_timeout
+
+
+@pytest.mark.asyncio
+async def test_read_timeout():
+    async def handle(request):
+        await asyncio.sleep(1)
+        return web.json_response({})
+
+    app = web.Application()
+    app.add_routes([web.get("/slow", handle)])
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    url = f"http://127.0.0.1:{runner.addresses[0][1]}/slow"
+
+    try:
+        async with create_session(HttpSettings(read_timeout=0.1)) as session:
+            with pytest.raises(asyncio.TimeoutError):
+                async with session.get(url) as response:
+                    await response.json()
+    finally:
+        await runner.cleanup()
+
+
+def test_spec_http_settings():
+    spec = Spec.parse_obj(
+        {
+            "repos": [{"name": "acts-project/acts"}],
+            "http": {"read_timeout": 30, "connection_limit_per_host": 8},
+        }
+    )
+    assert spec.http.read_timeout == 30
+    assert spec.http.connection_limit_per_host == 8
+    assert spec.http.connect_timeout == HttpSettings().connect_timeout
+
+    assert Spec.parse_obj({"repos": []}).http == HttpSettings()
+
+    with pytest.raises(pydantic.ValidationError):
+        Spec.parse_obj({"repos": [], "http": {"timeout": 30}})
@@ -0,0 +1,142 @@
+import asyncio
+from datetime import datetime
+import hashlib
+import json
+
+import aiohttp
+from aiohttp import web
+import pytest
+
+from mtng.cache import ConditionalCache
+from mtng.indico import export_url, get_agenda
+
+
+def make_event(event_id: int, titles):
+    return {
+        "results": [
+            {
+                "contributions": [
+                    {
+                        "title": title,
+                        "speakers": [{"first_name": "Jane", "last_name": "Doe"}],
+                        "startDate": {
+                            "date": "2022-08-11",
+                            "time": f"{10 + i:02d}:{event_id:02d}:00",
+                        },
+                        "url": f"https://indico.example.com/event/{event_id}/{i}",
+                    }
+                    for i, title in enumerate(titles)
+                ]
+            }
+        ]
+    }
+
+
+class FakeIndico:
+    def __init__(self, events, latency: float = 0.05):
+        self.events = events
+        self.latency = latency
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.app = web.Application()
+        self.app.add_routes([web.get("/export/event/{id}.json", self.handle)])
+
+    async def handle(self, request):
+        self.requests.append(request.path)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.latency)
+        self.in_flight -= 1
+
+        assert request.query["detail"] == "contributions"
+        body = json.dumps(self.events[int(request.match_info["id"])]).encode()
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(
+            body=body, content_type="application/json", headers={"ETag": etag}
+        )
+
+    async def __aenter__(self):
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.url = f"http://127.0.0.1:{self.runner.addresses[0][1]}"
+        return self
+
+    async def __aexit__(self, *args):
+        await self.runner.cleanup()
+
+
+def test_export_url():
+    assert (
+        export_url("https://indico.cern.ch/event/1234/")
+        == "https://indico.cern.ch/export/event/1234.json?detail=contributions"
+    )
+    assert (
+        export_url("http://example.com/indico/event/7/timetable")
+        == "http://example.com/indico/export/event/7.json?detail=contributions"
+    )
+    with pytest.raises(ValueError):
+        export_url("https://example.com/category/7")
+
+
+@pytest.mark.asyncio
+async def test_get_agenda():
+    events = {
+        1: make_event(1, ["Introduction", "Tracking", "Vertexing"]),
+        2: make_event(2, ["Intro", "Seeding"]),
+    }
+    async with FakeIndico(events) as indico:
+        urls = [f"{indico.url}/event/1/", f"{indico.url}/event/2"]
+        cache = ConditionalCache()
+
+        async with aiohttp.ClientSession() as session:
+            contributions = await get_agenda(session, urls, cache=cache)
+            assert indico.max_in_flight == 2
+
+            # revalidated with the stored ETag, served from the cache
+            again = await get_agenda(session, urls, cache=cache)
+
+    assert [c["title"] for c in contributions] == ["Tracking", "Seeding", "Vertexing"]
+    assert contributions[0] == {
+        "title": "Tracking",
+        "speakers": ["Jane Doe"],
+        "start_date": datetime(2022, 8, 11, 11, 1),
+        "url": "https://indico.example.com/event/1/1",
+    }
+    assert again == contributions
+    assert len(indico.requests) == 4
+    assert len(list(cache)) == 2
+
+
+@pytest.mark.asyncio
+async def test_collect_report_overlaps_agenda(monkeypatch):
+    import mtng.collect
+    from mtng.spec import Repository
+
+    started = asyncio.Event()
+
+    async def collect_repositories(repos, **kwargs):
+        # the agenda is fetched while the repositories are collected
+        await asyncio.wait_for(started.wait(), timeout=5)
+        return {}
+
+    async def get_agenda(session, events, cache=None):
+        started.set()
+        return [{"title": "Tracking"}]
+
+    monkeypatch.setattr("mtng.collect.collect_repositories", collect_repositories)
+    monkeypatch.setattr("mtng.collect.get_agenda", get_agenda)
+
+    data, contributions = await mtng.collect.collect_report(
+        [Repository(name="a/b")],
+        since=datetime(2022, 8, 1),
+        now=datetime(2022, 8, 11),
+        gh=None,
+        events=["https://indico.example.com/event/1"],
+    )
+    assert data == {}
+    assert contributions == [{"title": "Tracking"}]
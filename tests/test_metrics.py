@@ -0,0 +1,148 @@
+from datetime import datetime, timezone
+import json
+
+import aiohttp
+import pytest
+from rich.console import Console
+
+from fake_github import FakeGitHub, FakeRepo
+import mtng.cache
+from mtng import metrics
+from mtng.cache import ConditionalCache
+from mtng.collect import collect_report
+from mtng.generate import generate_latex
+from mtng.github import GitHubClient
+from mtng.spec import Repository, Spec
+
+SINCE = datetime(2022, 8, 1, tzinfo=timezone.utc)
+NOW = datetime(2022, 8, 15, tzinfo=timezone.utc)
+
+
+def test_phase():
+    m = metrics.Metrics()
+    for _ in range(2):
+        with m.phase("render"):
+            pass
+    with pytest.raises(ValueError):
+        with m.phase("compile"):
+            raise ValueError()
+
+    assert m.phases["render"].calls == 2
+    assert m.phases["compile"].calls == 1
+    assert m.phases["render"].wall_time >= 0
+
+
+def test_to_dict():
+    m = metrics.Metrics()
+    m.request("pull", 200, 0.5, bytes_received=100)
+    m.request("pull", 304, 0.1, conditional=True)
+    m.request("search", 403, 0.1, retry=True)
+    m.rate_limit("core", 5000, 4999)
+    m.rate_limit("core", 5000, 4999, counted=False)
+    m.memo_lookup(hit=True)
+
+    d = json.loads(json.dumps(m.to_dict()))
+    assert d["version"] == metrics.METRICS_VERSION
+    assert d["endpoints"]["pull"] == {
+        "requests": 2,
+        "conditional": 1,
+        "not_modified": 1,
+        "retries": 0,
+        "errors": 0,
+        "bytes_sent": 0,
+        "bytes_received": 100,
+        "wall_time": pytest.approx(0.6),
+    }
+    assert d["endpoints"]["search"]["errors"] == 1
+    assert d["endpoints"]["search"]["retries"] == 1
+    assert d["rate_limits"]["core"] == {"limit": 5000, "remaining": 4999, "used": 1}
+    assert d["memo"] == {"hits": 1, "misses": 0}
+
+    console = Console(width=200, record=True)
+    for table in m.tables():
+        console.print(table)
+    text = console.export_text()
+    assert "1 (100%)" in text
+    assert "4999" in text
+
+
+def test_tables():
+    m = metrics.Metrics()
+    m.request("pull", 304, 0.1, conditional=True)
+    for hit in (True, True, False):
+        m.memo_lookup(hit=hit)
+
+    def rows(table):
+        """Header and body rows of a rendered table, as lists of cells."""
+        console = Console(width=200, record=True)
+        console.print(table)
+        return [
+            [cell.strip() for cell in line.strip("┃│").split(line[0])]
+            for line in console.export_text().splitlines()
+            if line.startswith(("┃", "│"))
+        ]
+
+    tables = {table.title: table for table in m.tables()}
+    header, *body = rows(tables["Requests"])
+    assert body == [["pull", "1", "1", "1 (100%)", "0", "0", "0 B", "0.100s"]]
+
+    assert rows(tables["Memoized results"]) == [
+        ["Lookups", "Hits", "Misses"],
+        ["3", "2 (67%)", "1"],
+    ]
+
+
+@pytest.mark.asyncio
+async def test_collection_is_instrumented():
+    repo = FakeRepo(name="metrics/repo", size=20)
+    server = FakeGitHub([repo])
+    runner = await server.start()
+    spec = Spec(
+        repos=[
+            Repository(
+                name=repo.name, stale_label=repo.stale_label, wip_label=repo.wip_label
+            )
+        ]
+    )
+
+    async def collect():
+        async with aiohttp.ClientSession() as session:
+            gh = GitHubClient(
+                session, "mtng-test", base_url=server.url, cache=ConditionalCache()
+            )
+            data, _ = await collect_report(
+                spec.repos, since=SINCE, now=NOW, gh=gh, session=session
+            )
+            return data
+
+    try:
+        data = await collect()
+        m = metrics.current()
+        endpoints = {k: v.requests for k, v in m.endpoints.items()}
+        assert endpoints == dict(server.requests)
+        assert all(e.conditional == 0 for e in m.endpoints.values())
+        assert m.endpoints["pull"].bytes_received > 0
+        assert m.rate_limits["core"].used == (
+            server.requests["pull"] + server.requests["reviews"]
+        )
+        assert m.rate_limits["search"].remaining == 5000 - server.requests["search"]
+        assert m.memo["misses"] > 0
+        assert m.memo["hits"] == 0
+        assert {"collect", "collect.github", "collect.indico"} <= set(m.phases)
+
+        # only the validators of conditional requests survive
+        for key in list(mtng.cache.get_cache().iterkeys()):
+            if not key.startswith(ConditionalCache.prefix):
+                del mtng.cache.get_cache()[key]
+        m = metrics.reset()
+        await collect()
+    finally:
+        await runner.cleanup()
+
+    assert all(e.conditional == e.requests for e in m.endpoints.values())
+    assert all(e.not_modified == e.requests for e in m.endpoints.values())
+    # 304 Not Modified does not count against the rate limit
+    assert all(r.used == 0 for r in m.rate_limits.values())
+
+    generate_latex(spec, data, since=SINCE, now=NOW, contributions=[], full_tex=True)
+    assert m.phases["render"].calls == 1
@@ -0,0 +1,86 @@
+import os
+from pathlib import Path
+import stat
+import sys
+
+import pytest
+
+from mtng.pdf import compile_files, compile_pdf, workspace, write_if_changed
+
+FAKE_LATEXMK = """#!{python}
+import sys
+from pathlib import Path
+
+out = Path(next(a for a in sys.argv if a.startswith("-output-directory="))
+           .split("=", 1)[1])
+source = Path(sys.argv[-1])
+with (out / "runs.log").open("a") as fh:
+    fh.write(source.name + "\\n")
+(out / (source.stem + ".pdf")).write_text("PDF " + source.read_text())
+"""
+
+
+@pytest.fixture
+def latexmk(tmp_path) -> Path:
+    path = tmp_path / "latexmk"
+    path.write_text(FAKE_LATEXMK.format(python=sys.executable))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return path
+
+
+def test_workspace_per_key(tmp_path):
+    a = workspace(tmp_path, "acts", "repos: [a]")
+    assert a == workspace(tmp_path, "acts", "repos: [a]")
+    assert a != workspace(tmp_path, "acts", "repos: [b]")
+    assert a.parent == tmp_path
+    assert a.name.startswith("acts-")
+
+
+def test_write_if_changed(tmp_path):
+    path = tmp_path / "source.tex"
+    assert write_if_changed(path, "a")
+    os.utime(path, (0, 0))
+    assert not write_if_changed(path, "a")
+    assert path.stat().st_mtime == 0
+    assert write_if_changed(path, "b")
+    assert path.read_text() == "b"
+
+
+def test_compile_pdf_build_dir(tmp_path, latexmk):
+    build_dir = tmp_path / "build"
+    pdf = tmp_path / "out.pdf"
+
+    compile_pdf("doc 1", pdf, build_dir=build_dir, latexmk=latexmk, lualatex=False)
+    assert pdf.read_text() == "PDF doc 1"
+    source = build_dir / "source.tex"
+    os.utime(source, (0, 0))
+
+    # unchanged source is left alone, so latexmk can skip the rebuild
+    compile_pdf("doc 1", pdf, build_dir=build_dir, latexmk=latexmk, lualatex=False)
+    assert source.stat().st_mtime == 0
+
+    compile_pdf("doc 2", pdf, build_dir=build_dir, latexmk=latexmk, lualatex=False)
+    assert pdf.read_text() == "PDF doc 2"
+    assert (build_dir / "runs.log").read_text().split() == ["source.tex"] * 3
+
+
+def test_compile_pdf_temporary(tmp_path, latexmk):
+    pdf = tmp_path / "out.pdf"
+    compile_pdf("doc", pdf, latexmk=latexmk, lualatex=False)
+    assert pdf.read_text() == "PDF doc"
+    assert set(tmp_path.iterdir()) == {latexmk, pdf}
+
+
+def test_compile_files(tmp_path, latexmk):
+    files = []
+    for i in range(4):
+        tex = tmp_path / f"report{i}.tex"
+        tex.write_text(f"report {i}")
+        files.append((tex, tex.with_suffix(".pdf")))
+
+    pdfs = compile_files(files, build_root=tmp_path / "build", jobs=2, latexmk=latexmk)
+
+    assert pdfs == [pdf for _, pdf in files]
+    for i, pdf in enumerate(pdfs):
+        assert pdf.read_text() == f"PDF report {i}"
+    assert len(list((tmp_path / "build").iterdir())) == 4
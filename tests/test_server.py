@@ -0,0 +1,151 @@
+import datetime
+import gc
+
+import aiohttp
+from aiohttp.test_utils import TestClient, TestServer
+import pytest
+import pytest_asyncio
+from typer.testing import CliRunner
+
+from fake_github import FakeGitHub, FakeRepo
+from mtng.cache import ConditionalCache
+from mtng.cli import cli
+from mtng.github import GitHubClient
+from mtng.server import ReportServer
+from mtng.spec import Backend, Repository, Spec
+
+
+@pytest_asyncio.fixture
+async def report_server():
+    repo = FakeRepo(name="serve/repo", size=20)
+    github = FakeGitHub([repo])
+    runner = await github.start()
+    spec = Spec(
+        repos=[
+            Repository(
+                name=repo.name, stale_label=repo.stale_label, wip_label=repo.wip_label
+            )
+        ]
+    )
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            cache = ConditionalCache()
+            gh = GitHubClient(session, "mtng-test", base_url=github.url, cache=cache)
+            server = ReportServer(spec, gh, session=session, cache=cache)
+            client = TestClient(TestServer(server.app(background_refresh=False)))
+            await client.start_server()
+            try:
+                yield github, server, client
+            finally:
+                await client.close()
+    finally:
+        await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_report_is_served_warm(report_server):
+    github, server, client = report_server
+
+    response = await client.get("/report.tex", params={"since": "2022-08-01"})
+    assert response.status == 200
+    latex = await response.text()
+    assert "serve/repo" in latex
+    assert "\\documentclass" not in latex
+    searches = github.requests["search"]
+    assert searches > 0
+
+    response = await client.get(
+        "/report.tex", params={"since": "2022-08-01", "full": "1"}
+    )
+    assert "\\documentclass" in await response.text()
+    # answered from memory
+    assert github.requests["search"] == searches
+    assert list(server.collections) == [datetime.date(2022, 8, 1)]
+
+
+@pytest.mark.asyncio
+async def test_refresh(report_server):
+    github, server, client = report_server
+
+    await client.get("/report.tex", params={"since": "2022-08-01"})
+    collected = server.collections[datetime.date(2022, 8, 1)].now
+    searches = github.requests["search"]
+
+    response = await client.post("/refresh")
+    assert response.status == 200
+    status = await response.json()
+    assert list(status["windows"]) == ["2022-08-01"]
+    assert github.requests["search"] == 2 * searches
+    assert server.collections[datetime.date(2022, 8, 1)].now > collected
+
+
+@pytest.mark.asyncio
+async def test_status_and_errors(report_server):
+    github, server, client = report_server
+
+    response = await client.get("/status")
+    status = await response.json()
+    assert status["repos"] == ["serve/repo"]
+    assert status["windows"] == {}
+
+    response = await client.get("/report.tex", params={"since": "yesterday"})
+    assert response.status == 400
+    assert github.requests.get("search", 0) == 0
+
+
+@pytest.mark.asyncio
+async def test_pdf_compile_locks_are_released(report_server, monkeypatch):
+    github, server, client = report_server
+
+    def compile_pdf(latex, pdf, **kwargs):
+        pdf.parent.mkdir(parents=True, exist_ok=True)
+        pdf.write_bytes(b"%PDF")
+
+    monkeypatch.setattr("mtng.server.find_latexmk", lambda: "latexmk")
+    monkeypatch.setattr("mtng.server.compile_pdf", compile_pdf)
+
+    for since in ("2022-08-01", "2022-08-02"):
+        response = await client.get("/report.pdf", params={"since": since})
+        assert response.status == 200
+        assert await response.read() == b"%PDF"
+
+    gc.collect()
+    assert len(server._compile_locks) == 0
+
+
+def test_serve_options(tmp_path, monkeypatch):
+    specs = []
+
+    class Stop(Exception):
+        pass
+
+    def server(spec, *args, **kwargs):
+        specs.append(spec)
+        raise Stop()
+
+    monkeypatch.setattr("mtng.server.ReportServer", server)
+    config = tmp_path / "spec.yml"
+    config.write_text("repos: []\n")
+
+    result = CliRunner().invoke(
+        cli,
+        [
+            "serve",
+            str(config),
+            "--token",
+            "token",
+            "--backend",
+            "graphql",
+            "--proxy",
+            "http://proxy.example.com:3128",
+            "--read-timeout",
+            "5",
+        ],
+    )
+    assert isinstance(result.exception, Stop)
+
+    (spec,) = specs
+    assert spec.backend == Backend.graphql
+    assert spec.http.proxy == "http://proxy.example.com:3128"
+    assert spec.http.read_timeout == 5
@@ -0,0 +1,208 @@
+from datetime import datetime
+import json
+
+import aiohttp
+from dateutil.tz import tzlocal
+import pydantic
+import pytest
+import pytest_asyncio
+from typer.testing import CliRunner
+
+from fake_github import FakeGitHub, FakeRepo
+from mtng.cache import ConditionalCache
+from mtng.cli import cli, load_spec
+from mtng.collect import collect_report
+from mtng.generate import generate_latex
+from mtng.github import GitHubClient
+from mtng.snapshot import REPORT_VERSION, ReportSnapshot
+from mtng.spec import Repository, Spec
+
+SINCE = datetime(2022, 8, 1, tzinfo=tzlocal())
+NOW = datetime(2022, 8, 15, tzinfo=tzlocal())
+
+
+@pytest_asyncio.fixture
+async def report():
+    repo = FakeRepo(name="snapshot/repo", size=40)
+    server = FakeGitHub([repo])
+    runner = await server.start()
+    spec = Spec(
+        repos=[
+            Repository(
+                name=repo.name,
+                stale_label=repo.stale_label,
+                wip_label=repo.wip_label,
+                do_recent_issues=True,
+                do_reviewers=True,
+            )
+        ]
+    )
+    try:
+        async with aiohttp.ClientSession() as session:
+            gh = GitHubClient(
+                session, "mtng-test", base_url=server.url, cache=ConditionalCache()
+            )
+            data, _ = await collect_report(spec.repos, since=SINCE, now=NOW, gh=gh)
+    finally:
+        await runner.cleanup()
+
+    contributions = [
+        {
+            "title": "Status report",
+            "speakers": ["Some One"],
+            "start_date": datetime(2022, 8, 15, 9, 30),
+            "url": "https://indico.example.com/event/1/contributions/2",
+        }
+    ]
+    return ReportSnapshot(spec, SINCE, NOW, data, contributions)
+
+
+@pytest.mark.asyncio
+async def test_round_trip(report, tmp_path):
+    path = tmp_path / "report.json"
+    report.save(path)
+    loaded = ReportSnapshot.load(path)
+
+    assert loaded.spec == report.spec
+    assert loaded.since == SINCE
+    assert loaded.now == NOW
+    assert loaded.contributions == report.contributions
+    repo = loaded.data["snapshot/repo"]
+    assert repo["spec"] == report.spec.repos[0]
+    assert len(repo["merged_prs"]) > 0
+    assert len(repo["stale"]) > 0
+    # items in several sections are still the same object
+    stale = {item.number: item for item in repo["stale"]}
+    assert any(stale.get(pr.number) is pr for pr in repo["open_prs"])
+
+    def latex(r):
+        return generate_latex(
+            r.spec,
+            r.data,
+            since=r.since,
+            now=r.now,
+            contributions=r.contributions,
+            full_tex=True,
+        )
+
+    assert latex(loaded) == latex(report)
+
+
+@pytest.mark.asyncio
+async def test_render_command(report, tmp_path):
+    path = tmp_path / "report.json"
+    report.save(path)
+    tex = tmp_path / "report.tex"
+
+    result = CliRunner().invoke(cli, ["render", str(path), "--full", "--tex", str(tex)])
+    assert result.exit_code == 0, result.output
+    assert tex.read_text() == generate_latex(
+        report.spec,
+        report.data,
+        since=SINCE,
+        now=NOW,
+        contributions=report.contributions,
+        full_tex=True,
+    )
+
+
+def test_version_mismatch(tmp_path):
+    path = tmp_path / "report.json"
+    path.write_text(json.dumps({"version": REPORT_VERSION + 1}))
+    with pytest.raises(ValueError, match="Collect the report again"):
+        ReportSnapshot.load(path)
+
+
+def test_collect_http_options(tmp_path, monkeypatch):
+    specs = []
+
+    async def collect_data(spec, *args, **kwargs):
+        specs.append(spec)
+        return {}, []
+
+    monkeypatch.setattr("mtng.cli.collect_data", collect_data)
+    config = tmp_path / "spec.yml"
+    config.write_text("repos: []\nhttp:\n  connect_timeout: 3\n")
+
+    result = CliRunner().invoke(
+        cli,
+        [
+            "collect",
+            str(config),
+            "--output",
+            str(tmp_path / "report.json"),
+            "--token",
+            "token",
+            "--since",
+            "2022-08-01",
+            "--proxy",
+            "http://proxy.example.com:3128",
+            "--read-timeout",
+            "5",
+            "--connection-limit-per-host",
+            "2",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    (spec,) = specs
+    assert spec.http.proxy == "http://proxy.example.com:3128"
+    assert spec.http.connect_timeout == 3
+    assert spec.http.read_timeout == 5
+    assert spec.http.connection_limit_per_host == 2
+
+
+def test_http_overrides_are_validated(tmp_path):
+    with pytest.raises(pydantic.ValidationError):
+        load_spec("repos: []", read_timeout=0)
+    with pytest.raises(pydantic.ValidationError):
+        load_spec("repos: []", connection_limit_per_host=-1)
+
+    config = tmp_path / "spec.yml"
+    config.write_text("repos: []\n")
+    result = CliRunner().invoke(
+        cli,
+        [
+            "collect",
+            str(config),
+            "--output",
+            str(tmp_path / "report.json"),
+            "--token",
+            "token",
+            "--since",
+            "2022-08-01",
+            "--connect-timeout",
+            "0",
+        ],
+    )
+    assert result.exit_code == 2
+    assert "must be greater than 0" in result.output
+
+
+def test_shared_options():
+    import typer.main
+
+    commands = typer.main.get_command(cli).commands
+
+    def options(name):
+        return {p.name: p.help for p in commands[name].params}
+
+    shared = [
+        "token",
+        "events",
+        "concurrency",
+        "backend",
+        "incremental",
+        "profile",
+        "metrics_out",
+        "proxy",
+        "connect_timeout",
+        "read_timeout",
+        "connection_limit_per_host",
+    ]
+    generate = options("generate")
+    for name in "collect", "batch":
+        assert {k: options(name)[k] for k in shared} == {k: generate[k] for k in shared}
+    # serves metrics over HTTP, and is incremental by default
+    served = [k for k in shared if k not in ("profile", "metrics_out", "incremental")]
+    assert {k: options("serve")[k] for k in served} == {k: generate[k] for k in served}
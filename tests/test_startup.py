@@ -0,0 +1,62 @@
+import subprocess
+import sys
+
+import pytest
+
+# Modules the lightweight commands must not import
+HEAVY = [
+    "aiohttp",
+    "gidgethub",
+    "pydantic",
+    "diskcache",
+    "appdirs",
+    "jinja2",
+    "yaml",
+    "dotenv",
+    "rich.progress",
+    "mtng.collect",
+    "mtng.generate",
+]
+
+# Generous limit for the cumulative import time of mtng.cli, in microseconds
+IMPORT_TIME_LIMIT = 500_000
+
+
+def importtime(*args: str):
+    """Run mtng with -X importtime, returns the import times by module."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "from mtng.cli import cli; cli()"]
+        + list(args),
+        capture_output=True,
+        text=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+    return result, times
+
+
+@pytest.mark.parametrize(
+    "args", [["--help"], ["preamble"], ["cache", "--help"], ["generate", "--help"]]
+)
+def test_lightweight_commands(args):
+    result, times = importtime(*args)
+    assert result.returncode == 0, result.stderr[-2000:]
+
+    assert "mtng.cli" in times
+    assert [m for m in HEAVY if m in times] == []
+    assert times["mtng.cli"] < IMPORT_TIME_LIMIT
+
+
+def test_version_is_read_lazily():
+    # --help renders with pygments, which reads package metadata itself
+    result, times = importtime("preamble")
+    assert result.returncode == 0, result.stderr[-2000:]
+    assert "importlib.metadata" not in times
+
+    result, _ = importtime("--version")
+    assert result.returncode == 0, result.stderr[-2000:]
+    assert result.stdout.startswith("mtng ")